@@ -10,17 +10,23 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
 # Custom paths for organized structure
-DATA_DIR = BASE_DIR / 'data'
-RAW_DATA_DIR = DATA_DIR / 'raw'
-PROCESSED_DATA_DIR = DATA_DIR / 'processed'
-EXPORTS_DATA_DIR = DATA_DIR / 'exports'
-TEMP_DATA_DIR = DATA_DIR / 'temp'
+# Cada diretório pode ser apontado para outro volume via variável de ambiente
+# (ver utils/data_processing/data_sources.py, usado por todos os loaders)
+DATA_DIR = Path(os.environ.get('ALAGAMENTOS_DATA_DIR', BASE_DIR / 'data'))
+RAW_DATA_DIR = Path(os.environ.get('ALAGAMENTOS_RAW_DIR', DATA_DIR / 'raw'))
+PROCESSED_DATA_DIR = Path(os.environ.get('ALAGAMENTOS_PROCESSED_DIR', DATA_DIR / 'processed'))
+EXPORTS_DATA_DIR = Path(os.environ.get('ALAGAMENTOS_EXPORTS_DIR', DATA_DIR / 'exports'))
+TEMP_DATA_DIR = Path(os.environ.get('ALAGAMENTOS_TEMP_DIR', DATA_DIR / 'temp'))
+MODELS_DATA_DIR = Path(os.environ.get('ALAGAMENTOS_MODELS_DIR', DATA_DIR / 'models'))
+# Arquivos INMET (CSV, .gz ou .zip), lidos sem extração
+INMET_DATA_DIR = Path(os.environ.get('ALAGAMENTOS_INMET_DIR', RAW_DATA_DIR / 'inmet'))
 
 
 # Quick-start development settings - unsuitable for production
@@ -50,6 +56,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'dashboard.instrumentacao.InstrumentacaoMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -141,3 +148,95 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Authentication URLs
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
+
+# Instrumentação de requisições (dashboard.instrumentacao)
+INSTRUMENTACAO_ATIVA = True
+INSTRUMENTACAO_JANELA = 500  # Amostras por view para os percentis
+INSTRUMENTACAO_LIMIAR_N_MAIS_1 = 5  # Repetições do mesmo SQL para sinalizar N+1
+INSTRUMENTACAO_LIMIAR_LENTO_MS = 500  # Requisições acima disso são logadas como WARNING
+
+# Motor de alertas por área (dashboard.alertas)
+ALERTAS_AVALIAR_AO_SALVAR = True  # Avaliar o bairro após o commit de cada relato
+ALERTAS_JANELA_HORAS = 3  # Janela deslizante de relatos ativos por bairro
+ALERTAS_MIN_RELATOS = 3  # Relatos na janela para abrir (ou manter) um alerta
+ALERTAS_RELATOS_ESCALADA = 10  # A partir disso o nível sobe um degrau
+ALERTAS_RAIO_MINIMO_METROS = 500
+
+# Agrupamento de relatos em eventos de alagamento (dashboard.eventos)
+EVENTOS_AGRUPAR_AO_SALVAR = True  # Agrupar os pendentes após o commit de cada relato novo
+EVENTOS_RAIO_METROS = 300  # Distância máxima entre relatos vizinhos
+EVENTOS_JANELA_HORAS = 2  # Intervalo máximo entre relatos vizinhos
+EVENTOS_MIN_RELATOS = 2  # Relatos (núcleo + vizinhos) para formar um evento
+EVENTOS_HORAS_PENDENTES = 24  # Quanto olhar para trás em busca de relatos sem evento
+
+# Contador de visualizações com gravação em lote (dashboard.visualizacoes)
+VISUALIZACOES_WRITE_BEHIND = True
+VISUALIZACOES_INTERVALO_S = 5  # Intervalo entre descargas para o banco
+
+# Catálogo de bairros em memória (dashboard.catalogo)
+CATALOGO_BAIRROS_TTL_S = 300  # Recarga periódica para edições feitas em outros processos
+
+# Bairro a partir de coordenadas (dashboard.localizacao)
+BAIRROS_LIMITES_GEOJSON = None  # GeoJSON de limites; None = data/raw/bairros_limites.geojson, se existir
+BAIRROS_DISTANCIA_MAXIMA_METROS = 5000  # Além disso do centroide mais próximo o ponto fica sem bairro
+BAIRROS_CANDIDATOS = 3  # Centroides mais próximos considerados (polígonos e validação do formulário)
+
+# Deduplicação de relatos na submissão (dashboard.deduplicacao)
+DEDUP_ATIVO = True
+DEDUP_RAIO_METROS = 100  # Distância máxima até um relato ativo para mesclar
+DEDUP_JANELA_MINUTOS = 60  # Intervalo máximo entre os dois relatos
+DEDUP_DIFERENCA_SEVERIDADE = 1  # Níveis de diferença tolerados (mais que isso é situação nova)
+
+# Detecção de spam por texto com MinHash/LSH (dashboard.spam)
+SPAM_VERIFICAR_AO_SALVAR = True  # Verificar textos novos após o commit de cada relato/interação
+SPAM_JANELA_HORAS = 24  # Textos comparados entre si
+SPAM_LIMIAR_SIMILARIDADE = 0.7  # Jaccard estimado para considerar quase-duplicata
+SPAM_MIN_COPIAS = 5  # Textos quase iguais na janela para caracterizar campanha
+SPAM_MIN_CARACTERES = 60  # Textos mais curtos não são avaliados (frases comuns se repetem)
+
+# Ingestão de relatos em lote com group commit (dashboard.ingestao)
+INGESTAO_FILA_ATIVA = True  # False = cada relato gravado na própria requisição
+INGESTAO_DURAVEL = True  # Responder só após o commit do lote do relato
+INGESTAO_LOTE_MAXIMO = 100  # Relatos por transação
+INGESTAO_ESPERA_MS = 5  # Espera por mais relatos antes de gravar um lote incompleto
+INGESTAO_FILA_MAXIMA = 1000  # Contrapressão: relatos aguardando gravação
+INGESTAO_ESPERA_FILA_S = 0.5  # Espera por espaço na fila antes de responder 503
+INGESTAO_TIMEOUT_S = 10  # Espera máxima pelo commit no modo durável
+
+# Sincronização em lote de clientes offline (dashboard.sincronizacao)
+SYNC_MAX_ITENS = 200  # Relatos + confirmações por requisição
+SYNC_ATRASO_MAXIMO_HORAS = 72  # Relatos mais antigos que isso (no relógio do aparelho) são recusados
+
+# Pipeline de fotos dos relatos (dashboard.fotos)
+FILE_UPLOAD_HANDLERS = ['dashboard.fotos.UploadComHash']  # Upload direto em disco, com SHA-256 calculado no recebimento
+FOTOS_PROCESSAR_AO_SALVAR = True  # Gerar as variantes no pool após o commit do relato
+FOTOS_WORKERS = 2  # Threads que geram variantes
+FOTOS_PENDENTES_DIR = None  # Originais aguardando processamento; None = data/temp/fotos_pendentes
+FOTOS_LADO_MAXIMO = 2048  # Lado maior da foto servida (px)
+FOTOS_LADO_PREVIA = 800  # Página do relato
+FOTOS_LADO_MINIATURA = 200  # Listas e mapa
+
+# Buffer em memória de relatos recentes (dashboard.recentes)
+RECENTES_JANELA_HORAS = 48  # Relatos ativos mantidos (ao menos 24: gráfico por hora da home)
+RECENTES_CAPACIDADE = 50_000  # Posições do anel (~37 bytes cada)
+RECENTES_SINCRONIZAR_S = 5  # Leitura do log de alterações (mudanças feitas em outros processos)
+
+# Log de alterações de relatórios e interações (dashboard.alteracoes)
+ALTERACOES_ESPERA_LACUNA_S = 5  # Espera mínima (desde que a lacuna foi vista) antes de pulá-la
+ALTERACOES_RETENCAO_DIAS = 30  # Eventos lidos por todos os consumidores são podados depois disso
+
+# Fila de tarefas em segundo plano no banco (dashboard.tarefas, manage.py run_worker)
+TAREFAS_FILA_ATIVA = False  # True = alertas, eventos, spam e fotos vão para a fila (exige run_worker)
+TAREFAS_THREADS = 4  # Pool padrão do run_worker (--processos usa processos)
+TAREFAS_INTERVALO_S = 1  # Espera do trabalhador ocioso antes de procurar tarefas
+TAREFAS_MAX_TENTATIVAS = 5
+TAREFAS_ESPERA_BASE_S = 5  # Retentativa n espera base * 2^(n-1) segundos (±20%)
+TAREFAS_ESPERA_MAXIMA_S = 3600
+TAREFAS_TIMEOUT_S = 300  # Em execução há mais que isso = trabalhador perdido; tarefa volta para a fila
+TAREFAS_MANUTENCAO_S = 30  # Recuperação de travadas, periódicas e poda
+TAREFAS_RETENCAO_DIAS = 7  # Tarefas concluídas mantidas para métricas
+TAREFAS_PERIODICAS = {  # Nome -> intervalo em segundos
+    'atualizar_urgencia': 60,
+    'encerrar_eventos': 300,
+    'podar_alteracoes': 3600,
+}
@@ -23,6 +23,11 @@ LOGGING = {
             'class': 'logging.FileHandler',
             'filename': BASE_DIR / 'logs' / 'debug.log',
         },
+        'performance': {
+            'level': 'INFO',
+            'class': 'logging.FileHandler',
+            'filename': BASE_DIR / 'logs' / 'performance.log',
+        },
     },
     'loggers': {
         'django': {
@@ -30,5 +35,10 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        'dashboard.performance': {
+            'handlers': ['performance'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
\ No newline at end of file
@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Bairro
+
+
+# Edições aqui invalidam o catálogo de bairros em memória (dashboard.signals)
+@admin.register(Bairro)
+class BairroAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'cidade', 'uf', 'zona', 'risco_base')
+    list_filter = ('cidade', 'uf', 'zona')
+    search_fields = ('nome', 'cidade')
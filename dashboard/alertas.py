@@ -0,0 +1,227 @@
+"""
+Motor de Alertas por Área
+=========================
+
+Cria, escala e desativa ``AlertaArea`` a partir de estatísticas de janela
+deslizante por bairro (relatos ativos nas últimas ``ALERTAS_JANELA_HORAS``).
+
+A avaliação é incremental: recebe apenas os bairros alterados e, para todos
+eles juntos, faz uma query agregada (contagem, severidade média e extensão
+geográfica), uma leitura dos alertas ativos e inserções/atualizações em
+lote, incluindo os vínculos ``relatos_origem`` (tabela M2M com
+``bulk_create(ignore_conflicts=True)``). O custo depende do número de
+bairros alterados, não do total de relatos.
+
+Avaliações concorrentes do mesmo bairro (requisições, escritor da
+ingestão, trabalhadores da fila) são serializadas: a leitura e a escrita
+acontecem na mesma transação, depois de travar as linhas dos bairros
+(``SELECT ... FOR UPDATE``, em ordem de id; no SQLite, sem trava de
+linha, por uma trava do processo). A restrição ``alerta_ativo_por_bairro``
+garante no banco um alerta ativo por bairro: se ainda assim outra
+avaliação criar o alerta primeiro, esta é refeita e atualiza esse alerta.
+
+Gatilhos:
+
+- ``dashboard.signals`` marca o bairro a cada relato salvo/removido e avalia
+  após o commit (coalescendo vários relatos da mesma transação), ou
+  enfileira a tarefa ``avaliar_alertas`` com ``TAREFAS_FILA_ATIVA``;
+- o comando ``avaliar_alertas`` roda em intervalo curto para cargas em lote
+  (que não disparam sinais) e para desativar alertas cuja janela expirou.
+"""
+
+import math
+import threading
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Avg, Count, Max, Min
+from django.utils import timezone
+
+from . import tarefas
+from .models import AlertaArea, Bairro, RelatorioAlagamento
+
+METROS_POR_GRAU = 111_320
+
+_local = threading.local()
+_trava_sqlite = threading.Lock()
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def _trava_escrita():
+    return _trava_sqlite if connection.vendor == 'sqlite' else nullcontext()
+
+
+def janela():
+    return timedelta(hours=_config('ALERTAS_JANELA_HORAS', 3))
+
+
+def calcular_nivel(total, severidade_media):
+    """Nível do alerta (1-4): severidade média arredondada, +1 com muitos relatos"""
+    nivel = round(severidade_media)
+    if total >= _config('ALERTAS_RELATOS_ESCALADA', 10):
+        nivel += 1
+    return max(1, min(4, nivel))
+
+
+def calcular_raio(lat_min, lat_max, lon_min, lon_max):
+    """Raio afetado (m): meia diagonal da caixa que contém os relatos, com piso"""
+    lat_media = math.radians((float(lat_min) + float(lat_max)) / 2)
+    dy = (float(lat_max) - float(lat_min)) * METROS_POR_GRAU
+    dx = (float(lon_max) - float(lon_min)) * METROS_POR_GRAU * math.cos(lat_media)
+    return max(_config('ALERTAS_RAIO_MINIMO_METROS', 500), int(math.hypot(dx, dy) / 2))
+
+
+def estatisticas_janela(bairro_ids, agora=None):
+    """{bairro_id: agregados} dos relatos ativos na janela, em uma query"""
+    agora = agora or timezone.now()
+    linhas = (
+        RelatorioAlagamento.objects
+        .filter(bairro_id__in=bairro_ids, status='ativo', timestamp__range=(agora - janela(), agora))
+        .values('bairro_id')
+        .annotate(
+            total=Count('id'),
+            severidade_media=Avg('nivel_severidade'),
+            lat_min=Min('latitude'), lat_max=Max('latitude'),
+            lon_min=Min('longitude'), lon_max=Max('longitude'),
+        )
+        .order_by()
+    )
+    return {linha['bairro_id']: linha for linha in linhas}
+
+
+def avaliar_bairros(bairro_ids, agora=None):
+    """
+    Reavalia os alertas dos bairros informados.
+
+    Retorna contagens de alertas criados, atualizados (escalados ou
+    reduzidos), desativados e de relatos da janela vinculados aos alertas
+    vigentes (vínculos já existentes são ignorados pelo banco).
+    """
+    bairro_ids = set(bairro_ids)
+    if not bairro_ids:
+        return {'criados': 0, 'atualizados': 0, 'desativados': 0, 'vinculos': 0}
+    agora = agora or timezone.now()
+    try:
+        return _avaliar(bairro_ids, agora)
+    except IntegrityError:
+        # Outra avaliação criou o alerta do bairro no meio tempo: relê e atualiza esse
+        return _avaliar(bairro_ids, agora)
+
+
+def _avaliar(bairro_ids, agora):
+    resultado = {'criados': 0, 'atualizados': 0, 'desativados': 0, 'vinculos': 0}
+    minimo = _config('ALERTAS_MIN_RELATOS', 3)
+    campos = ['nivel_alerta', 'total_relatos_ativos', 'severidade_media',
+              'raio_afetado_metros', 'ativo', 'timestamp_atualizacao']
+
+    with _trava_escrita(), transaction.atomic():
+        # Avaliações do mesmo bairro esperam a vez; ordem fixa evita deadlock
+        list(Bairro.objects.select_for_update().filter(pk__in=bairro_ids).order_by('pk').values_list('pk'))
+        estatisticas = estatisticas_janela(bairro_ids, agora)
+        ativos = {
+            alerta.bairro_id: alerta
+            for alerta in AlertaArea.objects.filter(bairro_id__in=bairro_ids, ativo=True)
+        }
+
+        novos, alterados, desativados = [], [], []
+        for bairro_id in bairro_ids:
+            stats = estatisticas.get(bairro_id)
+            alerta = ativos.get(bairro_id)
+
+            if stats is None or stats['total'] < minimo:
+                if alerta:
+                    alerta.ativo = False
+                    alerta.timestamp_atualizacao = agora
+                    desativados.append(alerta)
+                continue
+
+            valores = {
+                'nivel_alerta': calcular_nivel(stats['total'], stats['severidade_media']),
+                'total_relatos_ativos': stats['total'],
+                'severidade_media': round(stats['severidade_media'], 2),
+                'raio_afetado_metros': calcular_raio(
+                    stats['lat_min'], stats['lat_max'], stats['lon_min'], stats['lon_max']
+                ),
+            }
+            if alerta is None:
+                novos.append(AlertaArea(bairro_id=bairro_id, **valores))
+            elif any(getattr(alerta, campo) != valor for campo, valor in valores.items()):
+                for campo, valor in valores.items():
+                    setattr(alerta, campo, valor)
+                alerta.timestamp_atualizacao = agora
+                alterados.append(alerta)
+
+        if novos:
+            AlertaArea.objects.bulk_create(novos)
+        if alterados or desativados:
+            AlertaArea.objects.bulk_update(alterados + desativados, campos)
+        vigentes = novos + [alerta for alerta in ativos.values() if alerta.ativo]
+        resultado['vinculos'] = _vincular_origem(vigentes, agora)
+
+    resultado.update(criados=len(novos), atualizados=len(alterados), desativados=len(desativados))
+    return resultado
+
+
+def _vincular_origem(alertas, agora):
+    """Liga os relatos da janela aos alertas ativos com um INSERT em lote na tabela M2M"""
+    if not alertas:
+        return 0
+    por_bairro = {alerta.bairro_id: alerta.pk for alerta in alertas}
+    relatos = (
+        RelatorioAlagamento.objects
+        .filter(bairro_id__in=por_bairro, status='ativo', timestamp__range=(agora - janela(), agora))
+        .values_list('bairro_id', 'id')
+        .order_by()
+    )
+    Vinculo = AlertaArea.relatos_origem.through
+    vinculos = [
+        Vinculo(alertaarea_id=por_bairro[bairro_id], relatorioalagamento_id=relato_id)
+        for bairro_id, relato_id in relatos
+    ]
+    # Vínculos já existentes são ignorados pela restrição única da tabela M2M
+    Vinculo.objects.bulk_create(vinculos, ignore_conflicts=True, batch_size=1000)
+    return len(vinculos)
+
+
+def bairros_alterados(desde, agora=None):
+    """Bairros com relatos desde ``desde`` mais os que têm alerta ativo (janela pode ter expirado)"""
+    agora = agora or timezone.now()
+    com_relatos = (
+        RelatorioAlagamento.objects
+        .filter(timestamp__range=(desde, agora))
+        .values_list('bairro_id', flat=True)
+        .order_by()
+        .distinct()
+    )
+    com_alerta = AlertaArea.objects.filter(ativo=True).values_list('bairro_id', flat=True)
+    return set(com_relatos) | set(com_alerta)
+
+
+def marcar_bairro(bairro_id):
+    """
+    Agenda a avaliação do bairro para depois do commit da transação atual.
+
+    Bairros marcados na mesma thread são acumulados e avaliados juntos pelo
+    primeiro callback executado; os seguintes encontram o conjunto vazio.
+    """
+    if tarefas.ativa():
+        # Na mesma transação; pedidos repetidos do bairro coalescem pela chave
+        tarefas.enfileirar('avaliar_alertas', {'bairro_ids': [bairro_id]}, chave=f'avaliar_alertas:{bairro_id}')
+        return
+    pendentes = getattr(_local, 'bairros', None)
+    if pendentes is None:
+        pendentes = _local.bairros = set()
+    pendentes.add(bairro_id)
+    transaction.on_commit(processar_pendentes)
+
+
+def processar_pendentes():
+    bairros = getattr(_local, 'bairros', None)
+    _local.bairros = None
+    if bairros:
+        avaliar_bairros(bairros)
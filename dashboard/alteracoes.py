@@ -0,0 +1,197 @@
+"""
+Log de Alterações (outbox)
+==========================
+
+Cada criação, alteração ou remoção de ``RelatorioAlagamento`` e
+``InteracaoRelatorio`` acrescenta uma linha em ``EventoAlteracao`` na mesma
+transação da mudança (``dashboard.signals``; caminhos com ``bulk_create``
+chamam ``registrar_lote``): se a mudança sofrer rollback, o evento também
+sofre. O evento traz o estado do objeto depois da mudança (antes, na
+remoção), com os campos de ``CAMPOS``.
+
+Consumidores leem em ordem de id a partir da última posição processada, em
+lotes: o custo é proporcional ao número de mudanças, não ao tamanho das
+tabelas.
+
+- ``consumir(nome, processar)``: consumidor nomeado com posição guardada no
+  banco (``PosicaoConsumidor``). O lote é processado e a posição avança na
+  mesma transação, então efeitos no banco acontecem uma vez só.
+- ``ler(posicao)``: leitura sem estado, para quem guarda a própria posição
+  (buffer em memória, ``api_alteracoes``).
+
+No PostgreSQL ids são reservados no INSERT e ficam visíveis no commit, fora
+de ordem entre transações concorrentes: uma lacuna na sequência pode ser uma
+transação ainda aberta, por mais longa que seja. Ao encontrar uma lacuna, o
+leitor anota quando a viu e o ``xmax`` do snapshot atual (todo id já
+reservado pertence a uma transação com xid menor). A lacuna só é pulada
+(rollback ou evento já podado) quando o ``xmin`` de um snapshot posterior
+passa desse marco, isto é, quando todas essas transações terminaram, e
+depois de ``ALTERACOES_ESPERA_LACUNA_S`` (cobre a reserva do id antes da
+atribuição do xid). Até lá a leitura para antes dela. Nos outros bancos só a
+espera vale, contada de quando a lacuna foi vista pela primeira vez neste
+processo (e não do momento do evento seguinte).
+
+Não são registradas as colunas derivadas mantidas por ``UPDATE`` em massa
+(contadores, urgência, evento, foto processada) nem as interações removidas
+junto com o relatório (a remoção do relatório as implica).
+``podar`` apaga eventos já lidos por todos os consumidores e mais antigos
+que ``ALTERACOES_RETENCAO_DIAS``.
+"""
+
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import EventoAlteracao, InteracaoRelatorio, PosicaoConsumidor, RelatorioAlagamento
+
+LIMITE_PADRAO = 500
+# Lacunas lembradas por mais tempo que isso são esquecidas (reavaliadas do zero se vistas de novo)
+MEMORIA_LACUNAS = timedelta(hours=1)
+
+_lacunas = {}  # primeiro id ausente -> (vista em, xmax do snapshot no PostgreSQL)
+_lock_lacunas = threading.Lock()
+
+MODELOS = {
+    RelatorioAlagamento: 'relatorio',
+    InteracaoRelatorio: 'interacao',
+}
+CAMPOS = {
+    'relatorio': (
+        'usuario_id', 'bairro_id', 'nivel_severidade', 'status', 'timestamp',
+        'latitude', 'longitude', 'altura_agua_cm',
+    ),
+    'interacao': ('relatorio_id', 'usuario_id', 'tipo', 'relevante'),
+}
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def _evento(instancia, operacao, campos=None):
+    modelo = MODELOS[type(instancia)]
+    return EventoAlteracao(
+        modelo=modelo,
+        objeto_id=instancia.pk,
+        operacao=operacao,
+        campos=sorted(campos) if campos is not None else None,
+        dados={campo: getattr(instancia, campo) for campo in CAMPOS[modelo]},
+    )
+
+
+def registrar(instancia, operacao, campos=None):
+    """Acrescenta ao log a mudança de um relatório ou interação (na transação atual)"""
+    _evento(instancia, operacao, campos).save()
+
+
+def registrar_lote(instancias, operacao, campos=None):
+    """Versão em lote de ``registrar`` (um INSERT), para ``bulk_create`` e ``update``"""
+    eventos = [_evento(instancia, operacao, campos) for instancia in instancias]
+    if eventos:
+        EventoAlteracao.objects.bulk_create(eventos)
+
+
+# ---------------------------------------------------------------- leitura
+
+def ultima_posicao():
+    return EventoAlteracao.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+
+
+def _snapshot(campo):
+    """``xmin``/``xmax`` do snapshot atual (PostgreSQL); None nos outros bancos"""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT pg_snapshot_{campo}(pg_current_snapshot())::text::bigint")
+        return cursor.fetchone()[0]
+
+
+def _lacuna_resolvida(inicio, agora, xmin):
+    """A lacuna que começa em ``inicio`` não pode mais ser preenchida por uma transação aberta"""
+    with _lock_lacunas:
+        if inicio not in _lacunas:
+            for antiga in [k for k, (vista, _) in _lacunas.items() if vista < agora - MEMORIA_LACUNAS]:
+                del _lacunas[antiga]
+            _lacunas[inicio] = (agora, _snapshot('xmax'))
+        vista, marco = _lacunas[inicio]
+    if agora - vista < timedelta(seconds=_config('ALTERACOES_ESPERA_LACUNA_S', 5)):
+        return False
+    return marco is None or xmin() >= marco
+
+
+def ler(posicao, limite=LIMITE_PADRAO, modelos=None, agora=None):
+    """
+    Eventos após ``posicao``, em ordem, até ``limite``. Retorna
+    ``(eventos, nova_posicao)``; com ``modelos``, só os eventos desses
+    modelos são devolvidos, mas a posição avança sobre todos.
+    """
+    agora = agora or timezone.now()
+    xmin_atual = []
+
+    def xmin():
+        # Um snapshot novo por leitura, só se houver lacuna a decidir
+        if not xmin_atual:
+            xmin_atual.append(_snapshot('xmin'))
+        return xmin_atual[0]
+
+    aceitos = []
+    for evento in EventoAlteracao.objects.filter(id__gt=posicao).order_by('id')[:limite]:
+        if evento.id != posicao + 1 and not _lacuna_resolvida(posicao + 1, agora, xmin):
+            break  # O id que falta pode ser de uma transação ainda aberta
+        aceitos.append(evento)
+        posicao = evento.id
+    if modelos is not None:
+        aceitos = [evento for evento in aceitos if evento.modelo in modelos]
+    return aceitos, posicao
+
+
+def consumir(nome, processar, limite=LIMITE_PADRAO, modelos=None):
+    """
+    Processa o próximo lote do consumidor ``nome``: ``processar(eventos)``
+    roda na transação que avança a posição. Retorna quantos eventos leu.
+    """
+    with transaction.atomic():
+        PosicaoConsumidor.objects.get_or_create(nome=nome)
+        consumidor = PosicaoConsumidor.objects.select_for_update().get(nome=nome)
+        eventos, posicao = ler(consumidor.posicao, limite, modelos)
+        if posicao == consumidor.posicao:
+            return 0
+        if eventos:
+            processar(eventos)
+        lidos = posicao - consumidor.posicao
+        consumidor.posicao = posicao
+        consumidor.save(update_fields=['posicao', 'atualizado_em'])
+    return lidos
+
+
+def consumir_tudo(nome, processar, limite=LIMITE_PADRAO, modelos=None):
+    """Consome lotes até alcançar o fim do log; retorna o total de posições avançadas"""
+    total = 0
+    while lidos := consumir(nome, processar, limite, modelos):
+        total += lidos
+    return total
+
+
+def situacao():
+    """Posição e eventos pendentes de cada consumidor"""
+    ultimo = ultima_posicao()
+    return [
+        {'nome': nome, 'posicao': posicao, 'pendentes': ultimo - posicao, 'atualizado_em': atualizado_em}
+        for nome, posicao, atualizado_em in
+        PosicaoConsumidor.objects.order_by('nome').values_list('nome', 'posicao', 'atualizado_em')
+    ]
+
+
+def podar(dias=None):
+    """Apaga eventos lidos por todos os consumidores e mais antigos que a retenção; retorna quantos"""
+    dias = _config('ALTERACOES_RETENCAO_DIAS', 30) if dias is None else dias
+    eventos = EventoAlteracao.objects.filter(timestamp__lt=timezone.now() - timedelta(days=dias))
+    menor = PosicaoConsumidor.objects.aggregate(menor=Min('posicao'))['menor']
+    if menor is not None:
+        eventos = eventos.filter(id__lte=menor)
+    apagados, _ = eventos.delete()
+    return apagados
@@ -0,0 +1,199 @@
+"""
+Benchmarks das views do Dashboard
+=================================
+
+Popula um banco de teste em vários tamanhos e mede, para cada view e cada
+combinação de filtros: latência (média/p50/p95), número de queries e pico de
+memória Python. O resultado é um dicionário serializável em JSON, para que
+regressões fiquem visíveis comparando arquivos de commits diferentes.
+"""
+
+import itertools
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .catalogo import catalogo
+from .models import RelatorioAlagamento
+from .sinteticos import carregar_relatorios
+
+
+def _combinacoes(**opcoes):
+    """Produto cartesiano de opções de filtro -> lista de dicts de querystring"""
+    chaves = list(opcoes)
+    return [dict(zip(chaves, valores)) for valores in itertools.product(*opcoes.values())]
+
+
+def cenarios():
+    """
+    Lista de cenários: (view, método, url, dados).
+
+    Calculada depois da carga, pois alguns filtros dependem dos dados
+    (bairro mais frequente, relatório mais recente).
+    """
+    mais_frequente = (
+        RelatorioAlagamento.objects.values('bairro_id')
+        .annotate(n=Count('id')).order_by('-n').first()
+    )
+    bairro = catalogo.obter(mais_frequente['bairro_id']) if mais_frequente else None
+    ultimo = RelatorioAlagamento.objects.order_by('-timestamp').values_list('id', flat=True).first() or 1
+
+    lista = []
+    bairro_id = str(bairro.id) if bairro else 'all'
+    for filtros in _combinacoes(periodo=['7', '30', '90'], bairro=['all', bairro_id], severidade=['all', '4']):
+        lista.append(('dashboard_home', 'get', reverse('dashboard:home'), filtros))
+    for filtros in _combinacoes(sev_min=['1', '3'], periodo=['24', '168']):
+        lista.append(('mapa_interativo', 'get', reverse('dashboard:mapa'), filtros))
+    lista.append(('analytics', 'get', reverse('dashboard:analytics'), {}))
+    lista.append(('api_dados_tempo_real', 'get', reverse('dashboard:api_tempo_real'), {}))
+    lista.append(('relatorio_detalhado', 'get', reverse('dashboard:relatorio_detalhes', args=[ultimo]), {}))
+    lista.append(('teste_ml', 'get', reverse('dashboard:teste_ml'), {}))
+
+    lista.append(('teste_ml', 'post', reverse('dashboard:teste_ml'), {
+        'latitude': (bairro and bairro.latitude) or -8.05,
+        'longitude': (bairro and bairro.longitude) or -34.88,
+        'bairro': bairro.id if bairro else 'Boa Viagem',
+    }))
+    return lista
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def medir(client, metodo, url, dados, repeticoes=5):
+    """Mede uma requisição: latências, queries e pico de memória"""
+    requisitar = getattr(client, metodo)
+    resultado = {'status': None, 'erro': None}
+
+    try:
+        # Aquecimento (caches, compilação de templates, modelo de ML)
+        resposta = requisitar(url, dados)
+        resultado['status'] = resposta.status_code
+
+        with CaptureQueriesContext(connection) as queries:
+            requisitar(url, dados)
+        resultado['queries'] = len(queries)
+        resultado['tempo_sql_ms'] = round(sum(float(q['time']) for q in queries.captured_queries) * 1000, 3)
+
+        tracemalloc.start()
+        try:
+            requisitar(url, dados)
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        resultado['memoria_pico_kb'] = round(pico / 1024, 1)
+
+        latencias = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            resposta = requisitar(url, dados)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        resultado['bytes_resposta'] = len(resposta.content)
+        resultado['latencia_ms'] = {
+            'media': round(statistics.mean(latencias), 3),
+            'p50': round(_percentil(latencias, 50), 3),
+            'p95': round(_percentil(latencias, 95), 3),
+            'min': round(min(latencias), 3),
+            'max': round(max(latencias), 3),
+        }
+    except Exception as e:
+        # Views quebradas (ex.: template ausente) entram no relatório em vez de abortar
+        resultado['erro'] = f"{type(e).__name__}: {e}"
+
+    return resultado
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, timeout=5
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def executar(tamanhos, repeticoes=5, seed=42, log=None):
+    """
+    Executa a suíte para cada tamanho de base (no banco atualmente conectado).
+
+    Apaga os relatórios existentes antes de cada carga: use apenas em um
+    banco de teste (o comando ``benchmark_views`` cria um automaticamente).
+    """
+    log = log or (lambda msg: None)
+    client = Client()
+    resultados = []
+
+    for tamanho in tamanhos:
+        log(f"🗑️ Limpando relatórios e carregando {tamanho:,}...")
+        RelatorioAlagamento.objects.all().delete()
+        inicio = time.perf_counter()
+        carregar_relatorios(tamanho, seed=seed, dias=120)
+        log(f"   carga em {time.perf_counter() - inicio:.1f}s")
+
+        for view, metodo, url, dados in cenarios():
+            medida = medir(client, metodo, url, dados, repeticoes)
+            medida.update({'view': view, 'metodo': metodo.upper(), 'filtros': dados, 'tamanho': tamanho})
+            resultados.append(medida)
+
+            if medida['erro']:
+                log(f"   ❌ {view} {dados}: {medida['erro']}")
+            else:
+                log(
+                    f"   {view:<22} {str(dados):<55} "
+                    f"p50={medida['latencia_ms']['p50']:>9.1f}ms "
+                    f"queries={medida['queries']:>4} mem={medida['memoria_pico_kb']:>9.0f}KB"
+                )
+
+    return {
+        'gerado_em': timezone.now().isoformat(),
+        'commit': _git_commit(),
+        'ambiente': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'banco': connection.vendor,
+        },
+        'tamanhos': list(tamanhos),
+        'repeticoes': repeticoes,
+        'resultados': resultados,
+    }
+
+
+def _chave(resultado):
+    return (resultado['view'], resultado['metodo'], resultado['tamanho'],
+            tuple(sorted((k, str(v)) for k, v in resultado['filtros'].items())))
+
+
+def comparar(base, atual, limiar=0.2):
+    """
+    Compara dois relatórios e retorna as regressões acima de ``limiar``
+    (fração) em latência p50 ou qualquer aumento no número de queries.
+    """
+    anteriores = {_chave(r): r for r in base['resultados'] if not r.get('erro')}
+    regressoes = []
+
+    for r in atual['resultados']:
+        anterior = anteriores.get(_chave(r))
+        if anterior is None or r.get('erro'):
+            continue
+        p50_antes = anterior['latencia_ms']['p50']
+        p50_agora = r['latencia_ms']['p50']
+        if p50_antes and (p50_agora - p50_antes) / p50_antes > limiar:
+            regressoes.append((r, 'latencia_p50', p50_antes, p50_agora))
+        if r['queries'] > anterior['queries']:
+            regressoes.append((r, 'queries', anterior['queries'], r['queries']))
+
+    return regressoes
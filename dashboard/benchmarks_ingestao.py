@@ -0,0 +1,144 @@
+"""
+Benchmark da Ingestão de Relatos
+================================
+
+Mede a vazão sustentada de envio de relatos (relatos/s) com vários clientes
+simultâneos (threads, cada uma com sua conexão), comparando:
+
+- ``direto``: o caminho antigo de ``criar_relatorio``, com
+  ``get_or_create`` do perfil e uma transação por relato;
+- ``fila``: ``ingestao.enviar`` no modo durável (o cliente espera o commit
+  do lote);
+- ``fila_assincrona``: ``ingestao.enviar`` sem esperar o commit; a medição
+  termina quando o último lote é gravado.
+
+Os relatos são gravados no banco configurado e removidos no fim. Os jobs
+disparados após o commit (alertas, eventos, spam) ficam desligados durante a
+medição: medem-se só a escrita e os sinais na transação.
+"""
+
+import random
+import statistics
+import threading
+import time
+
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from . import ingestao
+from .catalogo import catalogo
+from .models import RelatorioAlagamento, UsuarioApp
+
+MODOS = ('direto', 'fila', 'fila_assincrona')
+
+
+def _relatos(n, usuarios, seed):
+    rng = random.Random(seed)
+    bairros = [b for b in catalogo.todos() if b.latitude is not None]
+    relatos = []
+    for _ in range(n):
+        bairro = rng.choice(bairros)
+        relatos.append(RelatorioAlagamento(
+            usuario_id=rng.choice(usuarios),
+            bairro_id=bairro.id,
+            latitude=round(bairro.latitude + rng.uniform(-0.01, 0.01), 7),
+            longitude=round(bairro.longitude + rng.uniform(-0.01, 0.01), 7),
+            nivel_severidade=rng.randint(1, 4),
+            descricao='Relato de carga (benchmark de ingestão)',
+            timestamp=timezone.now(),
+        ))
+    return relatos
+
+
+def _enviar_direto(relatorio):
+    usuario_app, _ = UsuarioApp.objects.get_or_create(pk=relatorio.usuario_id)
+    relatorio.usuario = usuario_app
+    relatorio.save()
+
+
+def medir(modo, n, clientes, seed=42):
+    usuarios = list(UsuarioApp.objects.values_list('id', flat=True)[:500])
+    if not usuarios:
+        raise ValueError('Nenhum UsuarioApp no banco; gere dados sintéticos antes')
+    relatos = _relatos(n, usuarios, seed)
+    partes = [relatos[i::clientes] for i in range(clientes)]
+    latencias, erros, pedidos = [], [], []
+    lock = threading.Lock()
+    lotes_antes = ingestao.fila.lotes
+
+    def cliente(parte):
+        locais, falhas, meus = [], [], []
+        try:
+            for relatorio in parte:
+                inicio = time.perf_counter()
+                try:
+                    if modo == 'direto':
+                        _enviar_direto(relatorio)
+                    else:
+                        meus.append(ingestao.enviar(relatorio, duravel=modo == 'fila'))
+                except ingestao.TempoEsgotado as e:
+                    falhas.append(type(e).__name__)
+                    meus.append(e.pedido)
+                except Exception as e:
+                    falhas.append(type(e).__name__)
+                locais.append(time.perf_counter() - inicio)
+        finally:
+            connection.close()
+        with lock:
+            latencias.extend(locais)
+            erros.extend(falhas)
+            pedidos.extend(meus)
+
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=cliente, args=(parte,)) for parte in partes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for pedido in pedidos:
+        try:
+            pedido.aguardar(60)
+        except Exception as e:
+            erros.append(type(e).__name__)
+    duracao = time.perf_counter() - inicio
+
+    gravados = [r.id_relato for r in relatos if r.pk is not None]
+    latencias.sort()
+    resultado = {
+        'modo': modo,
+        'relatos': n,
+        'clientes': clientes,
+        'gravados': len(gravados),
+        'erros': {nome: erros.count(nome) for nome in set(erros)},
+        'relatos_s': round(len(gravados) / duracao, 1),
+        'latencia_ms': {
+            'p50': round(statistics.median(latencias) * 1000, 2),
+            'p95': round(latencias[int(len(latencias) * 0.95) - 1] * 1000, 2),
+        },
+    }
+    if modo != 'direto':
+        lotes = ingestao.fila.lotes - lotes_antes
+        resultado['lotes'] = lotes
+        resultado['relatos_por_lote'] = round(len(gravados) / lotes, 1) if lotes else 0
+
+    for inicio_bloco in range(0, len(gravados), 500):
+        RelatorioAlagamento.objects.filter(id_relato__in=gravados[inicio_bloco:inicio_bloco + 500]).delete()
+    return resultado
+
+
+def executar(n=2000, clientes=8, modos=MODOS, seed=42, log=None):
+    resultados = []
+    with override_settings(
+        ALERTAS_AVALIAR_AO_SALVAR=False, EVENTOS_AGRUPAR_AO_SALVAR=False, SPAM_VERIFICAR_AO_SALVAR=False,
+    ):
+        for modo in modos:
+            resultado = medir(modo, n, clientes, seed)
+            resultados.append(resultado)
+            if log:
+                log(
+                    f"{modo}: {resultado['relatos_s']:,} relatos/s, "
+                    f"p50 {resultado['latencia_ms']['p50']}ms, p95 {resultado['latencia_ms']['p95']}ms, "
+                    f"{resultado['gravados']}/{n} gravados, erros {resultado['erros'] or 0}"
+                )
+    return {'banco': connection.vendor, 'resultados': resultados}
@@ -0,0 +1,165 @@
+"""
+Benchmark da Detecção de Spam
+=============================
+
+Mede o detector MinHash/LSH de ``dashboard.spam`` em memória (sem banco),
+sobre um fluxo sintético de textos com rótulo conhecido:
+
+- orgânicos: descrições curtas do gerador sintético e relatos mais longos
+  montados de fragmentos ao acaso (parecidos entre si, mas não copiados);
+- spam: campanhas de copia-e-cola, cada cópia com pequenas variações
+  (palavras trocadas ou removidas, caixa, pontuação, números).
+
+Para cada tamanho de fluxo reporta precisão, revocação e vazão (textos/s) do
+LSH e da comparação exaustiva de assinaturas (a mesma decisão sem os
+baldes), que serve de referência para o ganho sub-linear e para a perda de
+revocação causada pelas bandas.
+"""
+
+import random
+import time
+
+import numpy as np
+
+from utils.data_processing.create_synthetic_data import DESCRICOES
+
+from . import spam
+
+FRAGMENTOS = [
+    'rua {rua} completamente alagada', 'água na altura do joelho', 'carros parados no meio da via',
+    'ônibus não conseguem passar', 'evitem a região até a chuva parar', 'bueiro entupido de lixo',
+    'começou desde as {hora}h', 'pedestres ilhados na parada', 'loja fechou por causa da água',
+    'moradores tirando móveis de casa', 'sinal de trânsito apagado', 'correnteza forte na ladeira',
+    'canal transbordou perto da ponte', 'água entrando nas casas', 'escola dispensou os alunos',
+]
+RUAS = ['da Aurora', 'do Sol', 'Imperial', 'da Hora', 'Real da Torre', 'do Futuro', 'Amélia', 'da Paz']
+CAMPANHAS = [
+    'PROMOÇÃO imperdível de bombas d\'água e motores, chame no whatsapp {tel} e ganhe frete grátis hoje',
+    'Ganhe dinheiro em casa enquanto chove, acesse o link bit.ly/{cod} e cadastre seu pix agora mesmo',
+    'Desentupidora 24 horas atende toda a região metropolitana, orçamento sem compromisso {tel}',
+    'Vendo seguro contra enchentes com desconto exclusivo para moradores do bairro, ligue {tel}',
+]
+
+
+def _organico(rng):
+    if rng.random() < 0.5:
+        return rng.choice(rng.choice(list(DESCRICOES.values()))) + f' - Precipitação: {rng.uniform(0, 60):.1f}mm'
+    partes = rng.sample(FRAGMENTOS, rng.randint(3, 5))
+    texto = ', '.join(partes).format(rua=rng.choice(RUAS), hora=rng.randint(0, 23))
+    return f'Perto do número {rng.randint(1, 2000)} da rua {rng.choice(RUAS)}: {texto}'
+
+
+def _copia(modelo, rng):
+    palavras = modelo.format(
+        tel=f'(81) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}', cod=rng.randint(100, 999)
+    ).split()
+    for _ in range(rng.randint(0, 2)):
+        acao, i = rng.random(), rng.randrange(len(palavras))
+        if acao < 0.4:
+            del palavras[i]
+        elif acao < 0.7:
+            palavras.insert(i, rng.choice(['!!!', 'urgente', 'oferta', '👉']))
+        else:
+            palavras[i] = palavras[i].upper()
+    return ' '.join(palavras)
+
+
+def gerar_textos(n, fracao_spam=0.1, copias_por_campanha=20, seed=42):
+    """Lista de (texto, é_spam) em ordem de chegada"""
+    rng = random.Random(seed)
+    n_spam = int(n * fracao_spam)
+    textos = [(_organico(rng), False) for _ in range(n - n_spam)]
+    # Campanhas entram em rajadas espalhadas pelo fluxo
+    rajadas = max(1, n_spam // copias_por_campanha)
+    for r in range(rajadas):
+        modelo = CAMPANHAS[r % len(CAMPANHAS)] + f' #{r}'
+        tamanho = n_spam // rajadas + (1 if r < n_spam % rajadas else 0)
+        posicao = rng.randrange(len(textos) + 1)
+        textos[posicao:posicao] = [(_copia(modelo, rng), True) for _ in range(tamanho)]
+    return textos
+
+
+def _metricas(marcados, rotulos):
+    verdadeiros = sum(1 for i in marcados if rotulos[i])
+    positivos = sum(rotulos)
+    precisao = verdadeiros / len(marcados) if marcados else 1.0
+    revocacao = verdadeiros / positivos if positivos else 1.0
+    return round(precisao, 4), round(revocacao, 4)
+
+
+def _exaustivo(assinaturas, limiar, min_copias):
+    """Mesma regra do detector comparando cada texto com todos os anteriores"""
+    matriz = np.zeros((len(assinaturas), spam.NUM_PERMUTACOES), dtype=np.uint32)
+    marcados = set()
+    for i, sig in enumerate(assinaturas):
+        if sig is None:
+            continue
+        matriz[i] = sig
+        similares = np.flatnonzero((matriz[:i] == sig).mean(axis=1) >= limiar)
+        if len(similares) + 1 >= min_copias:
+            marcados.update(similares.tolist())
+            marcados.add(i)
+    return marcados
+
+
+def medir(n, seed=42, comparar_exaustivo=True):
+    textos = gerar_textos(n, seed=seed)
+    rotulos = [rotulo for _, rotulo in textos]
+    limiar, min_copias = spam._parametros()
+
+    inicio = time.perf_counter()
+    assinaturas = [spam.assinatura(texto) for texto, _ in textos]
+    t_assinaturas = time.perf_counter() - inicio
+
+    detector = spam.DetectorSpam()
+    inicio = time.perf_counter()
+    marcados = set()
+    for i, sig in enumerate(assinaturas):
+        if sig is not None:
+            marcados.update(detector.registrar(i, sig, float(i), limiar, min_copias))
+    t_lsh = time.perf_counter() - inicio
+    precisao, revocacao = _metricas(marcados, rotulos)
+
+    resultado = {
+        'textos': n,
+        'spam': sum(rotulos),
+        'indexados': len(detector.indice),
+        'assinaturas_textos_s': round(n / t_assinaturas),
+        'lsh': {
+            'textos_s': round(n / t_lsh),
+            'us_por_texto': round(t_lsh / n * 1e6, 1),
+            'precisao': precisao,
+            'revocacao': revocacao,
+        },
+    }
+    if comparar_exaustivo:
+        inicio = time.perf_counter()
+        marcados_exaustivo = _exaustivo(assinaturas, limiar, min_copias)
+        t_exaustivo = time.perf_counter() - inicio
+        precisao, revocacao = _metricas(marcados_exaustivo, rotulos)
+        resultado['exaustivo'] = {
+            'textos_s': round(n / t_exaustivo),
+            'us_por_texto': round(t_exaustivo / n * 1e6, 1),
+            'precisao': precisao,
+            'revocacao': revocacao,
+        }
+    return resultado
+
+
+def executar(tamanhos, seed=42, limite_exaustivo=50_000, log=None):
+    resultados = []
+    for n in tamanhos:
+        resultado = medir(n, seed=seed, comparar_exaustivo=n <= limite_exaustivo)
+        resultados.append(resultado)
+        if log:
+            linha = (
+                f"n={n:,}: LSH {resultado['lsh']['textos_s']:,} textos/s "
+                f"(P={resultado['lsh']['precisao']}, R={resultado['lsh']['revocacao']})"
+            )
+            if 'exaustivo' in resultado:
+                linha += (
+                    f" | exaustivo {resultado['exaustivo']['textos_s']:,} textos/s "
+                    f"(P={resultado['exaustivo']['precisao']}, R={resultado['exaustivo']['revocacao']})"
+                )
+            log(linha)
+    return {'parametros': dict(zip(('limiar', 'min_copias'), spam._parametros())), 'resultados': resultados}
@@ -0,0 +1,206 @@
+"""
+Busca Textual
+=============
+
+Índice invertido sobre o texto dos relatos: ``descricao``,
+``endereco_aproximado`` e os comentários das interações, um documento por
+relato na tabela ``busca_relatos``, conforme o banco:
+
+- SQLite: tabela virtual FTS5 (``rowid`` = id do relato), tokenizador
+  ``unicode61`` sem acentos; cada termo da consulta é reduzido a um radical
+  (``radical``) e buscado por prefixo, então "alagada" encontra "alagamento"
+  e "alagado"; ranking por BM25;
+- PostgreSQL: coluna ``tsvector`` com dicionário ``portuguese`` (stemmer
+  Snowball) e índice GIN; consulta com ``websearch_to_tsquery`` e ranking
+  por ``ts_rank``. Descrição, endereço e comentários têm pesos A, B e C.
+
+Outros bancos caem em ``icontains`` termo a termo (varredura, sem índice).
+
+O documento de um relato é regravado na mesma transação da escrita
+(``dashboard.signals``): relato criado ou com texto alterado, comentário
+novo ou removido. ``indexar_relatorios`` cobre cargas com ``bulk_create`` e
+``reindexar`` reconstrói tudo. A busca devolve um queryset de relatos,
+então os filtros (bairro, período, severidade, status) são os do ORM.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from .models import InteracaoRelatorio, RelatorioAlagamento
+
+TABELA = 'busca_relatos'
+# Pesos BM25 das colunas do FTS5 (descricao, endereco, comentarios)
+PESOS_FTS5 = (1.0, 0.5, 0.3)
+BLOCO = 1000
+
+SUFIXOS = sorted([
+    'amentos', 'imentos', 'amento', 'imento', 'mente', 'acoes', 'icoes', 'acao', 'icao',
+    'adoras', 'adores', 'adora', 'ador', 'antes', 'ante', 'ncias', 'ncia',
+    'adas', 'ados', 'idas', 'idos', 'ada', 'ado', 'ida', 'ido',
+    'ando', 'endo', 'indo', 'ava', 'aram', 'eram', 'iram', 'ar', 'er', 'ir',
+    'oes', 'aes', 'ais', 'eis', 'es', 'as', 'os', 'a', 'o', 'e', 's',
+], key=len, reverse=True)
+MIN_RADICAL = 3
+
+
+def _sem_acentos(texto):
+    return unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode().lower()
+
+
+def termos(consulta):
+    """Palavras da consulta, minúsculas e sem acentos"""
+    return re.findall(r'[a-z0-9]+', _sem_acentos(consulta))
+
+
+def radical(termo):
+    """Remove um sufixo flexional/derivacional comum do português (stemmer leve)"""
+    if termo.isdigit():
+        return termo
+    for sufixo in SUFIXOS:
+        if termo.endswith(sufixo) and len(termo) - len(sufixo) >= MIN_RADICAL:
+            return termo[:-len(sufixo)]
+    return termo
+
+
+def _consulta_fts5(consulta):
+    """Termos -> expressão MATCH do FTS5 (todos obrigatórios, por prefixo do radical)"""
+    return ' '.join(f'"{radical(t)}"*' for t in termos(consulta))
+
+
+def disponivel():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+# ---------------------------------------------------------------- escrita
+
+def _gravar(documentos):
+    """{relatorio_id: (descricao, endereco, comentarios)} -> tabela de busca"""
+    if not documentos or not disponivel():
+        return
+    linhas = [(pk, *textos) for pk, textos in sorted(documentos.items())]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(f"DELETE FROM {TABELA} WHERE rowid = %s", [(pk,) for pk, *_ in linhas])
+            cursor.executemany(
+                f"INSERT INTO {TABELA} (rowid, descricao, endereco, comentarios) VALUES (%s, %s, %s, %s)",
+                linhas
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {TABELA} (relatorio_id, documento) VALUES (%s, "
+                "setweight(to_tsvector('portuguese', %s), 'A') || "
+                "setweight(to_tsvector('portuguese', %s), 'B') || "
+                "setweight(to_tsvector('portuguese', %s), 'C')) "
+                "ON CONFLICT (relatorio_id) DO UPDATE SET documento = excluded.documento",
+                linhas
+            )
+
+
+def _comentarios(ids):
+    por_relato = defaultdict(list)
+    for relatorio_id, comentario in (
+        InteracaoRelatorio.objects.filter(relatorio_id__in=ids).exclude(comentario='')
+        .values_list('relatorio_id', 'comentario').order_by('id')
+    ):
+        por_relato[relatorio_id].append(comentario)
+    return por_relato
+
+
+def indexar(ids):
+    """Regrava o documento dos relatos ``ids`` a partir do banco"""
+    ids = list(ids)
+    if not ids or not disponivel():
+        return
+    for inicio in range(0, len(ids), BLOCO):
+        bloco = ids[inicio:inicio + BLOCO]
+        comentarios = _comentarios(bloco)
+        _gravar({
+            pk: (descricao, endereco, '\n'.join(comentarios.get(pk, ())))
+            for pk, descricao, endereco in RelatorioAlagamento.objects.select_related(None)
+            .filter(pk__in=bloco).values_list('id', 'descricao', 'endereco_aproximado').order_by()
+        })
+
+
+def indexar_relatorios(relatorios):
+    """Indexa relatos recém-criados com ``bulk_create`` (que não dispara sinais; sem comentários)"""
+    _gravar({
+        r.pk: (r.descricao or '', r.endereco_aproximado or '', '')
+        for r in relatorios if r.pk is not None
+    })
+
+
+def remover(ids):
+    ids = list(ids)
+    if not ids or not disponivel():
+        return
+    coluna = 'rowid' if connection.vendor == 'sqlite' else 'relatorio_id'
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABELA} WHERE {coluna} = %s", [(pk,) for pk in ids])
+
+
+def reindexar():
+    """Reconstrói o índice de todos os relatos; retorna quantos foram indexados"""
+    if not disponivel():
+        return 0
+    total = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABELA}")
+        ids = RelatorioAlagamento.objects.select_related(None).order_by('id').values_list('id', flat=True)
+        ultimo = 0
+        while bloco := list(ids.filter(pk__gt=ultimo)[:BLOCO * 10]):
+            indexar(bloco)
+            total += len(bloco)
+            ultimo = bloco[-1]
+    return total
+
+
+# ---------------------------------------------------------------- consulta
+
+def buscar(consulta, relatos=None):
+    """
+    Relatos cujo texto casa com ``consulta`` (todos os termos), do mais ao
+    menos relevante, anotados com ``relevancia``. ``relatos`` é o queryset
+    já filtrado (padrão: todos).
+    """
+    relatos = RelatorioAlagamento.objects.all() if relatos is None else relatos
+    palavras = termos(consulta)
+    if not palavras:
+        return relatos.none()
+
+    # Junção com a tabela de busca: o índice invertido escolhe os relatos e o
+    # ranking sai da mesma linha (uma subconsulta correlacionada refaria o
+    # MATCH a cada relato no SQLite)
+    tabela_relatos = RelatorioAlagamento._meta.db_table
+    if connection.vendor == 'sqlite':
+        pesos = ', '.join(str(p) for p in PESOS_FTS5)
+        relatos = relatos.extra(
+            tables=[TABELA],
+            where=[f"{TABELA}.rowid = {tabela_relatos}.id", f"{TABELA} MATCH %s"],
+            params=[_consulta_fts5(consulta)],
+            # bm25 é menor para documentos mais relevantes
+            select={'relevancia': f"-bm25({TABELA}, {pesos})"},
+        )
+    elif connection.vendor == 'postgresql':
+        relatos = relatos.extra(
+            tables=[TABELA],
+            where=[
+                f"{TABELA}.relatorio_id = {tabela_relatos}.id",
+                f"{TABELA}.documento @@ websearch_to_tsquery('portuguese', %s)",
+            ],
+            params=[consulta],
+            select={'relevancia': f"ts_rank({TABELA}.documento, websearch_to_tsquery('portuguese', %s))"},
+            select_params=[consulta],
+        )
+    else:
+        for palavra in palavras:
+            relatos = relatos.filter(
+                Q(descricao__icontains=palavra) | Q(endereco_aproximado__icontains=palavra) |
+                Q(interacoes__comentario__icontains=palavra)
+            )
+        relatos = relatos.distinct().annotate(relevancia=F('total_confirmacoes') * 1.0)
+    return relatos.order_by('-relevancia', '-timestamp', '-id')
@@ -0,0 +1,117 @@
+"""
+Catálogo de Bairros
+===================
+
+Cópia em memória (por processo) da tabela ``bairros``, que é pequena e
+quase estática: carregada uma vez e reutilizada por filtros, dropdowns,
+resolução nome -> id e encoding de bairros do modelo de ML, para que as
+views não façam joins com ``bairros`` nem reconsultem o catálogo a cada
+página.
+
+Edições pelo admin (ou qualquer ``save``/``delete`` de ``Bairro``) invalidam
+o catálogo do processo via sinais; nos demais processos a cópia expira após
+``CATALOGO_BAIRROS_TTL_S`` segundos. Cargas em lote (``bulk_create``) devem
+chamar ``catalogo.invalidar()``.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+
+from .models import Bairro
+
+
+class EntradaBairro(NamedTuple):
+    id: int
+    nome: str
+    cidade: str
+    uf: str
+    latitude: Optional[float]
+    longitude: Optional[float]
+    zona: str
+    risco_base: int
+
+    def __str__(self):
+        return self.nome
+
+
+CAMPOS = EntradaBairro._fields
+
+
+class _Dados(NamedTuple):
+    ordenados: tuple
+    por_id: dict
+    ids_por_nome: dict
+    carregado_em: float
+
+
+class CatalogoBairros:
+    """Catálogo de bairros carregado sob demanda e invalidado por sinais ou TTL"""
+
+    def __init__(self):
+        self._dados = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _ttl():
+        return getattr(settings, 'CATALOGO_BAIRROS_TTL_S', 300)
+
+    def _carregar(self):
+        entradas = tuple(
+            EntradaBairro(*linha)
+            for linha in Bairro.objects.order_by('nome', 'cidade', 'uf').values_list(*CAMPOS)
+        )
+        ids_por_nome = defaultdict(list)
+        for entrada in entradas:
+            ids_por_nome[entrada.nome].append(entrada.id)
+        return _Dados(
+            ordenados=entradas,
+            por_id={entrada.id: entrada for entrada in entradas},
+            ids_por_nome={nome: tuple(ids) for nome, ids in ids_por_nome.items()},
+            carregado_em=time.monotonic(),
+        )
+
+    @property
+    def dados(self):
+        dados = self._dados
+        if dados is None or time.monotonic() - dados.carregado_em > self._ttl():
+            with self._lock:
+                dados = self._dados
+                if dados is None or time.monotonic() - dados.carregado_em > self._ttl():
+                    dados = self._dados = self._carregar()
+        return dados
+
+    def invalidar(self):
+        self._dados = None
+
+    def todos(self):
+        """Bairros ordenados por nome (para dropdowns)"""
+        return self.dados.ordenados
+
+    def obter(self, bairro_id):
+        return self.dados.por_id.get(bairro_id)
+
+    def nome(self, bairro_id, padrao=''):
+        entrada = self.dados.por_id.get(bairro_id)
+        return entrada.nome if entrada else padrao
+
+    def ids_por_nome(self, nome):
+        """Ids dos bairros com esse nome (o mesmo nome pode existir em várias cidades)"""
+        return self.dados.ids_por_nome.get(nome, ())
+
+    def resolver(self, valor):
+        """
+        Valor de filtro (id numérico ou nome) -> tupla de ids de bairro.
+
+        Aceita nomes para não quebrar links antigos do dashboard.
+        """
+        valor = str(valor).strip()
+        if valor.isdigit():
+            return (int(valor),) if int(valor) in self.dados.por_id else ()
+        return self.ids_por_nome(valor)
+
+
+catalogo = CatalogoBairros()
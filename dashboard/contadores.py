@@ -0,0 +1,107 @@
+"""
+Contadores Desnormalizados
+==========================
+
+Mantém ``RelatorioAlagamento.total_confirmacoes/total_negacoes`` e
+``UsuarioApp.total_relatos/relatos_validados`` em dia com as interações e os
+relatórios, sempre com ``UPDATE ... SET campo = campo + n`` (``F()``), sem
+ler-modificar-gravar: requisições concorrentes não perdem incrementos.
+
+Os ajustes são disparados por ``dashboard.signals`` dentro da mesma
+transação da escrita que os causou. ``reconciliar`` recalcula tudo a partir
+das tabelas de origem com um UPDATE por tabela (subqueries agregadas),
+corrigindo divergências de cargas em lote ou escritas fora do ORM; se alguma
+confirmação mudar, o cubo de analytics (``dashboard.cubo``) é reconstruído.
+"""
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import cubo
+from .models import InteracaoRelatorio, RelatorioAlagamento, UsuarioApp
+
+# Relatos que contam como validados para o autor
+STATUS_VALIDOS = ('ativo', 'resolvido')
+
+CAMPO_POR_TIPO = {
+    'confirmacao': 'total_confirmacoes',
+    'negacao': 'total_negacoes',
+}
+
+
+def ajustar_relatorio(relatorio_id, deltas):
+    """Aplica ``{campo: delta}`` aos contadores do relatório em um único UPDATE"""
+    valores = {campo: F(campo) + delta for campo, delta in deltas.items() if delta}
+    if not valores:
+        return 0
+    # Confirmações entram na urgência: o score materializado fica pendente
+    valores['urgencia_atualizada_em'] = None
+    atualizados = RelatorioAlagamento.objects.filter(pk=relatorio_id).update(**valores)
+    if atualizados:
+        cubo.ajustar_confirmacoes(relatorio_id, deltas.get('total_confirmacoes', 0))
+    return atualizados
+
+
+def ajustar_interacao(relatorio_id, tipo, delta):
+    """Soma ``delta`` ao contador do relatório correspondente ao tipo de interação"""
+    campo = CAMPO_POR_TIPO.get(tipo)
+    if campo is None:
+        return 0
+    return ajustar_relatorio(relatorio_id, {campo: delta})
+
+
+def ajustar_relatos_usuario(usuario_id, delta_total=0, delta_validados=0):
+    """Soma deltas aos contadores de relatos do autor"""
+    valores = {}
+    if delta_total:
+        valores['total_relatos'] = F('total_relatos') + delta_total
+    if delta_validados:
+        valores['relatos_validados'] = F('relatos_validados') + delta_validados
+    if not valores:
+        return 0
+    return UsuarioApp.objects.filter(pk=usuario_id).update(**valores)
+
+
+def _contagem(queryset, campo_pai):
+    """Subquery correlacionada com COUNT(*) agrupado pela FK ``campo_pai``"""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{campo_pai: OuterRef('pk')})
+            .order_by()
+            .values(campo_pai)
+            .annotate(n=Count('pk'))
+            .values('n')
+        ),
+        Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def reconciliar():
+    """
+    Recalcula todos os contadores a partir das tabelas de origem.
+
+    Só as linhas divergentes são gravadas; retorna quantas por modelo.
+    """
+    confirmacoes = _contagem(InteracaoRelatorio.objects.filter(tipo='confirmacao'), 'relatorio')
+    negacoes = _contagem(InteracaoRelatorio.objects.filter(tipo='negacao'), 'relatorio')
+    relatorios = (
+        RelatorioAlagamento.objects
+        .annotate(confirmacoes_reais=confirmacoes, negacoes_reais=negacoes)
+        .exclude(total_confirmacoes=F('confirmacoes_reais'), total_negacoes=F('negacoes_reais'))
+        .update(total_confirmacoes=confirmacoes, total_negacoes=negacoes, urgencia_atualizada_em=None)
+    )
+    if relatorios:
+        # Confirmações são medida do cubo de analytics
+        cubo.reconstruir()
+
+    relatos = _contagem(RelatorioAlagamento.objects.all(), 'usuario')
+    validados = _contagem(RelatorioAlagamento.objects.filter(status__in=STATUS_VALIDOS), 'usuario')
+    usuarios = (
+        UsuarioApp.objects
+        .annotate(relatos_reais=relatos, validados_reais=validados)
+        .exclude(total_relatos=F('relatos_reais'), relatos_validados=F('validados_reais'))
+        .update(total_relatos=relatos, relatos_validados=validados)
+    )
+
+    return {'relatorios': relatorios, 'usuarios': usuarios}
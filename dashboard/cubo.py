@@ -0,0 +1,299 @@
+"""
+Cubo de Analytics
+=================
+
+Agregados pré-calculados para a página de analytics, no estilo OLAP:
+
+- ``CuboRelatos``: dimensões (dia, hora, bairro, severidade); medidas total
+  de relatos, soma de confirmações e soma dos quadrados das confirmações;
+- ``CuboContribuicoes``: relatos por (dia, usuário, bairro).
+
+Os painéis (tendência mensal, padrão horário, ranking de contribuidores e
+correlação severidade x confirmações) de qualquer período ou bairro são
+respondidos somando células, sem varrer ``relatorios_alagamento``. A
+correlação de Pearson sai das estatísticas suficientes (n, Σx, Σy, Σx²,
+Σy², Σxy) agregadas por severidade, sem enviar relatos ao navegador.
+
+Manutenção incremental, na mesma transação da escrita (``dashboard.signals``
+e ``dashboard.contadores``): criar/remover/alterar um relato soma ou subtrai
+sua contribuição, e cada voto ajusta as medidas de confirmação da célula.
+As células são acumuladas com ``INSERT ... ON CONFLICT DO UPDATE SET
+medida = medida + excluded.medida``, seguro sob concorrência. Dia e hora
+seguem o fuso ``TIME_ZONE``. ``reconstruir`` recalcula tudo a partir dos
+relatos (cargas em lote fora do ORM, reconciliação de contadores).
+"""
+
+import math
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractHour, TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import CuboContribuicoes, CuboRelatos, RelatorioAlagamento, UsuarioApp
+
+CHAVES_CELULA = ('dia', 'hora', 'bairro_id', 'severidade')
+MEDIDAS_CELULA = ('total', 'soma_confirmacoes', 'soma_confirmacoes_quadrado')
+CHAVES_CONTRIBUICAO = ('dia', 'usuario_id', 'bairro_id')
+MEDIDAS_CONTRIBUICAO = ('total',)
+
+
+def _acumular(modelo, chaves, medidas, linhas):
+    """Soma as medidas de ``linhas`` (chaves + medidas) às células, criando as ausentes"""
+    if not linhas:
+        return
+    # Ordem fixa das chaves: transações concorrentes travam células na mesma ordem
+    linhas = sorted(linhas, key=lambda linha: linha[:len(chaves)])
+    campos = [modelo._meta.get_field(nome) for nome in chaves + medidas]
+
+    if connection.vendor in ('postgresql', 'sqlite'):
+        q = connection.ops.quote_name
+        tabela = q(modelo._meta.db_table)
+        colunas = [q(campo.column) for campo in campos]
+        sql = (
+            f"INSERT INTO {tabela} ({', '.join(colunas)}) "
+            f"VALUES ({', '.join(['%s'] * len(colunas))}) "
+            f"ON CONFLICT ({', '.join(colunas[:len(chaves)])}) DO UPDATE SET "
+            + ', '.join(f"{c} = {tabela}.{c} + excluded.{c}" for c in colunas[len(chaves):])
+        )
+        parametros = [
+            [campo.get_db_prep_value(valor, connection) for campo, valor in zip(campos, linha)]
+            for linha in linhas
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, parametros)
+        return
+
+    # Outros bancos: UPDATE e, se a célula não existir, INSERT isolado por savepoint
+    for linha in linhas:
+        filtro = dict(zip(chaves, linha))
+        deltas = dict(zip(medidas, linha[len(chaves):]))
+        incrementos = {medida: F(medida) + delta for medida, delta in deltas.items()}
+        if modelo.objects.filter(**filtro).update(**incrementos):
+            continue
+        try:
+            with transaction.atomic():
+                modelo.objects.create(**filtro, **deltas)
+        except IntegrityError:
+            modelo.objects.filter(**filtro).update(**incrementos)
+
+
+class _Deltas:
+    """Contribuições (+1/-1 relato) acumuladas em memória antes de gravar"""
+
+    def __init__(self):
+        self.celulas = defaultdict(lambda: [0, 0, 0])
+        self.contribuicoes = Counter()
+
+    def somar(self, valores, sinal):
+        timestamp, bairro_id, severidade, usuario_id, confirmacoes = valores
+        local = timezone.localtime(timestamp)
+        medidas = self.celulas[(local.date(), local.hour, bairro_id, severidade)]
+        medidas[0] += sinal
+        medidas[1] += sinal * confirmacoes
+        medidas[2] += sinal * confirmacoes * confirmacoes
+        self.contribuicoes[(local.date(), usuario_id, bairro_id)] += sinal
+
+    def gravar(self):
+        _acumular(CuboRelatos, CHAVES_CELULA, MEDIDAS_CELULA, [
+            (*chave, *medidas) for chave, medidas in self.celulas.items() if any(medidas)
+        ])
+        _acumular(CuboContribuicoes, CHAVES_CONTRIBUICAO, MEDIDAS_CONTRIBUICAO, [
+            (*chave, total) for chave, total in self.contribuicoes.items() if total
+        ])
+
+
+POSICAO_CONFIRMACOES = RelatorioAlagamento.CAMPOS_CUBO.index('total_confirmacoes')
+
+
+def _valores(relatorio):
+    return tuple(getattr(relatorio, campo) for campo in RelatorioAlagamento.CAMPOS_CUBO)
+
+
+def _com_confirmacoes(valores, confirmacoes):
+    return valores[:POSICAO_CONFIRMACOES] + (confirmacoes,) + valores[POSICAO_CONFIRMACOES + 1:]
+
+
+def registrar_salvo(relatorio, criado):
+    """Soma um relato novo ao cubo ou move a contribuição de um relato alterado"""
+    atual = _valores(relatorio)
+    original = None if criado else getattr(relatorio, '_cubo_original', None)
+    relatorio._cubo_original = atual
+
+    deltas = _Deltas()
+    if criado:
+        deltas.somar(atual, 1)
+    else:
+        if original is None or None in original or _com_confirmacoes(original, 0) == _com_confirmacoes(atual, 0):
+            # Sem mudança de célula (ou instância sem os valores do banco: fica para ``reconstruir``)
+            return
+        # O save não grava confirmações (só UPDATE com F()): a contribuição é a do banco,
+        # já com os votos que ``ajustar_confirmacoes`` somou depois da leitura da instância
+        confirmacoes = (
+            RelatorioAlagamento.objects.filter(pk=relatorio.pk).order_by()
+            .values_list('total_confirmacoes', flat=True).first()
+        )
+        if confirmacoes is None:
+            return
+        deltas.somar(_com_confirmacoes(original, confirmacoes), -1)
+        deltas.somar(_com_confirmacoes(atual, confirmacoes), 1)
+    deltas.gravar()
+
+
+def registrar_removido(relatorio):
+    deltas = _Deltas()
+    deltas.somar(_valores(relatorio), -1)
+    deltas.gravar()
+
+
+def acumular_relatorios(relatorios):
+    """Soma relatos gravados com ``bulk_create`` (que não dispara sinais)"""
+    deltas = _Deltas()
+    for relatorio in relatorios:
+        relatorio._cubo_original = _valores(relatorio)
+        deltas.somar(relatorio._cubo_original, 1)
+    deltas.gravar()
+
+
+def ajustar_confirmacoes(relatorio_id, delta):
+    """
+    Ajusta as medidas de confirmação após ``total_confirmacoes += delta``.
+
+    Lê o valor já atualizado na mesma transação (a linha está travada pelo
+    UPDATE) para manter a soma dos quadrados exata.
+    """
+    if not delta:
+        return
+    linha = (
+        RelatorioAlagamento.objects.filter(pk=relatorio_id).order_by()
+        .values_list(*RelatorioAlagamento.CAMPOS_CUBO).first()
+    )
+    if linha is None:
+        return
+    timestamp, bairro_id, severidade, _, novo = linha
+    anterior = novo - delta
+    local = timezone.localtime(timestamp)
+    _acumular(CuboRelatos, CHAVES_CELULA, MEDIDAS_CELULA, [
+        (local.date(), local.hour, bairro_id, severidade, 0, delta, novo * novo - anterior * anterior)
+    ])
+
+
+def reconstruir():
+    """Recalcula as tabelas do cubo a partir dos relatos"""
+    base = RelatorioAlagamento.objects.select_related(None).order_by().annotate(
+        dia_local=TruncDate('timestamp'), hora_local=ExtractHour('timestamp')
+    )
+    celulas = [
+        CuboRelatos(
+            dia=linha['dia_local'], hora=linha['hora_local'], bairro_id=linha['bairro_id'],
+            severidade=linha['nivel_severidade'], total=linha['n'],
+            soma_confirmacoes=linha['soma'] or 0, soma_confirmacoes_quadrado=linha['soma_quadrado'] or 0,
+        )
+        for linha in base.values('dia_local', 'hora_local', 'bairro_id', 'nivel_severidade').annotate(
+            n=Count('id'),
+            soma=Sum('total_confirmacoes'),
+            soma_quadrado=Sum(F('total_confirmacoes') * F('total_confirmacoes')),
+        )
+    ]
+    por_usuario = [
+        CuboContribuicoes(dia=linha['dia_local'], usuario_id=linha['usuario_id'],
+                          bairro_id=linha['bairro_id'], total=linha['n'])
+        for linha in base.values('dia_local', 'usuario_id', 'bairro_id').annotate(n=Count('id'))
+    ]
+
+    with transaction.atomic():
+        CuboRelatos.objects.all().delete()
+        CuboContribuicoes.objects.all().delete()
+        CuboRelatos.objects.bulk_create(celulas, batch_size=2000)
+        CuboContribuicoes.objects.bulk_create(por_usuario, batch_size=2000)
+    return {'celulas': len(celulas), 'contribuicoes': len(por_usuario)}
+
+
+# CONSULTAS
+
+def _filtrar(queryset, desde=None, ate=None, bairro_ids=None):
+    if desde:
+        queryset = queryset.filter(dia__gte=desde)
+    if ate:
+        queryset = queryset.filter(dia__lte=ate)
+    if bairro_ids is not None:
+        queryset = queryset.filter(bairro_id__in=bairro_ids)
+    return queryset
+
+
+def celulas(desde=None, ate=None, bairro_ids=None):
+    """Células do cubo no intervalo de dias (inclusivo) e bairros informados"""
+    return _filtrar(CuboRelatos.objects.all(), desde, ate, bairro_ids)
+
+
+def por_mes(celulas):
+    linhas = celulas.annotate(mes=TruncMonth('dia')).values('mes').annotate(
+        n=Sum('total'), soma_severidade=Sum(F('severidade') * F('total'))
+    ).order_by('mes')
+    return [
+        {
+            'mes': linha['mes'],
+            'total': linha['n'],
+            'severidade_media': linha['soma_severidade'] / linha['n'] if linha['n'] else 0,
+        }
+        for linha in linhas
+    ]
+
+
+def por_hora(celulas):
+    """Total por hora do dia, com as 24 horas (zeros incluídos)"""
+    totais = dict(celulas.values('hora').annotate(n=Sum('total')).values_list('hora', 'n'))
+    return [{'hora': hora, 'total': totais.get(hora) or 0} for hora in range(24)]
+
+
+def por_severidade(celulas):
+    """Estatísticas suficientes de confirmações por nível de severidade"""
+    return [
+        {
+            'severidade': linha['severidade'],
+            'n': linha['n'],
+            'soma': linha['soma'],
+            'soma_quadrado': linha['soma_quadrado'],
+            'media_confirmacoes': linha['soma'] / linha['n'] if linha['n'] else 0,
+        }
+        for linha in celulas.values('severidade').annotate(
+            n=Sum('total'),
+            soma=Sum('soma_confirmacoes'),
+            soma_quadrado=Sum('soma_confirmacoes_quadrado'),
+        ).order_by('severidade')
+    ]
+
+
+def correlacao(severidades):
+    """Pearson entre severidade (x) e confirmações (y) a partir de ``por_severidade``"""
+    n = sx = sxx = sy = syy = sxy = 0
+    for linha in severidades:
+        x, k = linha['severidade'], linha['n']
+        n += k
+        sx += x * k
+        sxx += x * x * k
+        sy += linha['soma']
+        syy += linha['soma_quadrado']
+        sxy += x * linha['soma']
+    denominador = (n * sxx - sx * sx) * (n * syy - sy * sy)
+    if n < 2 or denominador <= 0:
+        return None
+    return (n * sxy - sx * sy) / math.sqrt(denominador)
+
+
+def top_contribuidores(desde=None, ate=None, bairro_ids=None, limite=10):
+    """Usuários com mais relatos no período, com ``relatos_periodo`` anotado"""
+    linhas = list(
+        _filtrar(CuboContribuicoes.objects.all(), desde, ate, bairro_ids)
+        .values('usuario_id').annotate(relatos_periodo=Sum('total'))
+        .filter(relatos_periodo__gt=0).order_by('-relatos_periodo', 'usuario_id')[:limite]
+    )
+    usuarios = UsuarioApp.objects.in_bulk([linha['usuario_id'] for linha in linhas])
+    ranking = []
+    for linha in linhas:
+        usuario = usuarios.get(linha['usuario_id'])
+        if usuario is not None:
+            usuario.relatos_periodo = linha['relatos_periodo']
+            ranking.append(usuario)
+    return ranking
@@ -0,0 +1,234 @@
+"""
+Deduplicação de Relatos
+=======================
+
+Na submissão (``criar_relatorio``), um relato a menos de
+``DEDUP_RAIO_METROS`` e ``DEDUP_JANELA_MINUTOS`` de um relato ativo recente,
+com severidade parecida (diferença até ``DEDUP_DIFERENCA_SEVERIDADE``), não
+vira uma linha nova: entra como confirmação do relato existente
+(``interacoes.registrar_voto``) e completa o existente com o que trouxer a
+mais (severidade maior, altura da água maior, foto). Assim o conjunto de
+relatos ativos que as views varrem não cresce a cada reenvio durante uma
+chuva forte.
+
+A busca não consulta a tabela: usa um índice em memória dos relatos ativos
+recentes, em uma grade com células de pelo menos o raio em cada direção
+(só as células ao redor do ponto, em geral 9, são examinadas). A altura da
+célula é fixa em graus de latitude; a largura em graus de longitude é
+calculada por faixa de latitude, pelo cosseno da borda mais próxima do
+polo, de modo que a célula mede pelo menos o raio em toda a faixa. O
+índice recebe os relatos criados neste processo e, antes de cada busca, os
+criados em outros processos (ids acima do maior já visto, pela chave
+primária). Entradas mais antigas que a janela expiram. O candidato
+escolhido é conferido no banco (ainda ativo) antes da mesclagem.
+"""
+
+import heapq
+import math
+import threading
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import interacoes
+from .models import RelatorioAlagamento
+
+METROS_POR_GRAU = 111_320
+# Junto aos polos um grau de longitude tende a zero metro: limita a largura das células
+COS_LAT_MINIMO = math.cos(math.radians(89))
+
+Entrada = namedtuple('Entrada', 'id latitude longitude epoch severidade')
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def janela():
+    return timedelta(minutes=_config('DEDUP_JANELA_MINUTOS', 60))
+
+
+class IndiceRecentes:
+    """Relatos ativos recentes em uma grade espacial, para busca por raio"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._raio = None
+        self._celulas = defaultdict(dict)
+        self._larguras = {}  # faixa de latitude -> largura das células em graus de longitude
+        self._por_id = {}
+        self._expiracao = []  # heap (epoch, id)
+        self._ultimo_id = None
+
+    def _cos_borda(self, latitude):
+        """Cosseno da latitude mais próxima do polo a até um raio de ``latitude``"""
+        extremo = min(abs(latitude) + self._raio / METROS_POR_GRAU, 90.0)
+        return max(math.cos(math.radians(extremo)), COS_LAT_MINIMO)
+
+    def _largura(self, faixa):
+        """Largura, em graus de longitude, das células da faixa de latitude ``faixa``"""
+        largura = self._larguras.get(faixa)
+        if largura is None:
+            borda = max(abs(faixa), abs(faixa + 1)) * self._raio / METROS_POR_GRAU
+            cos_borda = max(math.cos(math.radians(min(borda, 90.0))), COS_LAT_MINIMO)
+            largura = self._larguras[faixa] = self._raio / (METROS_POR_GRAU * cos_borda)
+        return largura
+
+    def _celula(self, latitude, longitude):
+        faixa = math.floor(latitude * METROS_POR_GRAU / self._raio)
+        return faixa, math.floor(longitude / self._largura(faixa))
+
+    def _celulas_ao_redor(self, latitude, longitude):
+        """Células que podem ter pontos a até um raio: três faixas, as colunas que cobrem o raio em cada"""
+        faixa = math.floor(latitude * METROS_POR_GRAU / self._raio)
+        alcance = self._raio / (METROS_POR_GRAU * self._cos_borda(latitude))
+        for f in (faixa - 1, faixa, faixa + 1):
+            largura = self._largura(f)
+            for coluna in range(math.floor((longitude - alcance) / largura),
+                                math.floor((longitude + alcance) / largura) + 1):
+                yield f, coluna
+
+    def _limpar(self):
+        self._raio = _config('DEDUP_RAIO_METROS', 100)
+        self._celulas.clear()
+        self._larguras.clear()
+        self._por_id.clear()
+        self._expiracao.clear()
+        self._ultimo_id = None
+
+    def _inserir(self, entrada):
+        if entrada.id in self._por_id:
+            return
+        self._por_id[entrada.id] = entrada
+        self._celulas[self._celula(entrada.latitude, entrada.longitude)][entrada.id] = entrada
+        heapq.heappush(self._expiracao, (entrada.epoch, entrada.id))
+        self._ultimo_id = max(self._ultimo_id or 0, entrada.id)
+
+    def _remover(self, relatorio_id):
+        entrada = self._por_id.pop(relatorio_id, None)
+        if entrada is not None:
+            celula = self._celula(entrada.latitude, entrada.longitude)
+            self._celulas[celula].pop(relatorio_id, None)
+            if not self._celulas[celula]:
+                del self._celulas[celula]
+
+    def _sincronizar(self, agora):
+        """Carrega relatos novos do banco e expira os que saíram da janela"""
+        if self._raio != _config('DEDUP_RAIO_METROS', 100):
+            self._limpar()
+        limite = agora - janela()
+        novos = RelatorioAlagamento.objects.filter(status='ativo', timestamp__gte=limite)
+        if self._ultimo_id is not None:
+            novos = novos.filter(pk__gt=self._ultimo_id)
+        self._ultimo_id = self._ultimo_id or 0
+        for pk, latitude, longitude, timestamp, severidade in novos.values_list(
+            'id', 'latitude', 'longitude', 'timestamp', 'nivel_severidade'
+        ).order_by():
+            self._inserir(Entrada(pk, float(latitude), float(longitude), timestamp.timestamp(), severidade))
+
+        corte = limite.timestamp()
+        while self._expiracao and self._expiracao[0][0] < corte:
+            _, relatorio_id = heapq.heappop(self._expiracao)
+            self._remover(relatorio_id)
+
+    def adicionar(self, relatorio):
+        with self._lock:
+            if self._ultimo_id is None:
+                return  # Ainda não carregado: entra na primeira sincronização
+            self._inserir(Entrada(
+                relatorio.id, float(relatorio.latitude), float(relatorio.longitude),
+                relatorio.timestamp.timestamp(), relatorio.nivel_severidade,
+            ))
+
+    def descartar(self, relatorio_id):
+        with self._lock:
+            self._remover(relatorio_id)
+
+    def sincronizar(self, agora=None):
+        with self._lock:
+            self._sincronizar(agora or timezone.now())
+
+    def candidatos(self, latitude, longitude, timestamp, severidade, agora=None, sincronizar=True):
+        """
+        Relatos dentro do raio/janela com severidade parecida, do mais próximo
+        ao mais distante. ``sincronizar=False`` pula a leitura dos relatos
+        novos (quem busca vários pontos em seguida sincroniza uma vez antes).
+        """
+        latitude, longitude = float(latitude), float(longitude)
+        epoch = timestamp.timestamp()
+        janela_s = janela().total_seconds()
+        diferenca = _config('DEDUP_DIFERENCA_SEVERIDADE', 1)
+        cos_lat = math.cos(math.radians(latitude))
+
+        with self._lock:
+            if sincronizar or self._ultimo_id is None:
+                self._sincronizar(agora or timezone.now())
+            raio2 = self._raio ** 2
+            encontrados = []
+            for celula in self._celulas_ao_redor(latitude, longitude):
+                for entrada in self._celulas.get(celula, {}).values():
+                    if abs(entrada.epoch - epoch) > janela_s:
+                        continue
+                    if abs(entrada.severidade - severidade) > diferenca:
+                        continue
+                    dy = (entrada.latitude - latitude) * METROS_POR_GRAU
+                    dx = (entrada.longitude - longitude) * METROS_POR_GRAU * cos_lat
+                    distancia2 = dx * dx + dy * dy
+                    if distancia2 <= raio2:
+                        encontrados.append((distancia2, entrada.id))
+        return [relatorio_id for _, relatorio_id in sorted(encontrados)]
+
+
+indice = IndiceRecentes()
+
+
+def mesclar(relatorio, sincronizar=True):
+    """
+    Tenta mesclar um relato ainda não salvo (com ``usuario_id`` definido) em
+    um relato ativo próximo.
+
+    Retorna o relato existente (já atualizado) ou None se o novo relato deve
+    ser gravado normalmente. ``sincronizar`` como em ``IndiceRecentes.candidatos``.
+    """
+    if not _config('DEDUP_ATIVO', True):
+        return None
+
+    timestamp = relatorio.timestamp or timezone.now()
+    for relatorio_id in indice.candidatos(
+        relatorio.latitude, relatorio.longitude, timestamp, relatorio.nivel_severidade,
+        sincronizar=sincronizar,
+    ):
+        existente = RelatorioAlagamento.objects.filter(pk=relatorio_id, status='ativo').first()
+        if existente is None:
+            indice.descartar(relatorio_id)
+            continue
+        # A severidade no índice pode estar desatualizada (mesclagens anteriores)
+        if abs(existente.nivel_severidade - relatorio.nivel_severidade) > _config('DEDUP_DIFERENCA_SEVERIDADE', 1):
+            continue
+
+        alterados = []
+        if relatorio.nivel_severidade > existente.nivel_severidade:
+            existente.nivel_severidade = relatorio.nivel_severidade
+            existente.urgencia_atualizada_em = None
+            alterados += ['nivel_severidade', 'urgencia_atualizada_em']
+        if relatorio.altura_agua_cm and relatorio.altura_agua_cm > (existente.altura_agua_cm or 0):
+            existente.altura_agua_cm = relatorio.altura_agua_cm
+            alterados.append('altura_agua_cm')
+        if relatorio.foto_hash and not existente.foto_hash and not existente.foto:
+            # A foto já passou por fotos.receber: herda o hash (e o arquivo, se processado)
+            existente.foto = relatorio.foto
+            existente.foto_hash = relatorio.foto_hash
+            existente.foto_processada = relatorio.foto_processada
+            alterados += ['foto', 'foto_hash', 'foto_processada']
+        if alterados:
+            existente.save(update_fields=alterados)
+            indice.descartar(existente.id)
+            indice.adicionar(existente)
+
+        # O autor não confirma o próprio relato: o reenvio só completa os dados
+        if existente.usuario_id != relatorio.usuario_id:
+            interacoes.registrar_voto(existente.id, relatorio.usuario_id, 'confirmacao', relatorio.descricao or '')
+        return existente
+    return None
@@ -0,0 +1,327 @@
+"""
+Eventos de Alagamento
+=====================
+
+Agrupa relatos próximos no espaço (``EVENTOS_RAIO_METROS``) e no tempo
+(``EVENTOS_JANELA_HORAS``) em ``EventoAlagamento``, no estilo do DBSCAN:
+um relato com pelo menos ``EVENTOS_MIN_RELATOS - 1`` vizinhos é núcleo e
+puxa os vizinhos para o mesmo evento; relatos sem vizinhos ficam sem evento
+(ruído) até que chegue um relato próximo.
+
+O agrupamento é incremental: só os relatos ainda sem evento são processados,
+junto com os relatos já agrupados próximos deles no espaço e no tempo (que
+podem ser vizinhos). Após um relato novo (``agendar``), a passada se limita
+à vizinhança dos relatos novos: os pendentes a até dois raios e duas
+janelas deles (um pendente só passa a núcleo com um vizinho novo, e então
+puxa os vizinhos dele), de modo que o custo não cresce com o ruído
+acumulado no resto da cidade. Os pontos são distribuídos em uma grade
+(latitude, longitude, tempo) com células do tamanho do raio e da janela, de
+modo que cada ponto só é comparado com as 27 células ao redor. Se um relato
+novo liga dois eventos existentes, eles são fundidos no mais antigo.
+
+Passadas concorrentes (callbacks pós-commit de várias requisições, o
+comando ``agrupar_eventos``, trabalhadores da fila) são serializadas:
+leitura e escrita acontecem na mesma transação, sob
+``pg_advisory_xact_lock`` no PostgreSQL ou uma trava do processo no
+SQLite, então duas passadas não criam o mesmo evento.
+Eventos que ficam sem relatos (fundidos, relatos removidos) são apagados ao
+recalcular os agregados.
+"""
+
+import math
+import threading
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from . import tarefas
+from .models import EventoAlagamento, RelatorioAlagamento
+
+METROS_POR_GRAU = 111_320
+# Chave do pg_advisory_xact_lock que serializa as passadas de agrupamento
+TRAVA_AGRUPAMENTO = 0x45564E54
+
+_local = threading.local()
+_trava_sqlite = threading.Lock()
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def _trava_processo():
+    return _trava_sqlite if connection.vendor == 'sqlite' else nullcontext()
+
+
+def _travar_banco():
+    """Dentro da transação: espera passadas de outros processos (PostgreSQL)"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [TRAVA_AGRUPAMENTO])
+
+
+def _caixa(pontos, metros, segundos):
+    """Filtro de latitude, longitude e tempo: caixa dos pontos ampliada por ``metros`` e ``segundos``"""
+    lat_min = min(p[1] for p in pontos)
+    lat_max = max(p[1] for p in pontos)
+    cos_lat = math.cos(math.radians(max(abs(float(lat_min)), abs(float(lat_max)))))
+    dlat = metros / METROS_POR_GRAU
+    dlon = metros / (METROS_POR_GRAU * cos_lat)
+    folga = timedelta(seconds=segundos)
+    return {
+        'latitude__range': (float(lat_min) - dlat, float(lat_max) + dlat),
+        'longitude__range': (
+            float(min(p[2] for p in pontos)) - dlon, float(max(p[2] for p in pontos)) + dlon
+        ),
+        'timestamp__range': (min(p[3] for p in pontos) - folga, max(p[3] for p in pontos) + folga),
+    }
+
+
+class _UniaoBusca:
+    """Union-find com compressão de caminho sobre índices de pontos"""
+
+    def __init__(self, n):
+        self.pai = list(range(n))
+
+    def raiz(self, i):
+        while self.pai[i] != i:
+            self.pai[i] = self.pai[self.pai[i]]
+            i = self.pai[i]
+        return i
+
+    def unir(self, a, b):
+        ra, rb = self.raiz(a), self.raiz(b)
+        if ra != rb:
+            self.pai[max(ra, rb)] = min(ra, rb)
+
+
+class _Grade:
+    """Grade espaço-temporal para busca de vizinhos em raio/janela fixos"""
+
+    def __init__(self, pontos, raio_metros, janela_segundos):
+        lat_max = max(abs(p[1]) for p in pontos)
+        # Menor cosseno = maior célula em longitude: nenhuma vizinhança escapa
+        self.cos_lat = math.cos(math.radians(lat_max))
+        self.dlat = raio_metros / METROS_POR_GRAU
+        self.dlon = raio_metros / (METROS_POR_GRAU * self.cos_lat)
+        self.dt = janela_segundos
+        self.raio2 = raio_metros ** 2
+        self.pontos = pontos
+        self.celulas = defaultdict(list)
+        for i, ponto in enumerate(pontos):
+            self.celulas[self._celula(ponto)].append(i)
+
+    def _celula(self, ponto):
+        _, lat, lon, ts = ponto[:4]
+        return (math.floor(lat / self.dlat), math.floor(lon / self.dlon), math.floor(ts / self.dt))
+
+    def vizinhos(self, i):
+        _, lat, lon, ts = self.pontos[i][:4]
+        ci, cj, ck = self._celula(self.pontos[i])
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                for dk in (-1, 0, 1):
+                    for j in self.celulas.get((ci + di, cj + dj, ck + dk), ()):
+                        if j == i:
+                            continue
+                        _, lat2, lon2, ts2 = self.pontos[j][:4]
+                        if abs(ts2 - ts) > self.dt:
+                            continue
+                        dy = (lat2 - lat) * METROS_POR_GRAU
+                        dx = (lon2 - lon) * METROS_POR_GRAU * self.cos_lat
+                        if dx * dx + dy * dy <= self.raio2:
+                            yield j
+
+
+def agrupar_pendentes(desde=None, ate=None, relatorio_ids=None):
+    """
+    Agrupa os relatos ativos sem evento com timestamp entre ``desde`` e ``ate``.
+
+    Com ``relatorio_ids`` (relatos novos), só os pendentes na vizinhança
+    deles entram na passada. Retorna contagens de relatos pendentes, relatos
+    agrupados, eventos criados e eventos fundidos.
+    """
+    ate = ate or timezone.now()
+    desde = desde or ate - timedelta(hours=_config('EVENTOS_HORAS_PENDENTES', 24))
+    with _trava_processo(), transaction.atomic():
+        _travar_banco()
+        return _agrupar(desde, ate, relatorio_ids)
+
+
+def _agrupar(desde, ate, relatorio_ids):
+    janela = timedelta(hours=_config('EVENTOS_JANELA_HORAS', 2))
+    raio = _config('EVENTOS_RAIO_METROS', 300)
+    min_relatos = _config('EVENTOS_MIN_RELATOS', 2)
+    resultado = {'pendentes': 0, 'agrupados': 0, 'criados': 0, 'fundidos': 0}
+
+    campos = ('id', 'latitude', 'longitude', 'timestamp', 'bairro_id', 'nivel_severidade')
+    pendentes = (
+        RelatorioAlagamento.objects.select_related(None)
+        .filter(evento__isnull=True, status='ativo', timestamp__range=(desde, ate))
+        .order_by()
+    )
+    if relatorio_ids is not None:
+        novos_relatos = list(pendentes.filter(pk__in=relatorio_ids).values_list(*campos))
+        if not novos_relatos:
+            return resultado
+        pendentes = pendentes.filter(**_caixa(novos_relatos, 2 * raio, 2 * janela.total_seconds()))
+    pendentes = list(pendentes.values_list(*campos))
+    resultado['pendentes'] = len(pendentes)
+    if not pendentes:
+        return resultado
+
+    # Já agrupados que podem ser vizinhos de algum pendente
+    agrupados = (
+        RelatorioAlagamento.objects.select_related(None)
+        .filter(evento__isnull=False, status='ativo', **_caixa(pendentes, raio, janela.total_seconds()))
+        .values_list('id', 'latitude', 'longitude', 'timestamp', 'evento_id')
+        .order_by()
+    )
+
+    # (id, lat, lon, epoch, extra): extra = relato pendente ou evento_id
+    pontos = [(p[0], float(p[1]), float(p[2]), p[3].timestamp(), p) for p in pendentes]
+    n_pendentes = len(pontos)
+    pontos += [(a[0], float(a[1]), float(a[2]), a[3].timestamp(), a[4]) for a in agrupados]
+
+    uniao = _UniaoBusca(len(pontos))
+    primeiro_do_evento = {}
+    for i in range(n_pendentes, len(pontos)):
+        evento_id = pontos[i][4]
+        uniao.unir(primeiro_do_evento.setdefault(evento_id, i), i)
+
+    grade = _Grade(pontos, raio, janela.total_seconds())
+    for i in range(n_pendentes):
+        vizinhos = list(grade.vizinhos(i))
+        if len(vizinhos) + 1 >= min_relatos:
+            for j in vizinhos:
+                uniao.unir(i, j)
+        else:
+            # Ponto de borda: entra no evento de um vizinho já agrupado
+            for j in vizinhos:
+                if j >= n_pendentes:
+                    uniao.unir(i, j)
+                    break
+
+    componentes = defaultdict(list)
+    for i in range(len(pontos)):
+        componentes[uniao.raiz(i)].append(i)
+
+    atribuicoes = {}   # evento_id -> ids de relatos pendentes
+    novos = []         # (EventoAlagamento, ids de relatos pendentes)
+    fusoes = {}        # evento_id absorvido -> evento_id destino
+    for membros in componentes.values():
+        relatos = [pontos[i][4] for i in membros if i < n_pendentes]
+        if not relatos:
+            continue
+        eventos = sorted({pontos[i][4] for i in membros if i >= n_pendentes})
+        ids = [r[0] for r in relatos]
+        if eventos:
+            alvo = eventos[0]
+            atribuicoes.setdefault(alvo, []).extend(ids)
+            fusoes.update((outro, alvo) for outro in eventos[1:])
+        elif len(relatos) >= min_relatos:
+            primeiro = min(relatos, key=lambda r: r[3])
+            novos.append((EventoAlagamento(
+                bairro_id=primeiro[4],
+                inicio=primeiro[3],
+                fim=max(r[3] for r in relatos),
+                latitude_min=min(r[1] for r in relatos),
+                latitude_max=max(r[1] for r in relatos),
+                longitude_min=min(r[2] for r in relatos),
+                longitude_max=max(r[2] for r in relatos),
+                total_relatos=len(relatos),
+                severidade_maxima=max(r[5] for r in relatos),
+            ), ids))
+
+    if novos:
+        EventoAlagamento.objects.bulk_create([evento for evento, _ in novos])
+        for evento, ids in novos:
+            atribuicoes[evento.pk] = ids
+    for origem, destino in fusoes.items():
+        RelatorioAlagamento.objects.filter(evento_id=origem).update(evento_id=destino)
+    if fusoes:
+        EventoAlagamento.objects.filter(pk__in=fusoes).delete()
+    for evento_id, ids in atribuicoes.items():
+        resultado['agrupados'] += RelatorioAlagamento.objects.filter(
+            id__in=ids, evento__isnull=True
+        ).update(evento_id=evento_id)
+    recalcular_eventos(set(atribuicoes) - set(fusoes), ate)
+
+    resultado.update(criados=len(novos), fundidos=len(fusoes))
+    return resultado
+
+
+def recalcular_eventos(evento_ids, agora=None):
+    """
+    Atualiza extensão, total e severidade máxima dos eventos a partir dos
+    relatos (uma query); eventos sem nenhum relato são apagados.
+    """
+    if not evento_ids:
+        return 0
+    agora = agora or timezone.now()
+    limite_ativo = agora - timedelta(hours=_config('EVENTOS_JANELA_HORAS', 2))
+    agregados = {
+        linha['evento_id']: linha
+        for linha in (
+            RelatorioAlagamento.objects
+            .filter(evento_id__in=evento_ids)
+            .values('evento_id')
+            .annotate(
+                inicio=Min('timestamp'), fim=Max('timestamp'),
+                latitude_min=Min('latitude'), latitude_max=Max('latitude'),
+                longitude_min=Min('longitude'), longitude_max=Max('longitude'),
+                total_relatos=Count('id'), severidade_maxima=Max('nivel_severidade'),
+            )
+            .order_by()
+        )
+    }
+    EventoAlagamento.objects.filter(pk__in=set(evento_ids) - set(agregados)).delete()
+    eventos = list(EventoAlagamento.objects.filter(pk__in=agregados))
+    campos = ['inicio', 'fim', 'latitude_min', 'latitude_max', 'longitude_min',
+              'longitude_max', 'total_relatos', 'severidade_maxima']
+    for evento in eventos:
+        for campo in campos:
+            setattr(evento, campo, agregados[evento.pk][campo])
+        evento.ativo = evento.fim >= limite_ativo
+    EventoAlagamento.objects.bulk_update(eventos, campos + ['ativo'])
+    return len(eventos)
+
+
+def encerrar_eventos(agora=None):
+    """Desativa eventos sem relatos novos há mais que a janela de tempo"""
+    agora = agora or timezone.now()
+    limite = agora - timedelta(hours=_config('EVENTOS_JANELA_HORAS', 2))
+    return EventoAlagamento.objects.filter(ativo=True, fim__lt=limite).update(ativo=False)
+
+
+def agendar(relatorio_ids):
+    """
+    Agrupa os relatos novos (e os pendentes vizinhos) após o commit da
+    transação atual.
+
+    Relatos de vários saves na mesma thread são acumulados e agrupados em
+    uma passada pelo primeiro callback executado; os seguintes encontram o
+    conjunto vazio. Com a fila de tarefas ativa, vira uma tarefa
+    ``agrupar_eventos`` com os ids.
+    """
+    relatorio_ids = sorted(relatorio_ids)
+    if tarefas.ativa():
+        tarefas.enfileirar('agrupar_eventos', {'relatorio_ids': relatorio_ids})
+        return
+    pendentes = getattr(_local, 'relatorios', None)
+    if pendentes is None:
+        pendentes = _local.relatorios = set()
+    pendentes.update(relatorio_ids)
+    transaction.on_commit(_processar)
+
+
+def _processar():
+    relatorio_ids = getattr(_local, 'relatorios', None)
+    _local.relatorios = None
+    if relatorio_ids:
+        agrupar_pendentes(relatorio_ids=relatorio_ids)
@@ -2,7 +2,9 @@
 Formulários para o app Dashboard.
 """
 from django import forms
-from .models import RelatorioAlagamento
+from . import fotos
+from .localizacao import resolvedor
+from .models import Bairro, RelatorioAlagamento
 
 class RelatorioAlagamentoForm(forms.ModelForm):
     """
@@ -27,7 +29,7 @@ class RelatorioAlagamentoForm(forms.ModelForm):
         labels = {
             'latitude': 'Latitude',
             'longitude': 'Longitude',
-            'bairro': 'Bairro Afetado',
+            'bairro': 'Bairro Afetado (opcional)',
             'endereco_aproximado': 'Endereço Aproximado',
             'nivel_severidade': 'Nível de Severidade',
             'descricao': 'Descrição Adicional',
@@ -40,4 +42,32 @@ class RelatorioAlagamentoForm(forms.ModelForm):
         # Adicionar um botão ou funcionalidade JS para obter a localização
         self.fields['latitude'].help_text = 'Você pode obter as coordenadas clicando no mapa ou usando um botão.'
         self.fields['longitude'].help_text = 'As coordenadas serão preenchidas automaticamente.'
+        # Bairro é identificado pelas coordenadas quando não informado
+        self.fields['bairro'].required = False
+        self.fields['bairro'].empty_label = 'Detectar pela localização'
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        latitude = cleaned_data.get('latitude')
+        longitude = cleaned_data.get('longitude')
+        if latitude is None or longitude is None:
+            return cleaned_data
+        
+        bairro = cleaned_data.get('bairro')
+        if bairro is None:
+            encontrado = resolvedor.resolver(latitude, longitude)
+            if encontrado is None:
+                self.add_error('bairro', 'Não foi possível identificar o bairro pela localização. Selecione-o na lista.')
+            else:
+                # Instância montada do catálogo, sem nova consulta
+                cleaned_data['bairro'] = Bairro(**encontrado._asdict())
+        else:
+            sugerido = resolvedor.sugerir(bairro.id, latitude, longitude)
+            if sugerido is not None:
+                self.add_error('bairro', f'As coordenadas ficam em {sugerido.nome} ({sugerido.cidade}), não em {bairro.nome}.')
+        return cleaned_data
 
+    def save(self, commit=True):
+        # A foto enviada vai para o pipeline (dashboard.fotos), não direto para MEDIA_ROOT
+        fotos.receber(self.instance)
+        return super().save(commit)
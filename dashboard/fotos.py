@@ -0,0 +1,242 @@
+"""
+Pipeline de Fotos dos Relatos
+=============================
+
+O upload não passa mais inteiro pela memória nem vai direto para
+``MEDIA_ROOT`` como chegou:
+
+1. ``UploadComHash`` (``FILE_UPLOAD_HANDLERS``) grava o arquivo em disco em
+   blocos, calculando o SHA-256 durante o recebimento;
+2. ``receber`` (chamado por ``RelatorioAlagamentoForm.save``) usa o hash
+   como identidade: se essa foto já foi processada, o relato só aponta para
+   ela; senão o arquivo temporário é movido (sem cópia) para
+   ``FOTOS_PENDENTES_DIR``, fora da área servida, e o relato guarda
+   ``foto_hash``;
+3. após o commit do relato (``dashboard.signals``), ``agendar`` manda o hash
+   para um pool de ``FOTOS_WORKERS`` threads (com ``TAREFAS_FILA_ATIVA``,
+   para a tarefa ``processar_foto`` do ``run_worker``), que gera as
+   variantes JPEG sem EXIF (a orientação é aplicada antes) e aponta ``foto``
+   de todos os relatos com esse hash para a versão processada.
+
+Variantes, em ``relatos/<hh>/<hash>*.jpg`` (nome pelo conteúdo, então uploads
+idênticos compartilham os arquivos): a foto com lado maior até
+``FOTOS_LADO_MAXIMO``, ``_previa`` (página do relato) e ``_miniatura``
+(listas e mapa). JPEGs são decodificados já reduzidos (``Image.draft``)
+para as variantes menores.
+
+``processar_fotos`` reprocessa pendências (processo encerrado antes do pool
+terminar) e fotos antigas, gravadas antes do pipeline.
+"""
+
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.move import file_move_safe
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import close_old_connections, transaction
+
+from utils.data_processing.data_sources import data_dir
+
+from . import tarefas
+from .models import RelatorioAlagamento
+
+logger = logging.getLogger(__name__)
+
+PASTA = 'relatos'
+QUALIDADE_JPEG = 82
+BLOCO_LEITURA = 1024 * 1024
+
+_lock = threading.Lock()
+_pool = None
+_em_andamento = set()
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def variantes():
+    """Sufixo do arquivo -> lado maior em pixels"""
+    return {
+        '': _config('FOTOS_LADO_MAXIMO', 2048),
+        '_previa': _config('FOTOS_LADO_PREVIA', 800),
+        '_miniatura': _config('FOTOS_LADO_MINIATURA', 200),
+    }
+
+
+def nome_arquivo(foto_hash, sufixo=''):
+    return f"{PASTA}/{foto_hash[:2]}/{foto_hash}{sufixo}.jpg"
+
+
+def pendentes_dir():
+    caminho = _config('FOTOS_PENDENTES_DIR', None)
+    return Path(caminho) if caminho else data_dir('temp') / 'fotos_pendentes'
+
+
+class UploadComHash(TemporaryFileUploadHandler):
+    """Grava o upload em arquivo temporário, bloco a bloco, calculando o SHA-256"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._hash.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        arquivo = super().file_complete(file_size)
+        arquivo.sha256 = self._hash.hexdigest()
+        return arquivo
+
+
+def _hash_upload(upload):
+    sha = getattr(upload, 'sha256', None)
+    if sha:
+        return sha
+    digest = hashlib.sha256()
+    for bloco in upload.chunks(BLOCO_LEITURA):
+        digest.update(bloco)
+    return digest.hexdigest()
+
+
+def receber(relatorio):
+    """
+    Tira do relato (ainda não salvo) a foto recém-enviada e a deixa pendente
+    de processamento, identificada pelo hash do conteúdo.
+    """
+    arquivo = relatorio.foto
+    if not arquivo or arquivo._committed:
+        return
+    upload = arquivo.file
+    foto_hash = _hash_upload(upload)
+    relatorio.foto_hash = foto_hash
+
+    if default_storage.exists(nome_arquivo(foto_hash)):
+        # Mesma foto já enviada antes: reaproveita as variantes
+        relatorio.foto = nome_arquivo(foto_hash)
+        relatorio.foto_processada = True
+        return
+
+    relatorio.foto = None
+    relatorio.foto_processada = False
+    destino = pendentes_dir() / foto_hash
+    if destino.exists():
+        return
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    if hasattr(upload, 'temporary_file_path'):
+        file_move_safe(upload.temporary_file_path(), destino, allow_overwrite=True)
+    else:
+        upload.seek(0)
+        with open(destino, 'wb') as saida:
+            for bloco in upload.chunks(BLOCO_LEITURA):
+                saida.write(bloco)
+
+
+def _salvar_jpeg(imagem, nome):
+    from io import BytesIO
+
+    buffer = BytesIO()
+    # Sem ``exif=``: metadados (GPS, aparelho) não são copiados
+    imagem.save(buffer, format='JPEG', quality=QUALIDADE_JPEG, optimize=True, progressive=True)
+    if default_storage.exists(nome):
+        default_storage.delete(nome)
+    default_storage.save(nome, ContentFile(buffer.getvalue()))
+
+
+def gerar_variantes(origem, foto_hash):
+    """Arquivo original -> variantes JPEG sem EXIF no storage"""
+    from PIL import Image, ImageOps
+
+    for sufixo, lado in sorted(variantes().items(), key=lambda item: item[1]):
+        with Image.open(origem) as imagem:
+            # JPEG: decodifica já em escala reduzida (bem mais rápido para miniaturas)
+            imagem.draft('RGB', (lado, lado))
+            imagem = ImageOps.exif_transpose(imagem)
+            if imagem.mode != 'RGB':
+                imagem = imagem.convert('RGB')
+            imagem.thumbnail((lado, lado), Image.LANCZOS)
+            _salvar_jpeg(imagem, nome_arquivo(foto_hash, sufixo))
+
+
+def processar(foto_hash):
+    """Gera as variantes de uma foto pendente e atualiza os relatos; retorna quantos"""
+    origem = pendentes_dir() / foto_hash
+    if not default_storage.exists(nome_arquivo(foto_hash)):
+        if not origem.exists():
+            logger.warning("Foto %s pendente sem arquivo de origem", foto_hash)
+            return 0
+        gerar_variantes(origem, foto_hash)
+    atualizados = RelatorioAlagamento.objects.filter(
+        foto_hash=foto_hash, foto_processada=False
+    ).update(foto=nome_arquivo(foto_hash), foto_processada=True)
+    origem.unlink(missing_ok=True)
+    return atualizados
+
+
+def _processar_no_pool(foto_hash):
+    close_old_connections()
+    try:
+        processar(foto_hash)
+    except Exception:
+        logger.exception("Falha ao processar a foto %s", foto_hash)
+    finally:
+        with _lock:
+            _em_andamento.discard(foto_hash)
+        close_old_connections()
+
+
+def _submeter(foto_hash):
+    global _pool
+    with _lock:
+        if foto_hash in _em_andamento:
+            return
+        _em_andamento.add(foto_hash)
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=_config('FOTOS_WORKERS', 2), thread_name_prefix='fotos'
+            )
+    _pool.submit(_processar_no_pool, foto_hash)
+
+
+def agendar(foto_hash):
+    """Processa a foto no pool após o commit da transação atual"""
+    if not _config('FOTOS_PROCESSAR_AO_SALVAR', True):
+        return
+    if tarefas.ativa():
+        tarefas.enfileirar('processar_foto', {'foto_hash': foto_hash}, chave=f'processar_foto:{foto_hash}')
+    else:
+        transaction.on_commit(lambda: _submeter(foto_hash))
+
+
+def importar_antigas(limite=None):
+    """
+    Fotos gravadas antes do pipeline (``foto`` sem ``foto_hash``): copia o
+    arquivo para as pendências, pelo hash. Retorna os hashes a processar.
+    """
+    hashes = set()
+    relatos = RelatorioAlagamento.objects.select_related(None).filter(foto_hash='').exclude(foto='')
+    for pk, nome in relatos.values_list('id', 'foto')[:limite]:
+        if not default_storage.exists(nome):
+            logger.warning("Foto %s do relato %s não existe no storage", nome, pk)
+            continue
+        digest = hashlib.sha256()
+        with default_storage.open(nome, 'rb') as arquivo:
+            for bloco in arquivo.chunks(BLOCO_LEITURA):
+                digest.update(bloco)
+        foto_hash = digest.hexdigest()
+        destino = pendentes_dir() / foto_hash
+        if not destino.exists():
+            destino.parent.mkdir(parents=True, exist_ok=True)
+            with default_storage.open(nome, 'rb') as arquivo, open(destino, 'wb') as saida:
+                for bloco in arquivo.chunks(BLOCO_LEITURA):
+                    saida.write(bloco)
+        RelatorioAlagamento.objects.filter(pk=pk).update(foto_hash=foto_hash, foto_processada=False)
+        hashes.add(foto_hash)
+    return hashes
@@ -0,0 +1,231 @@
+"""
+Ingestão de Relatos em Lote
+===========================
+
+Caminho de escrita para picos de envio (formulário e API JSON): em vez de
+uma transação por relato, os relatos já validados entram em uma fila do
+processo e uma única thread escritora os grava em lotes de até
+``INGESTAO_LOTE_MAXIMO``, um ``bulk_create`` e um commit por lote (group
+commit). No SQLite, onde cada transação disputa a trava de escrita do banco
+inteiro, isso troca centenas de disputas por uma por lote.
+
+- ``bulk_create`` não dispara ``post_save``: a manutenção que o sinal faz
+  por relato (contadores, cubo, busca, alertas, eventos, spam) é feita uma
+  vez por lote (``signals.relatorios_criados``), na mesma transação. A
+  urgência inicial é calculada antes da inserção, como em
+  ``RelatorioAlagamento.save``.
+- Durabilidade: no modo durável (``INGESTAO_DURAVEL``, padrão) quem enviou
+  espera o commit do lote antes de responder; se ele não vier em
+  ``INGESTAO_TIMEOUT_S``, ``enviar`` levanta ``TempoEsgotado`` (o relato
+  segue na fila, mas a gravação não está confirmada) e um erro da gravação
+  é repassado. No modo assíncrono responde ao enfileirar (o relato se perde
+  se o processo cair antes do commit). A foto enviada já foi movida para
+  as pendências de ``dashboard.fotos`` antes de enfileirar, então não
+  prende a requisição.
+- Contrapressão: a fila tem no máximo ``INGESTAO_FILA_MAXIMA`` relatos;
+  cheia por mais de ``INGESTAO_ESPERA_FILA_S``, ``enviar`` levanta
+  ``FilaCheia`` e as views respondem 503 com ``Retry-After``.
+- Se um lote falhar, cada relato é regravado sozinho, para que um relato
+  inválido não derrube os outros.
+
+Dentro de uma transação já aberta (ou com ``INGESTAO_FILA_ATIVA = False``)
+o relato é gravado na hora, na thread de quem chamou: a thread escritora
+usa outra conexão e não enxergaria a transação em andamento.
+
+O id do ``UsuarioApp`` fica na sessão (``usuario_app_id``), evitando o
+``get_or_create`` a cada envio.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from . import deduplicacao, signals
+from .interacoes import trava_escrita
+from .models import RelatorioAlagamento, UsuarioApp
+
+logger = logging.getLogger(__name__)
+
+CHAVE_SESSAO = 'usuario_app'
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+class FilaCheia(Exception):
+    """A fila de ingestão não abriu espaço a tempo (contrapressão)"""
+
+
+class TempoEsgotado(Exception):
+    """Modo durável: o lote do relato não foi gravado dentro do prazo (segue na fila)"""
+
+    def __init__(self, pedido, timeout):
+        super().__init__(f"Gravação do relato não confirmada em {timeout}s")
+        self.pedido = pedido
+
+
+def usuario_app_id(request):
+    """Id do ``UsuarioApp`` do usuário logado, guardado na sessão"""
+    guardado = request.session.get(CHAVE_SESSAO)
+    if guardado and guardado[0] == request.user.pk:
+        return guardado[1]
+    usuario_app, _ = UsuarioApp.objects.get_or_create(usuario=request.user)
+    request.session[CHAVE_SESSAO] = [request.user.pk, usuario_app.id]
+    return usuario_app.id
+
+
+class Pedido:
+    """Um relato na fila e o aviso de que seu lote foi gravado"""
+
+    def __init__(self, relatorio):
+        self.relatorio = relatorio
+        self.erro = None
+        self._gravado = threading.Event()
+
+    def concluir(self, erro=None):
+        self.erro = erro
+        self._gravado.set()
+
+    def aguardar(self, timeout=None):
+        """True quando o relato foi gravado; False se o tempo acabou. Repassa erros da gravação"""
+        if not self._gravado.wait(timeout):
+            return False
+        if self.erro is not None:
+            raise self.erro
+        return True
+
+
+def gravar_lote(relatorios):
+    """Insere os relatos em uma transação e dispara os sinais de criação de cada um"""
+    agora = timezone.now()
+    # Confiabilidade dos autores para a urgência inicial, numa consulta só
+    usuarios = UsuarioApp.objects.in_bulk({r.usuario_id for r in relatorios})
+    for relatorio in relatorios:
+        relatorio.usuario = usuarios[relatorio.usuario_id]
+        if relatorio.urgencia_atualizada_em is None:
+            relatorio.urgencia_score = relatorio.nivel_urgencia
+            relatorio.urgencia_atualizada_em = agora
+
+    with trava_escrita(), transaction.atomic():
+        RelatorioAlagamento.objects.bulk_create(relatorios)
+        signals.relatorios_criados(relatorios)
+    for relatorio in relatorios:
+        deduplicacao.indice.adicionar(relatorio)
+
+
+class FilaIngestao:
+    """Fila limitada de relatos com uma thread que grava em lotes"""
+
+    def __init__(self):
+        self._fila = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.lotes = 0
+        self.gravados = 0
+
+    def _iniciar(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._fila = queue.Queue(maxsize=_config('INGESTAO_FILA_MAXIMA', 1000))
+            self._thread = threading.Thread(target=self._executar, name='ingestao-relatos', daemon=True)
+            self._thread.start()
+        atexit.register(self.encerrar)
+
+    def pendentes(self):
+        return self._fila.qsize() if self._fila is not None else 0
+
+    def enfileirar(self, relatorio):
+        if self._thread is None:
+            self._iniciar()
+        pedido = Pedido(relatorio)
+        try:
+            self._fila.put(pedido, timeout=_config('INGESTAO_ESPERA_FILA_S', 0.5))
+        except queue.Full:
+            raise FilaCheia(f"Fila de ingestão cheia ({self._fila.maxsize} relatos)")
+        return pedido
+
+    def _proximo_lote(self, primeiro):
+        lote = [primeiro]
+        maximo = _config('INGESTAO_LOTE_MAXIMO', 100)
+        prazo = time.monotonic() + _config('INGESTAO_ESPERA_MS', 5) / 1000
+        while len(lote) < maximo:
+            try:
+                # O que já está na fila entra sem espera; depois, só até o prazo
+                lote.append(self._fila.get(timeout=max(0, prazo - time.monotonic())))
+            except queue.Empty:
+                break
+        return lote
+
+    def _gravar(self, pedidos):
+        pedidos = [p for p in pedidos if p is not None]
+        if not pedidos:
+            return
+        try:
+            gravar_lote([p.relatorio for p in pedidos])
+        except Exception as e:  # A thread escritora não pode morrer com quem espera por ela
+            if len(pedidos) > 1:
+                logger.warning("Lote de %d relatos falhou (%s); gravando um a um", len(pedidos), e)
+                for pedido in pedidos:
+                    # Blocos já inseridos antes da falha deixaram o pk preenchido
+                    pedido.relatorio.pk = None
+                    self._gravar([pedido])
+                return
+            logger.exception("Falha ao gravar relato %s", pedidos[0].relatorio.id_relato)
+            pedidos[0].concluir(e)
+            return
+        self.lotes += 1
+        self.gravados += len(pedidos)
+        for pedido in pedidos:
+            pedido.concluir()
+
+    def _executar(self):
+        while True:
+            primeiro = self._fila.get()
+            lote = self._proximo_lote(primeiro)
+            close_old_connections()
+            self._gravar(lote)
+            if None in lote:
+                return
+
+    def encerrar(self, timeout=10):
+        """Grava o que estiver na fila e para a thread"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._fila.put(None)
+        self._thread.join(timeout)
+
+
+fila = FilaIngestao()
+
+
+def enviar(relatorio, duravel=None):
+    """
+    Grava um relato validado pelo caminho em lote.
+
+    Retorna o ``Pedido``; no modo durável só retorna depois do commit,
+    repassando o erro da gravação, e levanta ``TempoEsgotado`` se o commit
+    não vier em ``INGESTAO_TIMEOUT_S``. Levanta ``FilaCheia`` se a fila não
+    abrir espaço a tempo.
+    """
+    if duravel is None:
+        duravel = _config('INGESTAO_DURAVEL', True)
+    if not _config('INGESTAO_FILA_ATIVA', True) or connection.in_atomic_block:
+        pedido = Pedido(relatorio)
+        gravar_lote([relatorio])
+        pedido.concluir()
+        return pedido
+
+    pedido = fila.enfileirar(relatorio)
+    if duravel:
+        timeout = _config('INGESTAO_TIMEOUT_S', 10)
+        if not pedido.aguardar(timeout):
+            raise TempoEsgotado(pedido, timeout)
+    return pedido
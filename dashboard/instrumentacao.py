@@ -0,0 +1,204 @@
+"""
+Instrumentação de Requisições
+=============================
+
+Middleware que mede, por requisição: tempo total, número de queries e tempo
+de SQL, tempo de renderização de templates e tamanho da resposta. As medições
+são marcadas com o nome da view, registradas no logger
+``dashboard.performance`` e acumuladas em janelas móveis por view, das quais
+saem os percentis expostos em ``api/metricas/`` (somente staff).
+
+Queries com o mesmo "formato" (SQL com parâmetros e listas IN normalizados)
+repetidas muitas vezes na mesma requisição são sinalizadas como N+1.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template as DjangoTemplate
+
+logger = logging.getLogger('dashboard.performance')
+
+_medicao_atual = ContextVar('medicao_atual', default=None)
+
+_RE_LISTA_IN = re.compile(r'IN \((?:%s|\?)(?:, (?:%s|\?))*\)')
+_RE_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def formato_sql(sql):
+    """Normaliza um SQL para agrupar queries iguais com parâmetros diferentes"""
+    sql = _RE_LISTA_IN.sub('IN (...)', sql)
+    return _RE_LITERAL.sub('?', sql)
+
+
+class MedicaoRequisicao:
+    """Acumulador de métricas de uma requisição"""
+
+    __slots__ = ('queries', 'tempo_sql', 'tempo_template', 'formatos')
+
+    def __init__(self):
+        self.queries = 0
+        self.tempo_sql = 0.0
+        self.tempo_template = 0.0
+        self.formatos = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """Wrapper de execução de SQL (connection.execute_wrapper)"""
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tempo_sql += time.perf_counter() - inicio
+            self.queries += 1
+            self.formatos[formato_sql(sql)] += 1
+
+    def suspeitas_n_mais_1(self, limiar):
+        return [(formato, n) for formato, n in self.formatos.most_common() if n >= limiar]
+
+
+def _instrumentar_templates():
+    """Envolve Template.render do backend Django para medir renderização (uma vez)"""
+    original = DjangoTemplate.render
+    if getattr(original, '_instrumentado', False):
+        return
+
+    def render(self, context=None, request=None):
+        medicao = _medicao_atual.get()
+        if medicao is None:
+            return original(self, context, request)
+        inicio = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            medicao.tempo_template += time.perf_counter() - inicio
+
+    render._instrumentado = True
+    DjangoTemplate.render = render
+
+
+class JanelaMetricas:
+    """Janela móvel de medições por view, com percentis sob demanda"""
+
+    CAMPOS = ('total_ms', 'sql_ms', 'queries', 'template_ms', 'bytes')
+
+    def __init__(self, tamanho=500):
+        self.tamanho = tamanho
+        self._lock = threading.Lock()
+        self._amostras = defaultdict(lambda: deque(maxlen=self.tamanho))
+        self._contagem = Counter()
+        self._n_mais_1 = Counter()
+
+    def registrar(self, view, amostra, n_mais_1=False):
+        with self._lock:
+            self._amostras[view].append(amostra)
+            self._contagem[view] += 1
+            if n_mais_1:
+                self._n_mais_1[view] += 1
+
+    @staticmethod
+    def _percentis(valores):
+        ordenados = sorted(valores)
+        ultimo = len(ordenados) - 1
+        return {
+            f'p{p}': round(ordenados[round(p / 100 * ultimo)], 3)
+            for p in (50, 90, 99)
+        }
+
+    def resumo(self):
+        with self._lock:
+            copia = {view: list(amostras) for view, amostras in self._amostras.items()}
+            contagem = dict(self._contagem)
+            n_mais_1 = dict(self._n_mais_1)
+
+        resumo = {}
+        for view, amostras in copia.items():
+            resumo[view] = {
+                'requisicoes': contagem[view],
+                'janela': len(amostras),
+                'requisicoes_n_mais_1': n_mais_1.get(view, 0),
+                **{
+                    campo: self._percentis([a[i] for a in amostras])
+                    for i, campo in enumerate(self.CAMPOS)
+                },
+            }
+        return resumo
+
+    def limpar(self):
+        with self._lock:
+            self._amostras.clear()
+            self._contagem.clear()
+            self._n_mais_1.clear()
+
+
+janela = JanelaMetricas(_config('INSTRUMENTACAO_JANELA', 500))
+
+
+class InstrumentacaoMiddleware:
+    """Mede cada requisição e alimenta o log e a janela de métricas"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.ativo = _config('INSTRUMENTACAO_ATIVA', True)
+        self.limiar_n_mais_1 = _config('INSTRUMENTACAO_LIMIAR_N_MAIS_1', 5)
+        self.limiar_lento_ms = _config('INSTRUMENTACAO_LIMIAR_LENTO_MS', 500)
+        if self.ativo:
+            _instrumentar_templates()
+
+    def __call__(self, request):
+        if not self.ativo:
+            return self.get_response(request)
+
+        medicao = MedicaoRequisicao()
+        token = _medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(medicao))
+                response = self.get_response(request)
+        finally:
+            _medicao_atual.reset(token)
+
+        total_ms = (time.perf_counter() - inicio) * 1000
+        self.registrar(request, response, medicao, total_ms)
+        return response
+
+    def registrar(self, request, response, medicao, total_ms):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'sem_rota'
+        sql_ms = medicao.tempo_sql * 1000
+        template_ms = medicao.tempo_template * 1000
+        tamanho = 0 if response.streaming else len(response.content)
+        suspeitas = medicao.suspeitas_n_mais_1(self.limiar_n_mais_1)
+
+        janela.registrar(
+            view,
+            (total_ms, sql_ms, medicao.queries, template_ms, tamanho),
+            n_mais_1=bool(suspeitas),
+        )
+
+        response['Server-Timing'] = (
+            f'total;dur={total_ms:.1f}, db;dur={sql_ms:.1f};desc="{medicao.queries} queries", '
+            f'tpl;dur={template_ms:.1f}'
+        )
+
+        nivel = logging.WARNING if total_ms >= self.limiar_lento_ms else logging.INFO
+        logger.log(
+            nivel,
+            "%s %s view=%s status=%s total=%.1fms sql=%.1fms queries=%d template=%.1fms bytes=%d",
+            request.method, request.path, view, response.status_code,
+            total_ms, sql_ms, medicao.queries, template_ms, tamanho,
+        )
+        for formato, repeticoes in suspeitas:
+            logger.warning("Possível N+1 em view=%s: %dx %s", view, repeticoes, formato[:300])
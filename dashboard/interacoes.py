@@ -0,0 +1,193 @@
+"""
+Confirmações e Negações de Relatos
+==================================
+
+Registro de votos (confirmação/negação) seguro sob concorrência:
+
+- a interação é gravada com ``INSERT ... ON CONFLICT DO NOTHING RETURNING id``
+  sobre a restrição única (relatorio, usuario, tipo), sem consultar antes:
+  duas requisições iguais simultâneas resultam em uma linha e um incremento;
+- um voto oposto do mesmo usuário é removido (trocar de ideia);
+- os contadores do relatório são ajustados na mesma transação, em um único
+  ``UPDATE`` com ``F()``. Toda transação toca primeiro as linhas de
+  interação do usuário e por último a linha do relatório, sempre na mesma
+  ordem, o que evita deadlocks mesmo com centenas de votos no mesmo relato.
+
+``registrar_votos`` grava vários votos do mesmo usuário de uma vez
+(sincronização de clientes offline); ``registrar_voto`` é o caso de um só.
+
+No SQLite (um escritor por vez no banco inteiro) as escritas deste módulo
+são serializadas por uma trava do processo, para que threads concorrentes
+esperem a vez em vez de falhar com "database is locked".
+"""
+
+import threading
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import alteracoes, busca, contadores, spam
+from .models import InteracaoRelatorio, RelatorioAlagamento
+
+TIPOS_VOTO = ('confirmacao', 'negacao')
+OPOSTO = {'confirmacao': 'negacao', 'negacao': 'confirmacao'}
+# Linhas por INSERT em lote (6 parâmetros cada; abaixo do limite de variáveis do SQLite)
+BLOCO_INSERCAO = 150
+
+# Reentrante: a sincronização em lote grava a mesclagem (que vota) sob a mesma trava
+_trava_sqlite = threading.RLock()
+
+
+def trava_escrita():
+    """
+    Trava das escritas de votos e relatos no SQLite (contexto vazio nos
+    demais bancos); quem grava relatos junto com votos (ingestão,
+    sincronização) entra por ela antes de abrir a transação.
+    """
+    return _trava_sqlite if connection.vendor == 'sqlite' else nullcontext()
+
+
+def _inserir_lote_se_ausente(usuario_id, votos):
+    """
+    Insere as interações ``(relatorio_id, tipo, comentario)`` do usuário que
+    ainda não existirem, em um INSERT por bloco; retorna as criadas, como
+    ``(id, relatorio_id, tipo)``.
+    """
+    meta = InteracaoRelatorio._meta
+    colunas = ['relatorio_id', 'usuario_id', 'tipo', 'comentario', 'timestamp', 'relevante']
+    agora = meta.get_field('timestamp').get_db_prep_value(timezone.now(), connection)
+    linhas = [[relatorio_id, usuario_id, tipo, comentario, agora, True] for relatorio_id, tipo, comentario in votos]
+    q = connection.ops.quote_name
+
+    if connection.vendor in ('postgresql', 'sqlite'):
+        criadas = []
+        marcadores = f"({', '.join(['%s'] * len(colunas))})"
+        for inicio in range(0, len(linhas), BLOCO_INSERCAO):
+            bloco = linhas[inicio:inicio + BLOCO_INSERCAO]
+            sql = (
+                f"INSERT INTO {q(meta.db_table)} ({', '.join(map(q, colunas))}) "
+                f"VALUES {', '.join([marcadores] * len(bloco))} "
+                f"ON CONFLICT ({q('relatorio_id')}, {q('usuario_id')}, {q('tipo')}) DO NOTHING "
+                f"RETURNING {q('id')}, {q('relatorio_id')}, {q('tipo')}"
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [valor for linha in bloco for valor in linha])
+                criadas += [tuple(linha) for linha in cursor.fetchall()]
+        return criadas
+
+    # Outros bancos: o savepoint isola a violação de unicidade, uma linha por vez
+    criadas = []
+    for linha in linhas:
+        try:
+            with transaction.atomic():
+                pk = InteracaoRelatorio.objects.bulk_create([
+                    InteracaoRelatorio(**dict(zip(colunas[:4], linha[:4])))
+                ])[0].pk
+        except IntegrityError:
+            continue
+        criadas.append((pk, linha[0], linha[2]))
+    return criadas
+
+
+def _remover_lote(usuario_id, pares):
+    """
+    DELETE direto (sem sinais) das interações ``(relatorio_id, tipo)`` do
+    usuário; retorna as removidas de fato, como
+    ``(id, relatorio_id, tipo, relevante, comentario)``.
+    """
+    if not pares:
+        return []
+    meta = InteracaoRelatorio._meta
+    q = connection.ops.quote_name
+    retorno = ['id', 'relatorio_id', 'tipo', 'relevante', 'comentario']
+    condicao = ' OR '.join([f"({q('relatorio_id')} = %s AND {q('tipo')} = %s)"] * len(pares))
+    sql = f"DELETE FROM {q(meta.db_table)} WHERE {q('usuario_id')} = %s AND ({condicao})"
+    parametros = [usuario_id] + [valor for par in pares for valor in par]
+    with connection.cursor() as cursor:
+        if connection.vendor in ('postgresql', 'sqlite'):
+            cursor.execute(f"{sql} RETURNING {', '.join(map(q, retorno))}", parametros)
+            return [tuple(linha) for linha in cursor.fetchall()]
+        filtro = Q()
+        for relatorio_id, tipo in pares:
+            filtro |= Q(relatorio_id=relatorio_id, tipo=tipo)
+        removidas = list(
+            InteracaoRelatorio.objects.filter(filtro, usuario_id=usuario_id).values_list(*retorno)
+        )
+        cursor.execute(sql, parametros)
+        return removidas
+
+
+def registrar_votos(usuario_id, votos):
+    """
+    Registra as confirmações/negações ``(relatorio_id, tipo, comentario)`` do
+    usuário em uma transação, com um INSERT (e um DELETE dos votos opostos)
+    por bloco e um UPDATE de contadores por relatório.
+
+    Um voto por relatório: se vierem dois, vale o último. Votos que já
+    existem não alteram nada. Retorna ``(criados, removidos)``, conjuntos de
+    ``(relatorio_id, tipo)`` que de fato entraram ou saíram.
+    """
+    por_relatorio = {}
+    for relatorio_id, tipo, comentario in votos:
+        if tipo not in TIPOS_VOTO:
+            raise ValueError(f"Tipo de interação inválido: {tipo}")
+        por_relatorio[relatorio_id] = (tipo, comentario or '')
+    if not por_relatorio:
+        return set(), set()
+
+    with trava_escrita(), transaction.atomic():
+        # Votos que já existem saem do INSERT pela restrição única (requisições simultâneas inclusive)
+        criadas = _inserir_lote_se_ausente(usuario_id, [
+            (relatorio_id, tipo, comentario) for relatorio_id, (tipo, comentario) in sorted(por_relatorio.items())
+        ])
+        # Trocar de ideia: o voto oposto sai junto, só para os votos que entraram agora
+        removidas = _remover_lote(usuario_id, [(relatorio_id, OPOSTO[tipo]) for _, relatorio_id, tipo in criadas])
+
+        # Inserção e remoção diretas não disparam sinais: log de alterações, contadores,
+        # busca e detecção de spam aqui
+        alteracoes.registrar_lote([
+            InteracaoRelatorio(pk=pk, relatorio_id=relatorio_id, usuario_id=usuario_id, tipo=tipo, relevante=True)
+            for pk, relatorio_id, tipo in criadas
+        ], 'criacao')
+        alteracoes.registrar_lote([
+            InteracaoRelatorio(pk=pk, relatorio_id=relatorio_id, usuario_id=usuario_id, tipo=tipo, relevante=relevante)
+            for pk, relatorio_id, tipo, relevante, _ in removidas
+        ], 'remocao')
+        deltas = defaultdict(Counter)
+        for _, relatorio_id, tipo in criadas:
+            deltas[relatorio_id][contadores.CAMPO_POR_TIPO[tipo]] += 1
+        for _, relatorio_id, tipo, _, _ in removidas:
+            deltas[relatorio_id][contadores.CAMPO_POR_TIPO[tipo]] -= 1
+        for relatorio_id in sorted(deltas):
+            contadores.ajustar_relatorio(relatorio_id, dict(deltas[relatorio_id]))
+
+        com_comentario = {relatorio_id for _, relatorio_id, _ in criadas if por_relatorio[relatorio_id][1]}
+        texto_removido = {relatorio_id for _, relatorio_id, _, _, comentario in removidas if comentario}
+        busca.indexar(sorted(com_comentario | texto_removido))
+        if com_comentario:
+            spam.agendar()
+
+    return (
+        {(relatorio_id, tipo) for _, relatorio_id, tipo in criadas},
+        {(relatorio_id, tipo) for _, relatorio_id, tipo, _, _ in removidas},
+    )
+
+
+def registrar_voto(relatorio_id, usuario_id, tipo, comentario=''):
+    """
+    Registra uma confirmação ou negação e ajusta os contadores do relatório.
+
+    Retorna ``(criada, removida_oposta)``; votar de novo no mesmo tipo não
+    altera nada.
+    """
+    criados, removidos = registrar_votos(usuario_id, [(relatorio_id, tipo, comentario)])
+    return bool(criados), bool(removidos)
+
+
+def totais(relatorio_id):
+    return RelatorioAlagamento.objects.filter(pk=relatorio_id).values(
+        'total_confirmacoes', 'total_negacoes'
+    ).order_by().first()
@@ -0,0 +1,244 @@
+"""
+Bairro a partir de Coordenadas
+==============================
+
+Resolve (latitude, longitude) -> bairro com um índice espacial sobre os
+centroides ``Bairro.latitude/longitude`` do catálogo em memória
+(``dashboard.catalogo``): uma ``BallTree`` com distância haversine devolve
+os ``k`` centroides mais próximos de cada ponto, vetorizado para lotes.
+
+Se houver um GeoJSON de limites (``BAIRROS_LIMITES_GEOJSON``, padrão
+``data/raw/bairros_limites.geojson``), o resultado passa a ser o bairro cujo
+polígono contém o ponto, testando só os polígonos dos ``k`` candidatos; o
+centroide mais próximo continua valendo para pontos fora de qualquer
+polígono. Pontos a mais de ``BAIRROS_DISTANCIA_MAXIMA_METROS`` do centroide
+mais próximo (e fora de polígonos) ficam sem bairro.
+
+O índice é reconstruído quando o catálogo de bairros é recarregado.
+"""
+
+import json
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from utils.data_processing.data_sources import raw_file
+
+from .catalogo import catalogo
+
+logger = logging.getLogger(__name__)
+
+RAIO_TERRA_METROS = 6_371_000
+SEM_BAIRRO = -1
+BLOCO_POLIGONO = 4096  # Pontos por bloco no teste ponto-em-polígono (memória pontos x vértices)
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def _dentro_do_anel(x, y, anel):
+    """Ray casting vetorizado: quais pontos (x=lon, y=lat) estão dentro do anel"""
+    xs, ys = anel[:, 0], anel[:, 1]
+    xa, ya = np.roll(xs, 1), np.roll(ys, 1)
+    cruza = (ys[None, :] > y[:, None]) != (ya[None, :] > y[:, None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_corte = (xa - xs)[None, :] * (y[:, None] - ys[None, :]) / (ya - ys)[None, :] + xs[None, :]
+    return np.count_nonzero(cruza & (x[:, None] < x_corte), axis=1) % 2 == 1
+
+
+class _Poligono:
+    """(Multi)polígono de um bairro; cada parte é (exterior, [buracos]) em (lon, lat)"""
+
+    def __init__(self, partes):
+        self.partes = partes
+        todos = np.vstack([exterior for exterior, _ in partes])
+        self.lon_min, self.lat_min = todos.min(axis=0)
+        self.lon_max, self.lat_max = todos.max(axis=0)
+
+    def contem(self, lons, lats):
+        resultado = np.zeros(len(lons), dtype=bool)
+        na_caixa = (
+            (lons >= self.lon_min) & (lons <= self.lon_max) &
+            (lats >= self.lat_min) & (lats <= self.lat_max)
+        )
+        posicoes = np.flatnonzero(na_caixa)
+        for inicio in range(0, len(posicoes), BLOCO_POLIGONO):
+            bloco = posicoes[inicio:inicio + BLOCO_POLIGONO]
+            x, y = lons[bloco], lats[bloco]
+            dentro = np.zeros(len(bloco), dtype=bool)
+            for exterior, buracos in self.partes:
+                na_parte = _dentro_do_anel(x, y, exterior)
+                for buraco in buracos:
+                    na_parte &= ~_dentro_do_anel(x, y, buraco)
+                dentro |= na_parte
+            resultado[bloco] = dentro
+        return resultado
+
+
+def _carregar_poligonos(caminho):
+    """GeoJSON (FeatureCollection) -> {bairro_id: _Poligono}"""
+    with open(caminho, encoding='utf-8') as arquivo:
+        dados = json.load(arquivo)
+
+    por_chave = {(e.nome, e.cidade, e.uf): e.id for e in catalogo.todos()}
+    poligonos = {}
+    for feature in dados.get('features', []):
+        propriedades = feature.get('properties') or {}
+        geometria = feature.get('geometry') or {}
+        bairro_id = propriedades.get('bairro_id')
+        if bairro_id is None:
+            nome = propriedades.get('nome') or propriedades.get('bairro')
+            if 'cidade' in propriedades:
+                bairro_id = por_chave.get((nome, propriedades['cidade'], propriedades.get('uf', 'PE')))
+            else:
+                ids = catalogo.ids_por_nome(nome)
+                bairro_id = ids[0] if len(ids) == 1 else None
+        if bairro_id is None or geometria.get('type') not in ('Polygon', 'MultiPolygon'):
+            continue
+
+        coordenadas = geometria['coordinates']
+        if geometria['type'] == 'Polygon':
+            coordenadas = [coordenadas]
+        partes = [
+            (np.asarray(aneis[0], dtype=float)[:, :2], [np.asarray(b, dtype=float)[:, :2] for b in aneis[1:]])
+            for aneis in coordenadas
+        ]
+        poligonos[int(bairro_id)] = _Poligono(partes)
+    return poligonos
+
+
+class _Indice:
+    def __init__(self, entradas, poligonos):
+        from sklearn.neighbors import BallTree
+
+        com_coordenadas = [e for e in entradas if e.latitude is not None and e.longitude is not None]
+        self.ids = np.array([e.id for e in com_coordenadas], dtype=np.int64)
+        self.arvore = BallTree(
+            np.radians([[e.latitude, e.longitude] for e in com_coordenadas]), metric='haversine'
+        ) if com_coordenadas else None
+        self.poligonos = poligonos
+
+    def consultar(self, lats, lons, k):
+        """
+        Resolve pontos em lote.
+
+        Retorna ``(ids, distancias, por_poligono, candidatos)``: id do bairro
+        (``SEM_BAIRRO`` se nenhum), distância em metros ao centroide do bairro
+        escolhido, se a escolha veio de um polígono e os ``k`` ids candidatos.
+        """
+        lats = np.asarray(lats, dtype=float).ravel()
+        lons = np.asarray(lons, dtype=float).ravel()
+        n = len(lats)
+        k = max(1, min(k, len(self.ids)))
+        ids = np.full(n, SEM_BAIRRO, dtype=np.int64)
+        distancias = np.full(n, np.inf)
+        por_poligono = np.zeros(n, dtype=bool)
+        candidatos = np.full((n, k), SEM_BAIRRO, dtype=np.int64)
+        validos = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons))
+        if self.arvore is None or not len(validos):
+            return ids, distancias, por_poligono, candidatos
+
+        lat_v, lon_v = lats[validos], lons[validos]
+        dist, idx = self.arvore.query(np.radians(np.column_stack([lat_v, lon_v])), k=k)
+        dist *= RAIO_TERRA_METROS
+        ids_candidatos = self.ids[idx]
+
+        # Coluna escolhida: o centroide mais próximo, salvo se um polígono candidato contém o ponto
+        escolha = np.zeros(len(validos), dtype=np.int64)
+        dentro = np.zeros(len(validos), dtype=bool)
+        if self.poligonos:
+            for coluna in range(k):
+                pendentes = ~dentro
+                for bairro_id in np.unique(ids_candidatos[pendentes, coluna]):
+                    poligono = self.poligonos.get(int(bairro_id))
+                    if poligono is None:
+                        continue
+                    mascara = np.flatnonzero(pendentes & (ids_candidatos[:, coluna] == bairro_id))
+                    contidos = mascara[poligono.contem(lon_v[mascara], lat_v[mascara])]
+                    escolha[contidos] = coluna
+                    dentro[contidos] = True
+
+        linhas = np.arange(len(validos))
+        escolhidos = ids_candidatos[linhas, escolha]
+        dist_escolhidos = dist[linhas, escolha]
+        fora = ~dentro & (dist_escolhidos > _config('BAIRROS_DISTANCIA_MAXIMA_METROS', 5000))
+        escolhidos[fora] = SEM_BAIRRO
+
+        ids[validos] = escolhidos
+        distancias[validos] = dist_escolhidos
+        por_poligono[validos] = dentro
+        candidatos[validos] = ids_candidatos
+        return ids, distancias, por_poligono, candidatos
+
+
+class ResolvedorBairros:
+    """Índice espacial de bairros, reconstruído junto com o catálogo"""
+
+    def __init__(self):
+        self._indice = None
+        self._origem = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _caminho_limites():
+        caminho = _config('BAIRROS_LIMITES_GEOJSON', None)
+        return Path(caminho) if caminho else raw_file('bairros_limites.geojson')
+
+    def _construir(self, dados):
+        poligonos = {}
+        caminho = self._caminho_limites()
+        if caminho.exists():
+            try:
+                poligonos = _carregar_poligonos(caminho)
+            except (OSError, ValueError, KeyError, IndexError) as e:
+                logger.warning("Limites de bairros ignorados (%s): %s", caminho, e)
+        return _Indice(dados.ordenados, poligonos)
+
+    @property
+    def indice(self):
+        dados = catalogo.dados
+        if self._origem is not dados:
+            with self._lock:
+                if self._origem is not dados:
+                    self._indice = self._construir(dados)
+                    self._origem = dados
+        return self._indice
+
+    def resolver_lote(self, latitudes, longitudes):
+        """Arrays -> (ids de bairro, distâncias em metros); ``SEM_BAIRRO`` fora da cobertura"""
+        ids, distancias, _, _ = self.indice.consultar(latitudes, longitudes, self._k())
+        return ids, distancias
+
+    def resolver(self, latitude, longitude):
+        """Bairro (``EntradaBairro``) do ponto, ou None"""
+        ids, _ = self.resolver_lote([float(latitude)], [float(longitude)])
+        return catalogo.obter(int(ids[0])) if ids[0] != SEM_BAIRRO else None
+
+    def sugerir(self, bairro_id, latitude, longitude):
+        """
+        Confere um bairro escolhido pelo usuário contra as coordenadas.
+
+        Retorna None se for compatível; senão o bairro onde o ponto fica. Sem
+        limites, qualquer um dos ``k`` centroides mais próximos é aceito (os
+        centroides são aproximados); dentro de um polígono, só o dele.
+        """
+        ids, _, por_poligono, candidatos = self.indice.consultar(
+            [float(latitude)], [float(longitude)], self._k()
+        )
+        resolvido = int(ids[0])
+        if resolvido in (SEM_BAIRRO, bairro_id):
+            return None
+        if not por_poligono[0] and bairro_id in candidatos[0]:
+            return None
+        return catalogo.obter(resolvido)
+
+    @staticmethod
+    def _k():
+        return _config('BAIRROS_CANDIDATOS', 3)
+
+
+resolvedor = ResolvedorBairros()
@@ -0,0 +1,51 @@
+"""
+Comando Django para agrupar relatos em eventos de alagamento
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from dashboard.eventos import agrupar_pendentes, encerrar_eventos
+import time
+
+class Command(BaseCommand):
+    help = 'Agrupa relatos sem evento em eventos de alagamento (incremental)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=0,
+            help='Reprocessar os últimos N dias, um dia por vez (carga inicial)'
+        )
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Repetir a cada N segundos (0 = executar uma vez)'
+        )
+
+    def handle(self, *args, **options):
+        if options['dias']:
+            self.processar_historico(options['dias'])
+
+        while True:
+            inicio = time.perf_counter()
+            resultado = agrupar_pendentes()
+            encerrados = encerrar_eventos()
+            self.relatar(resultado, time.perf_counter() - inicio, encerrados)
+
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
+
+    def processar_historico(self, dias):
+        """Do mais antigo ao mais recente, para que cada dia veja os eventos do anterior"""
+        agora = timezone.now()
+        for dia in range(dias, 0, -1):
+            inicio = time.perf_counter()
+            resultado = agrupar_pendentes(agora - timedelta(days=dia), agora - timedelta(days=dia - 1))
+            if resultado['pendentes']:
+                self.relatar(resultado, time.perf_counter() - inicio)
+
+    def relatar(self, resultado, duracao, encerrados=0):
+        self.stdout.write(self.style.SUCCESS(
+            f"🌊 {resultado['pendentes']:,} pendentes, {resultado['agrupados']:,} agrupados, "
+            f"{resultado['criados']} eventos criados, {resultado['fundidos']} fundidos, "
+            f"{encerrados} encerrados ({duracao * 1000:.0f}ms)"
+        ))
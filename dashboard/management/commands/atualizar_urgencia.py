@@ -0,0 +1,30 @@
+"""
+Comando Django para recalcular a urgência materializada dos relatos ativos
+"""
+from django.core.management.base import BaseCommand
+from dashboard.prioridade import atualizar_scores
+import time
+
+class Command(BaseCommand):
+    help = 'Recalcula urgencia_score dos relatos ativos (fila de prioridade)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Repetir a cada N segundos (0 = executar uma vez)'
+        )
+
+    def handle(self, *args, **options):
+        intervalo = options['intervalo']
+
+        while True:
+            inicio = time.perf_counter()
+            atualizados = atualizar_scores()
+            duracao = (time.perf_counter() - inicio) * 1000
+            self.stdout.write(self.style.SUCCESS(
+                f"🚨 {atualizados:,} relatos com urgência recalculada ({duracao:.0f}ms)"
+            ))
+
+            if not intervalo:
+                break
+            time.sleep(intervalo)
@@ -0,0 +1,39 @@
+"""
+Comando Django para avaliar alertas por área (janela deslizante por bairro)
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from dashboard.alertas import avaliar_bairros, bairros_alterados, janela
+import time
+
+class Command(BaseCommand):
+    help = 'Cria, escala e desativa alertas a partir dos bairros com relatos recentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Repetir a cada N segundos (0 = executar uma vez)'
+        )
+
+    def handle(self, *args, **options):
+        intervalo = options['intervalo']
+        # Primeira execução: todos os bairros com relatos na janela
+        desde = timezone.now() - janela()
+
+        while True:
+            agora = timezone.now()
+            inicio = time.perf_counter()
+            bairros = bairros_alterados(desde, agora)
+            resultado = avaliar_bairros(bairros, agora)
+            duracao = (time.perf_counter() - inicio) * 1000
+            desde = agora
+
+            self.stdout.write(self.style.SUCCESS(
+                f"🚨 {len(bairros)} bairros avaliados em {duracao:.0f}ms: "
+                f"{resultado['criados']} criados, {resultado['atualizados']} atualizados, "
+                f"{resultado['desativados']} desativados, {resultado['vinculos']} relatos vinculados"
+            ))
+
+            if not intervalo:
+                break
+            time.sleep(intervalo)
@@ -0,0 +1,49 @@
+"""
+Comando Django para medir a vazão de envio de relatos (direto x fila em lote)
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from dashboard import benchmarks_ingestao
+from utils.data_processing.data_sources import data_dir
+from pathlib import Path
+import json
+
+class Command(BaseCommand):
+    help = (
+        'Mede relatos/s e latência do envio com clientes simultâneos: gravação direta '
+        '(uma transação por relato) x fila de ingestão em lote (durável e assíncrona)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--relatos', type=int, default=2000, help='Relatos enviados por modo')
+        parser.add_argument('--clientes', type=int, default=8, help='Threads enviando ao mesmo tempo')
+        parser.add_argument(
+            '--modos', default=','.join(benchmarks_ingestao.MODOS),
+            help=f"Modos separados por vírgula ({', '.join(benchmarks_ingestao.MODOS)})"
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Arquivo JSON (padrão: EXPORTS_DATA_DIR/benchmarks/)')
+
+    def handle(self, *args, **options):
+        modos = [m.strip() for m in options['modos'].split(',') if m.strip()]
+        invalidos = set(modos) - set(benchmarks_ingestao.MODOS)
+        if invalidos:
+            raise CommandError(f"Modos inválidos: {', '.join(sorted(invalidos))}")
+
+        self.stdout.write(
+            f"⏱️ BENCHMARK DA INGESTÃO - {options['relatos']:,} relatos, {options['clientes']} clientes"
+        )
+        try:
+            relatorio = benchmarks_ingestao.executar(
+                options['relatos'], options['clientes'], modos, options['seed'], log=self.stdout.write
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            destino = Path(options['output'])
+        else:
+            destino = data_dir('exports') / 'benchmarks' / f"ingestao_{timezone.now():%Y%m%d_%H%M%S}.json"
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        destino.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f"💾 Resultados salvos em {destino}"))
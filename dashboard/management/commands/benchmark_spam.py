@@ -0,0 +1,44 @@
+"""
+Comando Django para medir precisão e vazão da detecção de spam (MinHash/LSH)
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from dashboard import benchmarks_spam
+from utils.data_processing.data_sources import data_dir
+from pathlib import Path
+import json
+
+class Command(BaseCommand):
+    help = 'Mede precisão, revocação e textos/s do detector de spam em fluxos sintéticos rotulados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanhos', default='1000,10000',
+            help='Quantidade de textos por execução, separada por vírgula'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--limite-exaustivo', type=int, default=50000,
+            help='Maior tamanho em que a comparação exaustiva também é medida'
+        )
+        parser.add_argument('--output', help='Arquivo JSON (padrão: EXPORTS_DATA_DIR/benchmarks/)')
+
+    def handle(self, *args, **options):
+        try:
+            tamanhos = [int(t) for t in options['tamanhos'].split(',') if t.strip()]
+        except ValueError:
+            raise CommandError(f"--tamanhos inválido: {options['tamanhos']}")
+
+        self.stdout.write(f"⏱️ BENCHMARK DA DETECÇÃO DE SPAM - tamanhos {tamanhos}")
+        relatorio = benchmarks_spam.executar(
+            tamanhos, seed=options['seed'], limite_exaustivo=options['limite_exaustivo'],
+            log=self.stdout.write
+        )
+
+        if options['output']:
+            destino = Path(options['output'])
+        else:
+            destino = data_dir('exports') / 'benchmarks' / f"spam_{timezone.now():%Y%m%d_%H%M%S}.json"
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        destino.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f"💾 Resultados salvos em {destino}"))
@@ -0,0 +1,73 @@
+"""
+Comando Django para medir as views do dashboard em bases de vários tamanhos
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from dashboard import benchmarks
+from utils.data_processing.data_sources import data_dir
+from pathlib import Path
+import json
+
+class Command(BaseCommand):
+    help = 'Mede latência, queries e memória das views do dashboard (banco de teste descartável)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanhos', default='1000,10000',
+            help='Tamanhos da base separados por vírgula (ex.: 1000,10000,100000)'
+        )
+        parser.add_argument('--repeticoes', type=int, default=5, help='Requisições cronometradas por cenário')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Arquivo JSON (padrão: EXPORTS_DATA_DIR/benchmarks/)')
+        parser.add_argument('--comparar', help='JSON de uma execução anterior para apontar regressões')
+        parser.add_argument('--limiar', type=float, default=0.2, help='Regressão de latência tolerada (fração)')
+        parser.add_argument(
+            '--usar-banco-atual', action='store_true',
+            help='Roda no banco configurado em vez de criar um banco de teste (APAGA os relatórios!)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            tamanhos = [int(t) for t in options['tamanhos'].split(',') if t.strip()]
+        except ValueError:
+            raise CommandError(f"--tamanhos inválido: {options['tamanhos']}")
+
+        self.stdout.write(f"⏱️ BENCHMARK DAS VIEWS - tamanhos {tamanhos}")
+
+        setup_test_environment()
+        nome_original = None
+        if not options['usar_banco_atual']:
+            nome_original = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+
+        try:
+            relatorio = benchmarks.executar(
+                tamanhos, repeticoes=options['repeticoes'], seed=options['seed'], log=self.stdout.write
+            )
+        finally:
+            if nome_original is not None:
+                connection.creation.destroy_test_db(nome_original, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            destino = Path(options['output'])
+        else:
+            destino = data_dir('exports') / 'benchmarks' / (
+                f"views_{timezone.now():%Y%m%d_%H%M%S}_{relatorio['commit'] or 'sem-commit'}.json"
+            )
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        destino.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False, default=str), encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f"💾 Resultados salvos em {destino}"))
+
+        if options['comparar']:
+            base = json.loads(Path(options['comparar']).read_text(encoding='utf-8'))
+            regressoes = benchmarks.comparar(base, relatorio, options['limiar'])
+            if not regressoes:
+                self.stdout.write(self.style.SUCCESS("✅ Nenhuma regressão em relação à base"))
+            for resultado, metrica, antes, agora in regressoes:
+                self.stdout.write(self.style.WARNING(
+                    f"⚠️ {resultado['view']} {resultado['filtros']} n={resultado['tamanho']}: "
+                    f"{metrica} {antes} -> {agora}"
+                ))
@@ -0,0 +1,41 @@
+"""
+Comando Django para detectar campanhas de spam em descrições e comentários
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from dashboard import spam
+import time
+
+class Command(BaseCommand):
+    help = (
+        'Marca como spam relatos e comentários quase duplicados em massa (MinHash/LSH) '
+        'dentro da janela de tempo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas', type=int, default=0,
+            help='Analisar as últimas N horas em um índice novo (padrão: SPAM_JANELA_HORAS)'
+        )
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Repetir a cada N segundos, só com os textos novos (0 = executar uma vez)'
+        )
+
+    def handle(self, *args, **options):
+        detector = spam.DetectorSpam(timedelta(hours=options['horas']) if options['horas'] else None)
+
+        while True:
+            inicio = time.perf_counter()
+            resultado = detector.processar()
+            duracao = (time.perf_counter() - inicio) * 1000
+
+            self.stdout.write(self.style.SUCCESS(
+                f"🧹 {resultado['textos']:,} textos lidos, {resultado['indexados']:,} indexados, "
+                f"{resultado['marcados']:,} marcados como spam ({duracao:.0f}ms, "
+                f"{len(detector.indice):,} no índice)"
+            ))
+
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
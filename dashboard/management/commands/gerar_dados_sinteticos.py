@@ -0,0 +1,61 @@
+"""
+Comando Django para gerar dados sintéticos em escala (testes de carga)
+"""
+from django.core.management.base import BaseCommand, CommandError
+from utils.data_processing.create_synthetic_data import (
+    DEFAULT_CHUNK_SIZE, DEFAULT_SEED, SCALE_PRESETS, write_csv, write_parquet
+)
+from utils.data_processing.data_sources import raw_file
+from dashboard.sinteticos import carregar_relatorios
+import time
+
+class Command(BaseCommand):
+    help = 'Gera relatórios sintéticos vetorizados para CSV/Parquet ou direto no banco'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', default='10k',
+            help=f"Número de registros ou escala ({', '.join(SCALE_PRESETS)})"
+        )
+        parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Semente (datasets reprodutíveis)')
+        parser.add_argument('--output', help='Arquivo de saída (.csv, .csv.gz ou .parquet)')
+        parser.add_argument('--db', action='store_true', help='Inserir direto no banco via bulk_create')
+        parser.add_argument('--dias', type=int, default=180, help='Janela de dias até agora (apenas --db)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--batch-size', type=int, default=2000, help='Tamanho do lote do bulk_create')
+
+    def handle(self, *args, **options):
+        rows = options['rows'].lower()
+        try:
+            n_records = SCALE_PRESETS.get(rows) or int(rows)
+        except ValueError:
+            raise CommandError(f"--rows inválido: {options['rows']}")
+
+        seed = options['seed']
+        chunk_size = options['chunk_size']
+        inicio = time.perf_counter()
+
+        self.stdout.write(f"🌧️ Gerando {n_records:,} relatórios sintéticos (seed={seed})...")
+
+        if options['db']:
+            total = carregar_relatorios(
+                n_records, seed=seed, chunk_size=chunk_size,
+                batch_size=options['batch_size'], dias=options['dias'],
+                progresso=lambda n: self.stdout.write(f"   📊 {n:,} relatórios inseridos..."),
+            )
+            destino = 'banco de dados'
+        else:
+            destino = options['output'] or raw_file(f'alagamentos_sinteticos_{rows}.csv')
+            if str(destino).endswith('.parquet'):
+                try:
+                    total = write_parquet(destino, n_records, seed, chunk_size)
+                except ImportError as e:
+                    raise CommandError(str(e))
+            else:
+                total = write_csv(destino, n_records, seed, chunk_size)
+
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {total:,} registros gravados em {destino} "
+            f"({duracao:.1f}s, {total / max(duracao, 1e-9):,.0f} registros/s)"
+        ))
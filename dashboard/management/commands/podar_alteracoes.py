@@ -0,0 +1,37 @@
+"""
+Comando Django para acompanhar e podar o log de alterações
+"""
+from django.core.management.base import BaseCommand
+from dashboard import alteracoes
+
+class Command(BaseCommand):
+    help = (
+        'Mostra a posição e os eventos pendentes de cada consumidor do log de alterações e '
+        'apaga os eventos já lidos por todos e mais antigos que ALTERACOES_RETENCAO_DIAS'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=None,
+            help='Retenção em dias (padrão: ALTERACOES_RETENCAO_DIAS)'
+        )
+        parser.add_argument(
+            '--somente-situacao',
+            action='store_true',
+            help='Apenas mostrar os consumidores, sem apagar eventos'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"📜 Log de alterações até o evento {alteracoes.ultima_posicao():,}")
+        for consumidor in alteracoes.situacao():
+            self.stdout.write(
+                f"   {consumidor['nome']}: posição {consumidor['posicao']:,}, "
+                f"{consumidor['pendentes']:,} pendentes"
+            )
+        if options['somente_situacao']:
+            return
+
+        apagados = alteracoes.podar(options['dias'])
+        self.stdout.write(self.style.SUCCESS(f"🧹 {apagados:,} eventos podados"))
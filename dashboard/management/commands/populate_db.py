@@ -6,23 +6,36 @@ from django.contrib.auth.models import User
 from dashboard.models import Bairro, UsuarioApp, RelatorioAlagamento, InteracaoRelatorio
 from django.utils import timezone
 from django.db.models import Count, Avg, Sum
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from utils.data_processing.data_sources import raw_file
+from dashboard.catalogo import catalogo
+from dashboard.localizacao import SEM_BAIRRO, resolvedor
 
 class Command(BaseCommand):
     help = 'Popula banco de dados com dados do CSV'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv',
+            help='CSV de relatos (padrão: RAW_DATA_DIR/data.csv; aceita .gz/.zip)'
+        )
+
     def handle(self, *args, **options):
         self.stdout.write("🌊 POPULANDO BANCO DE DADOS")
         
+        self.csv_path = raw_file('data.csv', options.get('csv'))
+        df = pd.read_csv(self.csv_path)
+        
         # Popular bairros
         self.popular_bairros()
         
         # Criar usuários
-        usuarios_map = self.criar_usuarios()
+        usuarios_map = self.criar_usuarios(df)
         
         # Migrar relatórios
-        self.migrar_relatorios(usuarios_map)
+        self.migrar_relatorios(df, usuarios_map)
         
         self.stdout.write(
             self.style.SUCCESS('✅ Banco populado com sucesso!')
@@ -51,9 +64,8 @@ class Command(BaseCommand):
             if created:
                 self.stdout.write(f"✅ Bairro criado: {nome}")
     
-    def criar_usuarios(self):
+    def criar_usuarios(self, df):
         """Cria usuários"""
-        df = pd.read_csv('data/raw/data.csv')
         user_ids = df['id_usuario'].unique()
         usuarios_map = {}
         
@@ -83,13 +95,24 @@ class Command(BaseCommand):
         
         return usuarios_map
     
-    def migrar_relatorios(self, usuarios_map):
+    def migrar_relatorios(self, df, usuarios_map):
         """Migra relatórios do CSV"""
-        df = pd.read_csv('data/raw/data.csv')
         
-        for _, row in df.iterrows():
+        # Bairro de cada linha de uma vez: pelo nome no catálogo e, se ausente, pelas coordenadas
+        bairro_ids = np.array([
+            (catalogo.ids_por_nome(nome) or (SEM_BAIRRO,))[0] for nome in df['bairro']
+        ], dtype=np.int64)
+        sem_nome = bairro_ids == SEM_BAIRRO
+        if sem_nome.any():
+            bairro_ids[sem_nome], _ = resolvedor.resolver_lote(
+                df['latitude'].to_numpy()[sem_nome], df['longitude'].to_numpy()[sem_nome]
+            )
+        
+        for posicao, (_, row) in enumerate(df.iterrows()):
             try:
-                bairro = Bairro.objects.get(nome=row['bairro'])
+                bairro = catalogo.obter(int(bairro_ids[posicao]))
+                if bairro is None:
+                    raise ValueError(f"bairro não encontrado: {row['bairro']}")
                 usuario = usuarios_map[row['id_usuario']]
                 
                 timestamp = pd.to_datetime(row['timestamp'])
@@ -98,7 +121,7 @@ class Command(BaseCommand):
                     usuario=usuario,
                     latitude=row['latitude'],
                     longitude=row['longitude'],
-                    bairro=bairro,
+                    bairro_id=bairro.id,
                     nivel_severidade=row['nivel_severidade'],
                     timestamp=timezone.make_aware(timestamp) if timezone.is_naive(timestamp) else timestamp,
                     total_confirmacoes=row['confirmacoes'],
@@ -6,19 +6,30 @@ from django.contrib.auth.models import User
 from dashboard.models import Bairro, UsuarioApp, RelatorioAlagamento, InteracaoRelatorio
 from django.utils import timezone
 from django.db.models import Count, Avg, Sum
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import pytz
 import os
+from utils.data_processing.data_sources import raw_file
+from dashboard.catalogo import catalogo
+from dashboard.contadores import reconciliar as reconciliar_contadores
+from dashboard.localizacao import SEM_BAIRRO, resolvedor
 
 class Command(BaseCommand):
     help = 'Popula banco de dados com dados baseados no INMET'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv',
+            help='CSV de alagamentos (padrão: RAW_DATA_DIR/alagamentos_inmet_synthetic.csv; aceita .gz/.zip)'
+        )
+
     def handle(self, *args, **options):
         self.stdout.write("🌧️ POPULANDO COM DADOS INMET")
         
         # Arquivo com dados sintéticos baseados no INMET
-        csv_path = "/home/raf75/quinto-periodo/projetos/Projetos5novo/data/raw/alagamentos_inmet_synthetic.csv"
+        csv_path = raw_file('alagamentos_inmet_synthetic.csv', options.get('csv'))
         
         if not os.path.exists(csv_path):
             self.stdout.write(
@@ -83,14 +94,22 @@ class Command(BaseCommand):
         
         relatorios_criados = 0
         
-        for _, row in df.iterrows():
+        # Bairro de cada linha de uma vez: pelo nome no catálogo e, se ausente, pelas coordenadas
+        por_nome = {(b.nome, b.cidade, b.uf): b.id for b in catalogo.todos()}
+        bairro_ids = np.array([
+            por_nome.get(chave, SEM_BAIRRO) for chave in zip(df['bairro'], df['cidade'], df['uf'])
+        ], dtype=np.int64)
+        sem_nome = bairro_ids == SEM_BAIRRO
+        if sem_nome.any():
+            bairro_ids[sem_nome], _ = resolvedor.resolver_lote(
+                df['latitude'].to_numpy()[sem_nome], df['longitude'].to_numpy()[sem_nome]
+            )
+        
+        for posicao, (_, row) in enumerate(df.iterrows()):
             try:
-                # Encontrar bairro
-                bairro = Bairro.objects.get(
-                    nome=row['bairro'], 
-                    cidade=row['cidade'],
-                    uf=row['uf']
-                )
+                bairro_id = int(bairro_ids[posicao])
+                if bairro_id == SEM_BAIRRO:
+                    raise ValueError(f"bairro não encontrado para {row['bairro']} ({row['latitude']}, {row['longitude']})")
                 
                 # Usuário (usar mapeamento ou criar genérico)
                 usuario_app = usuarios_map.get(row['usuario'])
@@ -108,7 +127,7 @@ class Command(BaseCommand):
                 relatorio = RelatorioAlagamento.objects.create(
                     usuario=usuario_app,
                     timestamp=data_ocorrencia,
-                    bairro=bairro,
+                    bairro_id=bairro_id,
                     latitude=float(row['latitude']),
                     longitude=float(row['longitude']),
                     nivel_severidade=int(row['severidade']),
@@ -142,15 +161,9 @@ class Command(BaseCommand):
                 self.stdout.write(f"   ❌ Erro ao processar linha: {e}")
                 continue
         
-        # Atualizar contadores de usuários
-        self.stdout.write("🔄 Atualizando estatísticas de usuários...")
-        for usuario_app in UsuarioApp.objects.all():
-            usuario_app.total_relatos = RelatorioAlagamento.objects.filter(usuario=usuario_app).count()
-            usuario_app.relatos_validados = RelatorioAlagamento.objects.filter(
-                usuario=usuario_app, 
-                status='ativo'
-            ).count()
-            usuario_app.save()
+        # Contadores passam a refletir as interações realmente criadas
+        self.stdout.write("🔄 Reconciliando contadores de relatórios e usuários...")
+        reconciliar_contadores()
         
         # Estatísticas finais
         total_relatorios = RelatorioAlagamento.objects.count()
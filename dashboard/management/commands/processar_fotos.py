@@ -0,0 +1,53 @@
+"""
+Comando Django para processar fotos pendentes dos relatos
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from dashboard import fotos
+from dashboard.models import RelatorioAlagamento
+import time
+
+class Command(BaseCommand):
+    help = (
+        'Gera as variantes (sem EXIF) das fotos ainda não processadas: pendências deixadas '
+        'pelo pool de workers e, com --antigas, fotos gravadas antes do pipeline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--antigas',
+            action='store_true',
+            help='Incluir fotos antigas (sem hash), copiando-as para as pendências'
+        )
+        parser.add_argument(
+            '--limite',
+            type=int,
+            default=None,
+            help='Máximo de fotos antigas importadas nesta execução'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        hashes = set()
+        if options['antigas']:
+            hashes |= fotos.importar_antigas(options['limite'])
+            self.stdout.write(f"📥 {len(hashes)} fotos antigas importadas")
+
+        hashes |= set(
+            RelatorioAlagamento.objects.select_related(None)
+            .filter(~Q(foto_hash=''), foto_processada=False)
+            .values_list('foto_hash', flat=True).distinct()
+        )
+        relatos = falhas = 0
+        for foto_hash in sorted(hashes):
+            try:
+                relatos += fotos.processar(foto_hash)
+            except Exception as e:
+                falhas += 1
+                self.stderr.write(f"⚠️ Foto {foto_hash[:12]}: {e}")
+
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"🖼️ {len(hashes) - falhas} fotos processadas em {duracao:.1f}s "
+            f"({relatos} relatos atualizados, {falhas} falhas)"
+        ))
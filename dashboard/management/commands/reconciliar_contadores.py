@@ -0,0 +1,22 @@
+"""
+Comando Django para recalcular os contadores desnormalizados
+"""
+from django.core.management.base import BaseCommand
+from dashboard.contadores import reconciliar
+import time
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula confirmações/negações dos relatórios e relatos/validados dos usuários '
+        'a partir das interações e relatórios (um UPDATE agregado por tabela)'
+    )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        corrigidos = reconciliar()
+        duracao = (time.perf_counter() - inicio) * 1000
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🔄 Contadores reconciliados em {duracao:.0f}ms: "
+            f"{corrigidos['relatorios']:,} relatórios e {corrigidos['usuarios']:,} usuários corrigidos"
+        ))
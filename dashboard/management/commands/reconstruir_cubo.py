@@ -0,0 +1,22 @@
+"""
+Comando Django para reconstruir o cubo de analytics a partir dos relatos
+"""
+from django.core.management.base import BaseCommand
+from dashboard.cubo import reconstruir
+import time
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula as células do cubo de analytics (dia, hora, bairro, severidade) e as '
+        'contribuições por usuário a partir dos relatórios (uma agregação por tabela)'
+    )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        totais = reconstruir()
+        duracao = (time.perf_counter() - inicio) * 1000
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🧊 Cubo reconstruído em {duracao:.0f}ms: "
+            f"{totais['celulas']:,} células e {totais['contribuicoes']:,} contribuições"
+        ))
@@ -0,0 +1,24 @@
+"""
+Comando Django para reconstruir o índice de busca textual dos relatos
+"""
+from django.core.management.base import BaseCommand, CommandError
+from dashboard import busca
+import time
+
+class Command(BaseCommand):
+    help = (
+        'Regrava o índice de busca textual (descrição, endereço e comentários) de todos os '
+        'relatórios: FTS5 no SQLite, tsvector + GIN no PostgreSQL'
+    )
+
+    def handle(self, *args, **options):
+        if not busca.disponivel():
+            raise CommandError('Busca textual indexada disponível apenas em SQLite (FTS5) e PostgreSQL')
+
+        inicio = time.perf_counter()
+        total = busca.reindexar()
+        duracao = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🔎 Índice de busca reconstruído em {duracao:.1f}s: {total:,} relatos"
+        ))
@@ -0,0 +1,88 @@
+"""
+Comando Django para executar a fila de tarefas em segundo plano
+"""
+from django.core.management.base import BaseCommand, CommandError
+from dashboard import tarefas
+import json
+import signal
+import time
+
+class Command(BaseCommand):
+    help = (
+        'Executa tarefas da fila guardada no banco (SKIP LOCKED no PostgreSQL), com pool de '
+        'threads ou processos, retentativas com espera exponencial e métricas por tarefa'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=None,
+            help='Tarefas simultâneas em threads (padrão: TAREFAS_THREADS)'
+        )
+        parser.add_argument(
+            '--processos',
+            type=int,
+            default=0,
+            help='Usar um pool de N processos em vez de threads (tarefas de CPU)'
+        )
+        parser.add_argument(
+            '--ate-esvaziar',
+            action='store_true',
+            help='Sair quando não houver mais tarefas vencidas'
+        )
+        parser.add_argument(
+            '--enfileirar',
+            metavar='NOME',
+            help='Apenas enfileirar a tarefa NOME (argumentos em --argumentos) e sair'
+        )
+        parser.add_argument(
+            '--argumentos',
+            default='{}',
+            help='JSON com os argumentos de --enfileirar'
+        )
+        parser.add_argument(
+            '--metricas',
+            action='store_true',
+            help='Apenas mostrar as métricas das últimas 24h e sair'
+        )
+
+    def handle(self, *args, **options):
+        if options['metricas']:
+            self.mostrar_metricas()
+            return
+        if options['enfileirar']:
+            try:
+                tarefa = tarefas.enfileirar(options['enfileirar'], json.loads(options['argumentos']))
+            except (ValueError, json.JSONDecodeError) as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"📥 Tarefa {tarefa.nome} #{tarefa.pk} enfileirada"))
+            return
+
+        trabalhador = tarefas.Trabalhador(
+            threads=options['threads'], processos=options['processos'], log=self.stdout.write
+        )
+        # Encerramento limpo: para de reivindicar e espera as tarefas em andamento
+        signal.signal(signal.SIGTERM, trabalhador.parar)
+        signal.signal(signal.SIGINT, trabalhador.parar)
+        pool = f"{options['processos']} processos" if options['processos'] else f"{trabalhador.vagas} threads"
+        self.stdout.write(f"👷 Trabalhador {trabalhador.nome} iniciado ({pool})")
+
+        inicio = time.perf_counter()
+        executadas = trabalhador.executar(ate_esvaziar=options['ate_esvaziar'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {executadas} tarefas executadas em {time.perf_counter() - inicio:.1f}s"
+        ))
+        self.mostrar_metricas()
+
+    def mostrar_metricas(self):
+        def ms(valor):
+            return '-' if valor is None else f"{valor:,.0f}ms"
+
+        for nome, item in tarefas.metricas().items():
+            duracao, espera = item['duracao_ms'], item['espera_ms']
+            self.stdout.write(
+                f"📊 {nome}: {item['concluidas']} concluídas, {item['falhas']} falhas, "
+                f"{item['retentativas']} retentativas, {item['pendentes']} pendentes | "
+                f"duração p50 {ms(duracao['p50'])} p95 {ms(duracao['p95'])} | espera p95 {ms(espera['p95'])}"
+            )
@@ -1,14 +1,20 @@
 from django.core.management.base import BaseCommand
 from utils.ml_classifier import FloodSeverityClassifier
+from utils.data_processing.data_sources import data_dir, raw_file
 import os
 
 class Command(BaseCommand):
     help = 'Treina o modelo de Machine Learning para classificação de severidade'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--data', help='CSV de treino (padrão: RAW_DATA_DIR/data.csv)')
+        parser.add_argument('--models-dir', help='Destino dos artefatos (padrão: MODELS_DATA_DIR)')
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('🤖 Iniciando treinamento do modelo ML...'))
         
-        data_path = 'data/raw/data.csv'
+        data_path = raw_file('data.csv', options.get('data'))
+        models_dir = data_dir('models', options.get('models_dir'))
         
         if not os.path.exists(data_path):
             self.stdout.write(self.style.ERROR(f'❌ Arquivo de dados não encontrado: {data_path}'))
@@ -24,7 +30,7 @@ class Command(BaseCommand):
             
             # Salvar modelo
             self.stdout.write('💾 Salvando modelo e artefatos...')
-            classifier.save_model('data/models')
+            classifier.save_model(models_dir)
             
             self.stdout.write(self.style.SUCCESS(f'✅ Modelo treinado e salvo com sucesso!'))
             self.stdout.write(f'🏆 Melhor modelo: {best_model_name}')
@@ -0,0 +1,79 @@
+"""
+Comando Django para conferir o buffer de relatos recentes contra o banco
+"""
+from django.core.management.base import BaseCommand, CommandError
+from dashboard import recentes
+from datetime import timedelta
+import random
+import time
+
+class Command(BaseCommand):
+    help = (
+        'Carrega o buffer em memória de relatos recentes e o compara com o banco. Com '
+        '--simular, aplica antes criações, alterações e remoções pelo ORM (mantidas pelos '
+        'sinais) e desfaz tudo no fim'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--simular',
+            type=int,
+            default=0,
+            help='Escritas a aplicar pelo ORM antes da conferência'
+        )
+
+    def _simular(self, n):
+        from dashboard import ingestao
+        from dashboard.catalogo import catalogo
+        from dashboard.models import RelatorioAlagamento, UsuarioApp
+        from django.utils import timezone
+
+        usuarios = list(UsuarioApp.objects.values_list('id', flat=True)[:100])
+        bairros = [b for b in catalogo.todos() if b.latitude is not None]
+        if not usuarios or not bairros:
+            raise CommandError('Sem usuários ou bairros no banco; gere dados sintéticos antes')
+        rng = random.Random(42)
+        criados = []
+        for _ in range(n):
+            bairro = rng.choice(bairros)
+            relatorio = RelatorioAlagamento(
+                usuario_id=rng.choice(usuarios), bairro_id=bairro.id,
+                latitude=round(bairro.latitude + rng.uniform(-0.01, 0.01), 6),
+                longitude=round(bairro.longitude + rng.uniform(-0.01, 0.01), 6),
+                nivel_severidade=rng.randint(1, 4), descricao='',
+                timestamp=timezone.now() - timedelta(minutes=rng.randint(0, 600)),
+            )
+            ingestao.gravar_lote([relatorio])
+            criados.append(relatorio)
+        for relatorio in rng.sample(criados, n // 3):
+            relatorio.nivel_severidade = rng.randint(1, 4)
+            relatorio.status = rng.choice(['ativo', 'resolvido'])
+            relatorio.save()
+        for relatorio in rng.sample(criados, n // 5):
+            relatorio.delete()
+        return criados
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        recentes.buffer.recarregar()
+        self.stdout.write(f"📦 Buffer carregado em {(time.perf_counter() - inicio) * 1000:.0f}ms")
+
+        criados = self._simular(options['simular']) if options['simular'] else []
+        try:
+            resultado = recentes.buffer.verificar()
+        finally:
+            from dashboard.models import RelatorioAlagamento
+            RelatorioAlagamento.objects.filter(pk__in=[r.pk for r in criados if r.pk]).delete()
+
+        divergencias = resultado['faltando'] + resultado['sobrando'] + resultado['divergentes']
+        self.stdout.write(
+            f"🧮 {resultado['memoria']:,} relatos no buffer, {resultado['banco']:,} ativos no banco "
+            f"(capacidade {resultado['capacidade']:,}, {resultado['sobrescritos']} sobrescritos)"
+        )
+        if divergencias:
+            self.stdout.write(self.style.ERROR(
+                f"❌ {len(resultado['faltando'])} faltando, {len(resultado['sobrando'])} sobrando, "
+                f"{len(resultado['divergentes'])} divergentes: {divergencias[:20]}"
+            ))
+            raise CommandError('Buffer inconsistente com o banco')
+        self.stdout.write(self.style.SUCCESS('✅ Buffer consistente com o banco'))
@@ -0,0 +1,97 @@
+"""
+QuerySets e Managers do Dashboard
+=================================
+
+Consultas reutilizáveis sobre relatórios de alagamento, incluindo o nível de
+urgência calculado no banco (mesma fórmula de
+``RelatorioAlagamento.nivel_urgencia``), para ordenar e paginar por urgência
+sem carregar os objetos em Python.
+"""
+
+from django.db import models
+from django.db.models import ExpressionWrapper, F, FloatField, Func, Value
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+
+class EpochSegundos(Func):
+    """Segundos desde 1970-01-01 UTC de um DateTimeField (SQLite e Postgres)"""
+
+    output_field = FloatField()
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # SQLite guarda datetimes como texto UTC; julianday() os converte em dias
+        return self.as_sql(
+            compiler, connection,
+            template='((julianday(%(expressions)s) - 2440587.5) * 86400.0)',
+            **extra_context
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+def expressao_urgencia(agora=None, prefixo='', confiabilidade=None):
+    """
+    Expressão SQL do nível de urgência (0-100).
+
+    severidade * 25 + min(confirmações * 5, 20) + confiabilidade do usuário * 10
+    + penalidade de tempo max(0, 20 - 2 * horas desde o relato).
+    ``prefixo`` permite usar a expressão a partir de outro modelo (ex.: 'relatorio__').
+    ``confiabilidade`` substitui o join com o usuário (UPDATE não aceita joins).
+    """
+    agora = agora or timezone.now()
+    if confiabilidade is None:
+        confiabilidade = F(f'{prefixo}usuario__nivel_confiabilidade')
+    horas_passadas = (Value(agora.timestamp()) - EpochSegundos(f'{prefixo}timestamp')) / Value(3600.0)
+    penalidade_tempo = Greatest(Value(0.0), Value(20.0) - horas_passadas * Value(2.0))
+
+    urgencia = (
+        F(f'{prefixo}nivel_severidade') * Value(25.0)
+        + Least(F(f'{prefixo}total_confirmacoes') * Value(5.0), Value(20.0))
+        + confiabilidade * Value(10.0)
+        + penalidade_tempo
+    )
+    return ExpressionWrapper(
+        Least(Value(100.0), Greatest(Value(0.0), urgencia)),
+        output_field=FloatField()
+    )
+
+
+class RelatorioAlagamentoQuerySet(models.QuerySet):
+    """Filtros e anotações comuns às views de relatórios"""
+
+    def ativos(self):
+        return self.filter(status='ativo')
+
+    def com_relacionados(self):
+        """Junta bairro e usuário (usados por __str__, nivel_urgencia e templates)"""
+        return self.select_related('bairro', 'usuario')
+
+    def com_urgencia(self, agora=None):
+        """Anota ``urgencia`` calculada no banco"""
+        return self.annotate(urgencia=expressao_urgencia(agora))
+
+    def por_urgencia(self, agora=None):
+        """Ordena do mais urgente para o menos urgente (desempate: mais recente)"""
+        return self.com_urgencia(agora).order_by('-urgencia', '-timestamp', '-id')
+
+    def fila_urgencia(self, bairro=None):
+        """
+        Ativos ordenados pela urgência materializada (``urgencia_score``).
+
+        Usa os índices (status, -urgencia_score) e (bairro, status,
+        -urgencia_score): o top-K é uma leitura de K entradas do índice.
+        """
+        qs = self.ativos()
+        if bairro is not None:
+            qs = qs.filter(bairro=bairro)
+        return qs.order_by('-urgencia_score', '-id')
+
+
+class RelatorioAlagamentoManager(models.Manager.from_queryset(RelatorioAlagamentoQuerySet)):
+    """Manager padrão: sempre traz bairro e usuário na mesma query"""
+
+    def get_queryset(self):
+        return super().get_queryset().com_relacionados()
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_bairro_cidade_bairro_latitude_bairro_longitude_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='relatorioalagamento',
+            name='urgencia_atualizada_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='relatorioalagamento',
+            name='urgencia_score',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='relatorioalagamento',
+            index=models.Index(fields=['status', '-urgencia_score', '-id'], name='relatorio_fila_urgencia_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relatorioalagamento',
+            index=models.Index(fields=['bairro', 'status', '-urgencia_score', '-id'], name='relatorio_fila_bairro_idx'),
+        ),
+    ]
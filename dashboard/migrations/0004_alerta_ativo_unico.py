@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+def desativar_duplicados(apps, schema_editor):
+    """Mantém só o alerta ativo mais recente de cada bairro antes de criar a restrição"""
+    AlertaArea = apps.get_model('dashboard', 'AlertaArea')
+    vistos = set()
+    duplicados = []
+    for pk, bairro_id in (
+        AlertaArea.objects.filter(ativo=True).order_by('bairro_id', '-id').values_list('id', 'bairro_id')
+    ):
+        if bairro_id in vistos:
+            duplicados.append(pk)
+        vistos.add(bairro_id)
+    AlertaArea.objects.filter(pk__in=duplicados).update(ativo=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_urgencia_materializada'),
+    ]
+
+    operations = [
+        migrations.RunPython(desativar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='alertaarea',
+            constraint=models.UniqueConstraint(condition=models.Q(('ativo', True)), fields=('bairro',), name='alerta_ativo_por_bairro'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_alerta_ativo_unico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoAlagamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fim', models.DateTimeField()),
+                ('latitude_min', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('latitude_max', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('longitude_min', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('longitude_max', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('total_relatos', models.IntegerField(default=0)),
+                ('severidade_maxima', models.IntegerField(default=1)),
+                ('ativo', models.BooleanField(default=True)),
+                ('bairro', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='dashboard.bairro')),
+            ],
+            options={
+                'verbose_name': 'Evento de Alagamento',
+                'verbose_name_plural': 'Eventos de Alagamento',
+                'db_table': 'eventos_alagamento',
+                'ordering': ['-fim'],
+            },
+        ),
+        migrations.AddField(
+            model_name='relatorioalagamento',
+            name='evento',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='relatos', to='dashboard.eventoalagamento'),
+        ),
+        migrations.AddIndex(
+            model_name='eventoalagamento',
+            index=models.Index(fields=['ativo', 'fim'], name='eventos_ala_ativo_7541e3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventoalagamento',
+            index=models.Index(fields=['fim'], name='eventos_ala_fim_58d1c9_idx'),
+        ),
+    ]
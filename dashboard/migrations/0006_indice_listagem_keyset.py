@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_eventos_alagamento'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='relatorioalagamento',
+            index=models.Index(fields=['status', '-timestamp', '-id'], name='relatorio_status_recentes_idx'),
+        ),
+    ]
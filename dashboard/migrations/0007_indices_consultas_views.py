@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0006_indice_listagem_keyset'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='relatorioalagamento',
+            name='relatorios__status_1e1aa3_idx',
+        ),
+        migrations.AddIndex(
+            model_name='relatorioalagamento',
+            index=models.Index(condition=models.Q(('status', 'ativo')), fields=['timestamp'], name='relatorio_ativos_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relatorioalagamento',
+            index=models.Index(condition=models.Q(('status', 'ativo')), fields=['bairro', 'timestamp'], name='relatorio_ativos_bairro_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relatorioalagamento',
+            index=models.Index(condition=models.Q(('status', 'ativo')), fields=['nivel_severidade', 'timestamp'], name='relatorio_ativos_sev_idx'),
+        ),
+    ]
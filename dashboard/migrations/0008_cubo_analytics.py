@@ -0,0 +1,80 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:34
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractHour, TruncDate
+
+
+def preencher_cubo(apps, schema_editor):
+    """Agrega os relatos existentes nas tabelas do cubo (estado do modelo nesta migração)"""
+    RelatorioAlagamento = apps.get_model('dashboard', 'RelatorioAlagamento')
+    CuboRelatos = apps.get_model('dashboard', 'CuboRelatos')
+    CuboContribuicoes = apps.get_model('dashboard', 'CuboContribuicoes')
+    banco = schema_editor.connection.alias
+
+    base = RelatorioAlagamento.objects.using(banco).order_by().annotate(
+        dia_local=TruncDate('timestamp'), hora_local=ExtractHour('timestamp')
+    )
+    CuboRelatos.objects.using(banco).bulk_create([
+        CuboRelatos(
+            dia=linha['dia_local'], hora=linha['hora_local'], bairro_id=linha['bairro_id'],
+            severidade=linha['nivel_severidade'], total=linha['n'],
+            soma_confirmacoes=linha['soma'] or 0, soma_confirmacoes_quadrado=linha['soma_quadrado'] or 0,
+        )
+        for linha in base.values('dia_local', 'hora_local', 'bairro_id', 'nivel_severidade').annotate(
+            n=Count('id'),
+            soma=Sum('total_confirmacoes'),
+            soma_quadrado=Sum(F('total_confirmacoes') * F('total_confirmacoes')),
+        )
+    ], batch_size=2000)
+    CuboContribuicoes.objects.using(banco).bulk_create([
+        CuboContribuicoes(dia=linha['dia_local'], usuario_id=linha['usuario_id'],
+                          bairro_id=linha['bairro_id'], total=linha['n'])
+        for linha in base.values('dia_local', 'usuario_id', 'bairro_id').annotate(n=Count('id'))
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_indices_consultas_views'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CuboContribuicoes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('usuario_id', models.IntegerField()),
+                ('bairro_id', models.IntegerField()),
+                ('total', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Contribuições por Dia',
+                'verbose_name_plural': 'Contribuições por Dia',
+                'db_table': 'cubo_contribuicoes',
+                'unique_together': {('dia', 'usuario_id', 'bairro_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CuboRelatos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('hora', models.PositiveSmallIntegerField()),
+                ('bairro_id', models.IntegerField()),
+                ('severidade', models.PositiveSmallIntegerField()),
+                ('total', models.IntegerField(default=0)),
+                ('soma_confirmacoes', models.BigIntegerField(default=0)),
+                ('soma_confirmacoes_quadrado', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Célula do Cubo de Relatos',
+                'verbose_name_plural': 'Cubo de Relatos',
+                'db_table': 'cubo_relatos',
+                'unique_together': {('dia', 'hora', 'bairro_id', 'severidade')},
+            },
+        ),
+        migrations.RunPython(preencher_cubo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:58
+
+from django.db import migrations
+
+TABELA = 'busca_relatos'
+
+
+def criar_indice(apps, schema_editor):
+    """Cria a tabela de busca e indexa os relatos existentes com um INSERT ... SELECT"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA} USING fts5("
+            "descricao, endereco, comentarios, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {TABELA} (rowid, descricao, endereco, comentarios) "
+            "SELECT r.id, r.descricao, r.endereco_aproximado, COALESCE(("
+            "  SELECT group_concat(c.comentario, char(10)) FROM ("
+            "    SELECT comentario FROM interacoes_relatorio"
+            "    WHERE relatorio_id = r.id AND comentario != '' ORDER BY id"
+            "  ) c"
+            "), '') FROM relatorios_alagamento r"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABELA} ("
+            "relatorio_id bigint PRIMARY KEY REFERENCES relatorios_alagamento (id) ON DELETE CASCADE, "
+            "documento tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TABELA}_documento_idx ON {TABELA} USING GIN (documento)"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {TABELA} (relatorio_id, documento) "
+            "SELECT r.id, "
+            "setweight(to_tsvector('portuguese', r.descricao), 'A') || "
+            "setweight(to_tsvector('portuguese', r.endereco_aproximado), 'B') || "
+            "setweight(to_tsvector('portuguese', COALESCE(("
+            "  SELECT string_agg(comentario, E'\\n' ORDER BY id) FROM interacoes_relatorio"
+            "  WHERE relatorio_id = r.id AND comentario <> ''"
+            "), '')), 'C') "
+            "FROM relatorios_alagamento r"
+        )
+
+
+def remover_indice(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABELA}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0008_cubo_analytics'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice, remover_indice),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-19 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0009_busca_textual'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChaveSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('id_relato', models.UUIDField(unique=True)),
+                ('criada_em', models.DateTimeField(auto_now_add=True)),
+                ('relatorio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chaves_sync', to='dashboard.relatorioalagamento')),
+            ],
+            options={
+                'verbose_name': 'Chave de Sincronização',
+                'verbose_name_plural': 'Chaves de Sincronização',
+                'db_table': 'chaves_sync',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0010_chaves_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='relatorioalagamento',
+            name='foto_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='relatorioalagamento',
+            name='foto_processada',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:05
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0011_fotos_pipeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PosicaoConsumidor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100, unique=True)),
+                ('posicao', models.BigIntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Posição de Consumidor',
+                'verbose_name_plural': 'Posições de Consumidores',
+                'db_table': 'posicoes_consumidores',
+            },
+        ),
+        migrations.CreateModel(
+            name='EventoAlteracao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('relatorio', 'Relatório'), ('interacao', 'Interação')], max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('operacao', models.CharField(choices=[('criacao', 'Criação'), ('alteracao', 'Alteração'), ('remocao', 'Remoção')], max_length=10)),
+                ('campos', models.JSONField(blank=True, null=True)),
+                ('dados', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Evento de Alteração',
+                'verbose_name_plural': 'Eventos de Alteração',
+                'db_table': 'eventos_alteracao',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['modelo', 'objeto_id'], name='eventos_alt_modelo_fde8f0_idx'), models.Index(fields=['timestamp'], name='eventos_alt_timesta_603357_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:09
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0012_log_alteracoes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100)),
+                ('argumentos', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('chave', models.CharField(blank=True, max_length=200)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluida', 'Concluída'), ('falhou', 'Falhou')], default='pendente', max_length=20)),
+                ('executar_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('max_tentativas', models.PositiveIntegerField(default=5)),
+                ('trabalhador', models.CharField(blank=True, max_length=100)),
+                ('criada_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('iniciada_em', models.DateTimeField(blank=True, null=True)),
+                ('concluida_em', models.DateTimeField(blank=True, null=True)),
+                ('espera_ms', models.FloatField(blank=True, null=True)),
+                ('duracao_ms', models.FloatField(blank=True, null=True)),
+                ('resultado', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('erro', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Tarefa',
+                'verbose_name_plural': 'Tarefas',
+                'db_table': 'tarefas',
+                'indexes': [models.Index(fields=['status', 'executar_em', 'id'], name='tarefa_fila_idx'), models.Index(fields=['nome', 'concluida_em'], name='tarefa_metricas_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'pendente'), models.Q(('chave', ''), _negated=True)), fields=('chave',), name='tarefa_chave_pendente_unica')],
+            },
+        ),
+    ]
@@ -4,6 +4,7 @@ import pandas as pd
 import numpy as np
 from django.conf import settings
 from utils.ml_classifier import FloodSeverityClassifier
+from utils.data_processing.data_sources import data_dir
 
 class FloodPredictor:
     _instance = None
@@ -16,8 +17,22 @@ class FloodPredictor:
     
     def __init__(self):
         self.classifier = FloodSeverityClassifier(data_path=None)
-        self.model_path = os.path.join(settings.BASE_DIR, 'data', 'models')
-        self.is_loaded = self.classifier.load_model(self.model_path)
+        self.model_path = data_dir('models')
+        self.codigos_bairro = {}
+        self.is_loaded = self._carregar()
+    
+    def _carregar(self):
+        carregado = self.classifier.load_model(self.model_path)
+        if carregado:
+            # Nome -> código do LabelEncoder, resolvido uma vez por processo
+            self.codigos_bairro = {
+                nome: codigo for codigo, nome in enumerate(self.classifier.le_bairro.classes_)
+            }
+        return carregado
+    
+    def codigo_bairro(self, bairro):
+        """Código do bairro no modelo (0 para bairros desconhecidos)"""
+        return self.codigos_bairro.get(str(bairro), 0)
         
     def predict(self, latitude, longitude, timestamp, confirmacoes, bairro):
         """
@@ -25,7 +40,7 @@ class FloodPredictor:
         """
         if not self.is_loaded:
             # Tenta carregar novamente
-            self.is_loaded = self.classifier.load_model(self.model_path)
+            self.is_loaded = self._carregar()
             if not self.is_loaded:
                 return None
                 
@@ -34,7 +49,8 @@ class FloodPredictor:
             'longitude': float(longitude),
             'timestamp': timestamp,
             'confirmacoes': int(confirmacoes),
-            'bairro': str(bairro)
+            'bairro': str(bairro),
+            'bairro_encoded': self.codigo_bairro(bairro),
         }
         
         return self.classifier.predict_severity(data)
@@ -5,12 +5,15 @@ Modelos do Dashboard - Sistema Waze de Alagamentos
 Modelos para representar dados de alagamentos, usuários e interações colaborativas
 """
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 import uuid
 
+from .managers import RelatorioAlagamentoManager
+
 class Bairro(models.Model):
     """Modelo para bairros - expandido para múltiplas cidades"""
     nome = models.CharField(max_length=100)
@@ -100,6 +103,9 @@ class RelatorioAlagamento(models.Model):
     # Metadata
     timestamp = models.DateTimeField(default=timezone.now)
     foto = models.ImageField(upload_to='relatos/', null=True, blank=True)
+    # SHA-256 do arquivo enviado (dashboard.fotos): uploads idênticos compartilham as variantes
+    foto_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    foto_processada = models.BooleanField(default=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ativo')
     
     # Métricas de engajamento
@@ -111,6 +117,20 @@ class RelatorioAlagamento(models.Model):
     confiabilidade_ml = models.FloatField(default=0.5, help_text="Score de confiabilidade do ML")
     validado_automaticamente = models.BooleanField(default=False)
     
+    # Urgência materializada para a fila de prioridade (top-K por índice).
+    # Recalculada por `atualizar_urgencia`; NULL em urgencia_atualizada_em = pendente
+    urgencia_score = models.FloatField(default=0.0)
+    urgencia_atualizada_em = models.DateTimeField(null=True, blank=True)
+    
+    # Evento de alagamento ao qual o relato foi agrupado (dashboard.eventos)
+    evento = models.ForeignKey(
+        'EventoAlagamento', on_delete=models.SET_NULL,
+        null=True, blank=True, related_name='relatos'
+    )
+    
+    # Sempre junta bairro e usuário; .com_urgencia()/.por_urgencia() calculam urgência no banco
+    objects = RelatorioAlagamentoManager()
+    
     class Meta:
         db_table = 'relatorios_alagamento'
         verbose_name = 'Relatório de Alagamento'
@@ -119,7 +139,24 @@ class RelatorioAlagamento(models.Model):
         indexes = [
             models.Index(fields=['bairro', 'nivel_severidade']),
             models.Index(fields=['timestamp']),
-            models.Index(fields=['status']),
+            models.Index(fields=['status', '-urgencia_score', '-id'], name='relatorio_fila_urgencia_idx'),
+            models.Index(fields=['bairro', 'status', '-urgencia_score', '-id'], name='relatorio_fila_bairro_idx'),
+            # Ordem padrão (-timestamp) com desempate por id: listagem por cursor
+            models.Index(fields=['status', '-timestamp', '-id'], name='relatorio_status_recentes_idx'),
+            # Parciais sobre relatos ativos: filtro de quase todas as views
+            # (janela de tempo, opcionalmente por bairro ou severidade)
+            models.Index(
+                fields=['timestamp'], condition=models.Q(status='ativo'),
+                name='relatorio_ativos_ts_idx'
+            ),
+            models.Index(
+                fields=['bairro', 'timestamp'], condition=models.Q(status='ativo'),
+                name='relatorio_ativos_bairro_idx'
+            ),
+            models.Index(
+                fields=['nivel_severidade', 'timestamp'], condition=models.Q(status='ativo'),
+                name='relatorio_ativos_sev_idx'
+            ),
         ]
     
     def __str__(self):
@@ -136,6 +173,11 @@ class RelatorioAlagamento(models.Model):
     @property
     def nivel_urgencia(self):
         """Calcula nível de urgência baseado em vários fatores"""
+        # Já calculada no banco via RelatorioAlagamento.objects.com_urgencia()
+        urgencia = self.__dict__.get('urgencia')
+        if urgencia is not None:
+            return urgencia
+        
         # Base: severidade
         urgencia = self.nivel_severidade * 25
         
@@ -151,6 +193,65 @@ class RelatorioAlagamento(models.Model):
         urgencia += time_penalty
         
         return min(100, max(0, urgencia))
+    
+    def _variante_foto(self, sufixo):
+        if not self.foto:
+            return None
+        if not self.foto_processada:
+            return self.foto.url
+        # Variantes ficam ao lado da foto processada: <hash>_previa.jpg, <hash>_miniatura.jpg
+        return self.foto.storage.url(self.foto.name[:-len('.jpg')] + sufixo + '.jpg')
+    
+    @property
+    def foto_previa_url(self):
+        """Foto em tamanho de página (variante ``_previa``)"""
+        return self._variante_foto('_previa')
+    
+    @property
+    def foto_miniatura_url(self):
+        """Foto em tamanho de lista/mapa (variante ``_miniatura``)"""
+        return self._variante_foto('_miniatura')
+    
+    @property
+    def foto_pendente(self):
+        """Foto recebida e ainda em processamento"""
+        return bool(self.foto_hash) and not self.foto_processada
+    
+    # Contadores desnormalizados: só mudam por UPDATE com F() (dashboard.contadores, visualizacoes)
+    CAMPOS_CONTADORES = ('total_confirmacoes', 'total_negacoes', 'visualizacoes')
+    # Campos lidos por dashboard.cubo (dimensões e medidas)
+    CAMPOS_CUBO = ('timestamp', 'bairro_id', 'nivel_severidade', 'usuario_id', 'total_confirmacoes')
+    # Campos de texto indexados por dashboard.busca
+    CAMPOS_BUSCA = ('descricao', 'endereco_aproximado')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Status como está no banco, para ajustar contadores quando mudar
+        instance._status_original = instance.__dict__.get('status')
+        # Valores que definem a contribuição do relato ao cubo de analytics
+        instance._cubo_original = tuple(instance.__dict__.get(campo) for campo in cls.CAMPOS_CUBO)
+        # Texto como está no índice de busca
+        instance._busca_original = tuple(instance.__dict__.get(campo) for campo in cls.CAMPOS_BUSCA)
+        return instance
+    
+    def save(self, *args, **kwargs):
+        # Novo relato já entra na fila de prioridade com a urgência atual
+        if self._state.adding and self.urgencia_atualizada_em is None:
+            self.urgencia_score = self.nivel_urgencia
+            self.urgencia_atualizada_em = timezone.now()
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Contadores só mudam por UPDATE com F(): o save completo não regrava
+            # valores lidos antes de votos/visualizações concorrentes
+            adiados = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.attname not in adiados
+                and campo.name not in self.CAMPOS_CONTADORES
+            ]
+        # Contadores (dashboard.signals) são ajustados na mesma transação
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
 class InteracaoRelatorio(models.Model):
     """Interações dos usuários com relatórios (confirmações, negações)"""
@@ -181,6 +282,20 @@ class InteracaoRelatorio(models.Model):
     
     def __str__(self):
         return f"{self.usuario.nome_exibicao} - {self.get_tipo_display()} - {self.relatorio.id_relato}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Contador que a interação incrementa, para movê-lo se o tipo mudar
+        instance._contagem_original = (instance.__dict__.get('relatorio_id'), instance.__dict__.get('tipo'))
+        # Comentário como está no índice de busca do relatório
+        instance._busca_original = (instance.__dict__.get('relatorio_id'), instance.__dict__.get('comentario'))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        # Contadores do relatório (dashboard.signals) são ajustados na mesma transação
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
 class AlertaArea(models.Model):
     """Alertas automáticos para áreas com múltiplos alagamentos"""
@@ -210,10 +325,55 @@ class AlertaArea(models.Model):
         verbose_name = 'Alerta de Área'
         verbose_name_plural = 'Alertas de Área'
         ordering = ['-nivel_alerta', '-timestamp_atualizacao']
+        constraints = [
+            # Um alerta ativo por bairro, mesmo com avaliações concorrentes (dashboard.alertas)
+            models.UniqueConstraint(
+                fields=['bairro'], condition=models.Q(ativo=True), name='alerta_ativo_por_bairro'
+            ),
+        ]
     
     def __str__(self):
         return f"Alerta {self.get_nivel_alerta_display()} - {self.bairro.nome} ({self.total_relatos_ativos} relatos)"
 
+class EventoAlagamento(models.Model):
+    """Evento de alagamento: relatos próximos no espaço e no tempo agrupados"""
+    
+    bairro = models.ForeignKey(Bairro, on_delete=models.SET_NULL, null=True, blank=True)
+    
+    # Extensão espaço-temporal
+    inicio = models.DateTimeField()
+    fim = models.DateTimeField()
+    latitude_min = models.DecimalField(max_digits=10, decimal_places=7)
+    latitude_max = models.DecimalField(max_digits=10, decimal_places=7)
+    longitude_min = models.DecimalField(max_digits=10, decimal_places=7)
+    longitude_max = models.DecimalField(max_digits=10, decimal_places=7)
+    
+    # Agregados dos relatos
+    total_relatos = models.IntegerField(default=0)
+    severidade_maxima = models.IntegerField(default=1)
+    ativo = models.BooleanField(default=True)
+    
+    class Meta:
+        db_table = 'eventos_alagamento'
+        verbose_name = 'Evento de Alagamento'
+        verbose_name_plural = 'Eventos de Alagamento'
+        ordering = ['-fim']
+        indexes = [
+            models.Index(fields=['ativo', 'fim']),
+            models.Index(fields=['fim']),
+        ]
+    
+    def __str__(self):
+        nome = self.bairro.nome if self.bairro else 'Sem bairro'
+        return f"Evento {nome} - {self.inicio.strftime('%d/%m %H:%M')} ({self.total_relatos} relatos)"
+    
+    @property
+    def centro(self):
+        return (
+            float(self.latitude_min + self.latitude_max) / 2,
+            float(self.longitude_min + self.longitude_max) / 2,
+        )
+
 class EstatisticaDashboard(models.Model):
     """Cache de estatísticas para performance do dashboard"""
     
@@ -254,3 +414,177 @@ class EstatisticaDashboard(models.Model):
         if self.hora_referencia is not None:
             return f"Stats {self.data_referencia} {self.hora_referencia:02d}h - {self.total_relatos} relatos"
         return f"Stats {self.data_referencia} - {self.total_relatos} relatos"
+
+class CuboRelatos(models.Model):
+    """
+    Cubo de relatos para analytics: uma célula por (dia, hora, bairro, severidade).
+    
+    Mantido incrementalmente por dashboard.cubo. As medidas bastam para a
+    correlação severidade x confirmações sem ler os relatos (a soma de
+    severidades é severidade * total, pois a severidade é dimensão).
+    """
+    
+    # Dimensões (bairro/usuário sem FK: o cubo é derivado e pode ser reconstruído)
+    dia = models.DateField()
+    hora = models.PositiveSmallIntegerField()
+    bairro_id = models.IntegerField()
+    severidade = models.PositiveSmallIntegerField()
+    
+    # Medidas
+    total = models.IntegerField(default=0)
+    soma_confirmacoes = models.BigIntegerField(default=0)
+    soma_confirmacoes_quadrado = models.BigIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'cubo_relatos'
+        verbose_name = 'Célula do Cubo de Relatos'
+        verbose_name_plural = 'Cubo de Relatos'
+        unique_together = ['dia', 'hora', 'bairro_id', 'severidade']
+    
+    def __str__(self):
+        return f"{self.dia} {self.hora:02d}h bairro {self.bairro_id} sev {self.severidade}: {self.total}"
+
+class CuboContribuicoes(models.Model):
+    """Relatos por (dia, usuário, bairro), para o ranking de contribuidores de qualquer período"""
+    
+    dia = models.DateField()
+    usuario_id = models.IntegerField()
+    bairro_id = models.IntegerField()
+    total = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'cubo_contribuicoes'
+        verbose_name = 'Contribuições por Dia'
+        verbose_name_plural = 'Contribuições por Dia'
+        unique_together = ['dia', 'usuario_id', 'bairro_id']
+    
+    def __str__(self):
+        return f"{self.dia} usuário {self.usuario_id}: {self.total}"
+
+class EventoAlteracao(models.Model):
+    """
+    Log de alterações (outbox) de relatórios e interações.
+    
+    Só recebe inserções, na mesma transação da mudança (dashboard.alteracoes);
+    o id crescente é a posição que os consumidores guardam.
+    """
+    
+    MODELO_CHOICES = [
+        ('relatorio', 'Relatório'),
+        ('interacao', 'Interação'),
+    ]
+    OPERACAO_CHOICES = [
+        ('criacao', 'Criação'),
+        ('alteracao', 'Alteração'),
+        ('remocao', 'Remoção'),
+    ]
+    
+    modelo = models.CharField(max_length=20, choices=MODELO_CHOICES)
+    objeto_id = models.BigIntegerField()
+    operacao = models.CharField(max_length=10, choices=OPERACAO_CHOICES)
+    # Campos gravados (update_fields), quando a alteração os informa
+    campos = models.JSONField(null=True, blank=True)
+    # Estado do objeto depois da mudança (antes, na remoção)
+    dados = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    timestamp = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'eventos_alteracao'
+        verbose_name = 'Evento de Alteração'
+        verbose_name_plural = 'Eventos de Alteração'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['modelo', 'objeto_id']),
+            models.Index(fields=['timestamp']),
+        ]
+    
+    def __str__(self):
+        return f"#{self.id} {self.get_operacao_display()} {self.modelo} {self.objeto_id}"
+
+class PosicaoConsumidor(models.Model):
+    """Último evento de alteração processado por um consumidor nomeado"""
+    
+    nome = models.CharField(max_length=100, unique=True)
+    posicao = models.BigIntegerField(default=0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'posicoes_consumidores'
+        verbose_name = 'Posição de Consumidor'
+        verbose_name_plural = 'Posições de Consumidores'
+    
+    def __str__(self):
+        return f"{self.nome} @ {self.posicao}"
+
+class Tarefa(models.Model):
+    """
+    Tarefa da fila de trabalho em segundo plano (dashboard.tarefas).
+    
+    ``nome`` aponta para uma função registrada; ``chave`` (opcional) impede
+    duas tarefas pendentes iguais, coalescendo pedidos repetidos.
+    """
+    
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('falhou', 'Falhou'),
+    ]
+    
+    nome = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    chave = models.CharField(max_length=200, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    
+    # Agendamento e retentativas
+    executar_em = models.DateTimeField(default=timezone.now)
+    tentativas = models.PositiveIntegerField(default=0)
+    max_tentativas = models.PositiveIntegerField(default=5)
+    
+    # Execução
+    trabalhador = models.CharField(max_length=100, blank=True)
+    criada_em = models.DateTimeField(default=timezone.now)
+    iniciada_em = models.DateTimeField(null=True, blank=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+    espera_ms = models.FloatField(null=True, blank=True)  # De executar_em até o início
+    duracao_ms = models.FloatField(null=True, blank=True)
+    resultado = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    erro = models.TextField(blank=True)
+    
+    class Meta:
+        db_table = 'tarefas'
+        verbose_name = 'Tarefa'
+        verbose_name_plural = 'Tarefas'
+        indexes = [
+            # Reivindicação: pendentes vencidas, na ordem de agendamento
+            models.Index(fields=['status', 'executar_em', 'id'], name='tarefa_fila_idx'),
+            models.Index(fields=['nome', 'concluida_em'], name='tarefa_metricas_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['chave'], condition=models.Q(status='pendente') & ~models.Q(chave=''),
+                name='tarefa_chave_pendente_unica'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"#{self.id} {self.nome} ({self.get_status_display()})"
+
+class ChaveSync(models.Model):
+    """
+    ``id_relato`` enviado por um cliente offline e mesclado a um relato
+    existente (dashboard.sincronizacao): mantém a chave de idempotência e o
+    alvo de confirmações que apontem para ela.
+    """
+    
+    id_relato = models.UUIDField(unique=True)
+    relatorio = models.ForeignKey(RelatorioAlagamento, on_delete=models.CASCADE, related_name='chaves_sync')
+    criada_em = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'chaves_sync'
+        verbose_name = 'Chave de Sincronização'
+        verbose_name_plural = 'Chaves de Sincronização'
+    
+    def __str__(self):
+        return f"{self.id_relato} -> {self.relatorio_id}"
@@ -0,0 +1,64 @@
+"""
+Paginação por Chave (keyset)
+============================
+
+Paginação sobre a ordenação ``(-timestamp, -id)`` usando o último item da
+página como cursor: a próxima página é
+``WHERE (timestamp, id) < (ts_cursor, id_cursor)`` com ``LIMIT``, que o
+banco resolve descendo o índice (status, -timestamp, -id) a partir do
+cursor. Ao contrário de ``OFFSET``, a página 1000 custa o mesmo que a
+primeira e inserções concorrentes não duplicam nem pulam itens.
+
+O cursor é opaco para o cliente: JSON ``[timestamp ISO, id]`` em base64.
+"""
+
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 200
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(timestamp, pk):
+    bruto = json.dumps([timestamp.isoformat(), pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Cursor -> (timestamp, id); levanta CursorInvalido se malformado"""
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        texto_ts, pk = json.loads(bruto)
+        timestamp = parse_datetime(texto_ts)
+        if timestamp is None or not isinstance(pk, int):
+            raise ValueError
+        return timestamp, pk
+    except (ValueError, TypeError):
+        raise CursorInvalido(f"Cursor inválido: {cursor!r}")
+
+
+def pagina_keyset(queryset, cursor=None, limite=LIMITE_PADRAO):
+    """
+    Uma página de ``queryset`` em ordem (-timestamp, -id).
+
+    Retorna ``(itens, proximo_cursor)``; ``proximo_cursor`` é None na última
+    página. Busca ``limite + 1`` itens para saber se há continuação sem COUNT.
+    """
+    queryset = queryset.order_by('-timestamp', '-id')
+    if cursor:
+        timestamp, pk = decodificar_cursor(cursor)
+        queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+
+    itens = list(queryset[:limite + 1])
+    if len(itens) <= limite:
+        return itens, None
+    itens = itens[:limite]
+    ultimo = itens[-1]
+    return itens, codificar_cursor(ultimo.timestamp, ultimo.id)
@@ -0,0 +1,56 @@
+"""
+Fila de Prioridade de Relatos
+=============================
+
+Mantém ``RelatorioAlagamento.urgencia_score`` (urgência materializada e
+indexada) para que o top-K de relatos ativos mais urgentes, na cidade ou em
+um bairro, seja uma leitura direta do índice em vez de calcular
+``nivel_urgencia`` para cada relato.
+
+A urgência decai com o tempo apenas nas primeiras 10 horas de um relato
+(penalidade de tempo ``max(0, 20 - 2 * horas)``). Por isso a atualização
+periódica só precisa recalcular, em um único UPDATE:
+
+- relatos pendentes (``urgencia_atualizada_em`` nulo: cargas em lote,
+  mudanças em confirmações);
+- relatos cujo score foi gravado ainda dentro da janela de decaimento.
+
+Depois da janela o score fica estável até a próxima mudança no relato.
+"""
+
+from datetime import timedelta
+
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .managers import expressao_urgencia
+from .models import RelatorioAlagamento, UsuarioApp
+
+# Penalidade de tempo zera após 20 / 2 = 10 horas
+JANELA_DECAIMENTO = timedelta(hours=10)
+
+K_PADRAO = 50
+K_MAXIMO = 500
+
+
+def atualizar_scores(agora=None):
+    """Recalcula ``urgencia_score`` dos relatos ativos desatualizados; retorna quantos"""
+    agora = agora or timezone.now()
+    confiabilidade = Subquery(
+        UsuarioApp.objects.filter(pk=OuterRef('usuario_id')).values('nivel_confiabilidade')[:1]
+    )
+    desatualizados = RelatorioAlagamento.objects.ativos().filter(
+        Q(urgencia_atualizada_em__isnull=True)
+        | Q(urgencia_atualizada_em__lt=F('timestamp') + JANELA_DECAIMENTO)
+    )
+    # .update() sobre o manager padrão descarta o select_related
+    return desatualizados.update(
+        urgencia_score=expressao_urgencia(agora, confiabilidade=confiabilidade),
+        urgencia_atualizada_em=agora,
+    )
+
+
+def mais_urgentes(k=K_PADRAO, bairro=None):
+    """Top-K relatos ativos por urgência materializada (cidade inteira ou um bairro)"""
+    k = max(1, min(int(k), K_MAXIMO))
+    return list(RelatorioAlagamento.objects.fila_urgencia(bairro)[:k])
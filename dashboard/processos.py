@@ -0,0 +1,25 @@
+"""
+Inicialização de processos filhos (pool de ``run_worker --processos``).
+
+Os processos são novos (``spawn``), não cópias do pai: com ``fork`` o filho
+herdaria o socket da conexão do pai e o fecharia em
+``close_old_connections``. Este módulo não importa modelos, pois é carregado
+no processo novo antes de o Django estar configurado.
+"""
+
+import django
+from django.conf import settings
+
+
+def bancos_atuais():
+    """Nome de cada banco em uso neste processo (o de teste, durante os testes)"""
+    from django.db import connections
+
+    return {alias: connections[alias].settings_dict['NAME'] for alias in connections}
+
+
+def iniciar(bancos):
+    """Configura o Django no processo filho, com os mesmos bancos do pai"""
+    django.setup()
+    for alias, nome in bancos.items():
+        settings.DATABASES[alias]['NAME'] = nome
@@ -0,0 +1,268 @@
+"""
+Buffer de Relatos Recentes
+==========================
+
+Anel em memória (array estruturado do numpy, tamanho fixo
+``RECENTES_CAPACIDADE``) com os relatos ativos das últimas
+``RECENTES_JANELA_HORAS`` horas: id, momento, bairro, severidade e
+coordenadas, 37 bytes por relato. Atende sem SQL ``api_dados_tempo_real``,
+o gráfico por hora da home e a seleção dos relatos próximos da página de
+detalhes.
+
+- Carregado do banco no primeiro uso do processo (uma consulta pelo índice
+  parcial de relatos ativos por ``timestamp``).
+- Mantido pelos sinais (``dashboard.signals``) após o commit: relato criado
+  ou alterado entra/é atualizado; relato removido ou que deixou de estar
+  ativo sai. Escritas de outros processos chegam pelo log de alterações
+  (``dashboard.alteracoes``): a cada ``RECENTES_SINCRONIZAR_S`` o buffer lê
+  os eventos de relatórios após a última posição vista, custo proporcional
+  às mudanças. Reaplicar os eventos das escritas do próprio processo não
+  muda nada (cada evento traz o estado completo).
+- Posições são reaproveitadas em ordem de chegada; com o anel cheio o
+  relato mais antigo em ordem de chegada sai. ``verificar`` (comando
+  ``verificar_buffer``) compara o conteúdo com o banco.
+
+As consultas filtram pelo momento, então entradas que saíram da janela não
+aparecem mesmo antes de serem sobrescritas.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import alteracoes
+from .models import RelatorioAlagamento
+
+TIPO = np.dtype([
+    ('id', 'i8'),
+    ('epoch', 'f8'),
+    ('bairro_id', 'i4'),
+    ('severidade', 'i1'),
+    ('latitude', 'f8'),
+    ('longitude', 'f8'),
+])
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def janela():
+    return timedelta(hours=_config('RECENTES_JANELA_HORAS', 48))
+
+
+def _momento(epoch):
+    return datetime.fromtimestamp(float(epoch), tz=dt_timezone.utc)
+
+
+def _linha(pk, timestamp, bairro_id, severidade, latitude, longitude):
+    return (
+        pk, timestamp.timestamp(), bairro_id, severidade, float(latitude), float(longitude),
+    )
+
+
+class BufferRecentes:
+    """Anel de relatos ativos recentes em um array estruturado"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dados = None
+        self._por_id = {}  # id -> posição no anel
+        self._proxima = 0
+        self._posicao_log = 0  # Último evento do log de alterações aplicado
+        self._sincronizado_em = 0.0
+        self.sobrescritos = 0
+
+    # ------------------------------------------------------------ escrita
+
+    def _gravar(self, linha):
+        pk = linha[0]
+        posicao = self._por_id.get(pk)
+        if posicao is None:
+            posicao = self._proxima
+            self._proxima = (posicao + 1) % len(self._dados)
+            anterior = int(self._dados['id'][posicao])
+            if anterior and self._por_id.get(anterior) == posicao:
+                del self._por_id[anterior]
+                self.sobrescritos += 1
+            self._por_id[pk] = posicao
+        self._dados[posicao] = linha
+
+    def _retirar(self, pk):
+        posicao = self._por_id.pop(pk, None)
+        if posicao is not None:
+            self._dados['id'][posicao] = 0
+
+    def _consulta(self, agora):
+        return RelatorioAlagamento.objects.select_related(None).filter(
+            status='ativo', timestamp__gte=agora - janela()
+        ).values_list('id', 'timestamp', 'bairro_id', 'nivel_severidade', 'latitude', 'longitude')
+
+    def _carregar(self, agora):
+        capacidade = _config('RECENTES_CAPACIDADE', 50_000)
+        # Posição lida antes dos relatos: o que mudar no meio é reaplicado depois
+        self._posicao_log = alteracoes.ultima_posicao()
+        # Mais recentes primeiro: se não couberem todos, ficam os novos
+        linhas = list(self._consulta(agora).order_by('-timestamp', '-id')[:capacidade])
+        self._dados = np.zeros(capacidade, dtype=TIPO)
+        self._por_id = {}
+        self._proxima = 0
+        self.sobrescritos = 0
+        for linha in reversed(linhas):
+            self._gravar(_linha(*linha))
+        self._sincronizado_em = time.monotonic()
+
+    def _aplicar(self, pk, dados, limite):
+        """Estado de um relato (ou None, se removido) -> entra, é atualizado ou sai do anel"""
+        if dados is not None and dados['status'] == 'ativo' and dados['timestamp'] >= limite:
+            self._gravar(_linha(
+                pk, dados['timestamp'], dados['bairro_id'], dados['nivel_severidade'],
+                dados['latitude'], dados['longitude'],
+            ))
+        else:
+            self._retirar(pk)
+
+    def _atualizar(self, agora):
+        """Carga inicial ou leitura das mudanças no log de alterações (inclusive de outros processos)"""
+        relogio = time.monotonic()
+        if self._dados is None:
+            self._carregar(agora)
+        elif relogio - self._sincronizado_em >= _config('RECENTES_SINCRONIZAR_S', 5):
+            limite = agora - janela()
+            while True:
+                eventos, posicao = alteracoes.ler(self._posicao_log, modelos=('relatorio',), agora=agora)
+                for evento in eventos:
+                    dados = None
+                    if evento.operacao != 'remocao':
+                        dados = dict(evento.dados, timestamp=parse_datetime(evento.dados['timestamp']))
+                    self._aplicar(evento.objeto_id, dados, limite)
+                if posicao == self._posicao_log:
+                    break
+                self._posicao_log = posicao
+            self._sincronizado_em = relogio
+
+    def registrar(self, relatorios):
+        """Relatos criados/alterados (já gravados): entram, são atualizados ou saem do anel"""
+        limite = timezone.now() - janela()
+        with self._lock:
+            if self._dados is None:
+                return  # Ainda não carregado: a carga lê o banco
+            for r in relatorios:
+                self._aplicar(r.pk, {
+                    'status': r.status, 'timestamp': r.timestamp, 'bairro_id': r.bairro_id,
+                    'nivel_severidade': r.nivel_severidade, 'latitude': r.latitude, 'longitude': r.longitude,
+                }, limite)
+
+    def remover(self, ids):
+        with self._lock:
+            if self._dados is not None:
+                for pk in ids:
+                    self._retirar(pk)
+
+    def invalidar(self):
+        with self._lock:
+            self._dados = None
+
+    # ------------------------------------------------------------ leitura
+
+    def _selecao(self, desde, ate=None, bairro_id=None):
+        """Cópia das linhas ocupadas com momento em [desde, ate)"""
+        dados = self._dados
+        filtro = (dados['id'] != 0) & (dados['epoch'] >= desde.timestamp())
+        if ate is not None:
+            filtro &= dados['epoch'] < ate.timestamp()
+        if bairro_id is not None:
+            filtro &= dados['bairro_id'] == bairro_id
+        return dados[filtro]
+
+    def selecionar(self, desde, ate=None, bairro_id=None, agora=None):
+        agora = agora or timezone.now()
+        with self._lock:
+            self._atualizar(agora)
+            return self._selecao(desde, ate, bairro_id)
+
+    def novos(self, minutos=10, agora=None):
+        """Relatos ativos dos últimos ``minutos``, como dicts, do mais novo ao mais antigo"""
+        agora = agora or timezone.now()
+        linhas = self.selecionar(agora - timedelta(minutes=minutos), agora=agora)
+        linhas = linhas[np.lexsort((-linhas['id'], -linhas['epoch']))]
+        return [
+            {
+                'id': int(linha['id']),
+                'bairro_id': int(linha['bairro_id']),
+                'nivel_severidade': int(linha['severidade']),
+                'timestamp': _momento(linha['epoch']),
+                'latitude': float(linha['latitude']),
+                'longitude': float(linha['longitude']),
+            }
+            for linha in linhas
+        ]
+
+    def por_hora(self, inicio, horas=24, agora=None):
+        """Contagem de relatos ativos por hora a partir de ``inicio``"""
+        linhas = self.selecionar(inicio, inicio + timedelta(hours=horas), agora=agora)
+        faixas = ((linhas['epoch'] - inicio.timestamp()) // 3600).astype(np.int64)
+        return np.bincount(faixas, minlength=horas)[:horas].tolist()
+
+    def ultimos_ids(self, limite, desde, bairro_id=None, excluir=(), agora=None):
+        """Ids dos ``limite`` relatos mais recentes (desempate por id), opcionalmente de um bairro"""
+        linhas = self.selecionar(desde, bairro_id=bairro_id, agora=agora)
+        if excluir:
+            linhas = linhas[~np.isin(linhas['id'], list(excluir))]
+        ordem = np.lexsort((-linhas['id'], -linhas['epoch']))[:limite]
+        return linhas['id'][ordem].tolist()
+
+    # ------------------------------------------------------------ conferência
+
+    def verificar(self, agora=None):
+        """
+        Compara o anel com o banco na janela. Retorna ``faltando`` (ativos no
+        banco fora do anel), ``sobrando`` (no anel mas não ativos no banco) e
+        ``divergentes`` (campos diferentes), como listas de ids.
+        """
+        agora = agora or timezone.now()
+        with self._lock:
+            self._atualizar(agora)
+            # Mesmo corte nos dois lados, com a margem de quem entrou agora
+            limite = agora - janela() + timedelta(minutes=1)
+            memoria = {int(linha['id']): tuple(linha.tolist()) for linha in self._selecao(limite)}
+            banco = {
+                linha[0]: _linha(*linha)
+                for linha in self._consulta(agora).filter(timestamp__gte=limite).order_by()
+            }
+        return {
+            'memoria': len(memoria),
+            'banco': len(banco),
+            'faltando': sorted(set(banco) - set(memoria)),
+            'sobrando': sorted(set(memoria) - set(banco)),
+            'divergentes': sorted(
+                pk for pk in set(banco) & set(memoria)
+                if not np.allclose(np.array(banco[pk], dtype=float), np.array(memoria[pk], dtype=float))
+            ),
+            'capacidade': 0 if self._dados is None else len(self._dados),
+            'sobrescritos': self.sobrescritos,
+        }
+
+    def recarregar(self, agora=None):
+        with self._lock:
+            self._carregar(agora or timezone.now())
+
+
+buffer = BufferRecentes()
+
+
+def registrar(relatorios):
+    """Atualiza o anel após o commit da transação atual"""
+    relatorios = list(relatorios)
+    transaction.on_commit(lambda: buffer.registrar(relatorios))
+
+
+def remover(ids):
+    ids = list(ids)
+    transaction.on_commit(lambda: buffer.remover(ids))
@@ -0,0 +1,177 @@
+"""
+Sinais do Dashboard
+===================
+
+Reações a mudanças nos relatórios e interações que mantêm estruturas
+derivadas em dia: contadores desnormalizados, cubo de analytics, alertas por
+área, eventos de alagamento, detecção de spam, índice de busca textual,
+processamento de fotos, o buffer de relatos recentes, o log de alterações
+e o catálogo de bairros em memória.
+"""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import alertas, alteracoes, busca, contadores, cubo, eventos, fotos, recentes, spam
+from .catalogo import catalogo
+from .models import Bairro, InteracaoRelatorio, RelatorioAlagamento, UsuarioApp
+
+# Campos que não afetam estruturas derivadas (ex.: contador de visualizações)
+CAMPOS_IRRELEVANTES = frozenset({'visualizacoes'})
+
+
+def _relevante(update_fields):
+    return update_fields is None or not set(update_fields) <= CAMPOS_IRRELEVANTES
+
+
+def _modelo_origem(origin):
+    """Modelo de onde partiu um delete (instância ou queryset)"""
+    return getattr(origin, 'model', type(origin))
+
+
+def _validos(status):
+    return 1 if status in contadores.STATUS_VALIDOS else 0
+
+
+def _texto_alterado(instance, created, update_fields):
+    if created:
+        return True
+    if update_fields is not None and not set(update_fields) & set(instance.CAMPOS_BUSCA):
+        return False
+    atual = tuple(getattr(instance, campo) for campo in instance.CAMPOS_BUSCA)
+    return getattr(instance, '_busca_original', None) != atual
+
+
+@receiver(post_save, sender=RelatorioAlagamento, dispatch_uid='relatorio_salvo')
+def relatorio_salvo(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    if raw or not _relevante(update_fields):
+        return
+
+    original = getattr(instance, '_status_original', None)
+    if created:
+        contadores.ajustar_relatos_usuario(instance.usuario_id, 1, _validos(instance.status))
+    elif original is not None and original != instance.status:
+        contadores.ajustar_relatos_usuario(
+            instance.usuario_id, delta_validados=_validos(instance.status) - _validos(original)
+        )
+    instance._status_original = instance.status
+    alteracoes.registrar(instance, 'criacao' if created else 'alteracao', update_fields)
+    cubo.registrar_salvo(instance, created)
+    if _texto_alterado(instance, created, update_fields):
+        busca.indexar([instance.pk])
+        instance._busca_original = tuple(getattr(instance, campo) for campo in instance.CAMPOS_BUSCA)
+    recentes.registrar([instance])
+
+    if getattr(settings, 'ALERTAS_AVALIAR_AO_SALVAR', True):
+        alertas.marcar_bairro(instance.bairro_id)
+    if created and getattr(settings, 'EVENTOS_AGRUPAR_AO_SALVAR', True):
+        eventos.agendar([instance.pk])
+    if created and instance.descricao:
+        spam.agendar()
+    if instance.foto_hash and not instance.foto_processada:
+        fotos.agendar(instance.foto_hash)
+
+
+def relatorios_criados(relatorios):
+    """
+    Equivalente em lote de ``relatorio_salvo(created=True)`` para relatos
+    inseridos com ``bulk_create`` (``dashboard.ingestao``), na mesma
+    transação: uma escrita por estrutura derivada e por autor, não por relato.
+    """
+    por_usuario = defaultdict(lambda: [0, 0])
+    for relatorio in relatorios:
+        por_usuario[relatorio.usuario_id][0] += 1
+        por_usuario[relatorio.usuario_id][1] += _validos(relatorio.status)
+        relatorio._status_original = relatorio.status
+        relatorio._busca_original = tuple(getattr(relatorio, campo) for campo in relatorio.CAMPOS_BUSCA)
+    # Ordem fixa de autores: lotes concorrentes travam as linhas na mesma ordem
+    for usuario_id, (total, validados) in sorted(por_usuario.items()):
+        contadores.ajustar_relatos_usuario(usuario_id, total, validados)
+    alteracoes.registrar_lote(relatorios, 'criacao')
+    cubo.acumular_relatorios(relatorios)
+    busca.indexar_relatorios(relatorios)
+    recentes.registrar(relatorios)
+
+    if getattr(settings, 'ALERTAS_AVALIAR_AO_SALVAR', True):
+        for bairro_id in {relatorio.bairro_id for relatorio in relatorios}:
+            alertas.marcar_bairro(bairro_id)
+    if getattr(settings, 'EVENTOS_AGRUPAR_AO_SALVAR', True):
+        eventos.agendar([relatorio.pk for relatorio in relatorios])
+    if any(relatorio.descricao for relatorio in relatorios):
+        spam.agendar()
+    for foto_hash in {r.foto_hash for r in relatorios if r.foto_hash and not r.foto_processada}:
+        fotos.agendar(foto_hash)
+
+
+@receiver(post_delete, sender=RelatorioAlagamento, dispatch_uid='relatorio_removido')
+def relatorio_removido(sender, instance, origin=None, **kwargs):
+    # Autor removido junto: não há contador para ajustar
+    if _modelo_origem(origin) not in (UsuarioApp, User):
+        contadores.ajustar_relatos_usuario(instance.usuario_id, -1, -_validos(instance.status))
+    alteracoes.registrar(instance, 'remocao')
+    cubo.registrar_removido(instance)
+    busca.remover([instance.pk])
+    recentes.remover([instance.pk])
+
+    if getattr(settings, 'ALERTAS_AVALIAR_AO_SALVAR', True):
+        alertas.marcar_bairro(instance.bairro_id)
+
+
+def _ajustar_contagem(instance, created, update_fields):
+    """Contador do relatório: soma o voto novo ou o move se tipo/relatório mudou"""
+    if update_fields is not None and not set(update_fields) & {'relatorio', 'relatorio_id', 'tipo'}:
+        return
+    original = getattr(instance, '_contagem_original', None)
+    atual = (instance.relatorio_id, instance.tipo)
+    if created:
+        contadores.ajustar_interacao(*atual, 1)
+    elif original is not None and original != atual:
+        contadores.ajustar_interacao(*original, -1)
+        contadores.ajustar_interacao(*atual, 1)
+    instance._contagem_original = atual
+
+
+def _reindexar_comentario(instance, created, update_fields):
+    """Índice de busca: o comentário entra no documento do relatório; editado, sai o texto antigo"""
+    if update_fields is not None and not set(update_fields) & {'relatorio', 'relatorio_id', 'comentario'}:
+        return
+    original = getattr(instance, '_busca_original', None)
+    atual = (instance.relatorio_id, instance.comentario)
+    instance._busca_original = atual
+    if created:
+        if instance.comentario:
+            busca.indexar([instance.relatorio_id])
+            spam.agendar()
+    elif original is not None and original != atual:
+        busca.indexar(sorted({original[0], atual[0]}))
+        if instance.comentario:
+            spam.agendar()
+
+
+@receiver(post_save, sender=InteracaoRelatorio, dispatch_uid='interacao_salva')
+def interacao_salva(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    alteracoes.registrar(instance, 'criacao' if created else 'alteracao', update_fields)
+    _ajustar_contagem(instance, created, update_fields)
+    _reindexar_comentario(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=InteracaoRelatorio, dispatch_uid='interacao_removida')
+def interacao_removida(sender, instance, origin=None, **kwargs):
+    # Relatório removido junto: não há contador nem documento de busca para ajustar
+    if _modelo_origem(origin) is not RelatorioAlagamento:
+        alteracoes.registrar(instance, 'remocao')
+        contadores.ajustar_interacao(instance.relatorio_id, instance.tipo, -1)
+        if instance.comentario:
+            busca.indexar([instance.relatorio_id])
+
+
+@receiver(post_save, sender=Bairro, dispatch_uid='bairro_salvo')
+@receiver(post_delete, sender=Bairro, dispatch_uid='bairro_removido')
+def bairro_alterado(sender, **kwargs):
+    catalogo.invalidar()
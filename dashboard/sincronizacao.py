@@ -0,0 +1,231 @@
+"""
+Sincronização em Lote (clientes offline)
+========================================
+
+Um cliente que ficou sem conexão envia de uma vez os relatos e as
+confirmações acumulados (``api_sync``). Cada relato traz o próprio
+``id_relato`` (UUID gerado no aparelho), que serve de chave de
+idempotência: reenviar o mesmo lote depois de uma resposta perdida não
+duplica nada. Confirmações são idempotentes pela restrição única
+(relato, usuário, tipo) e podem apontar para relatos do próprio lote.
+
+Fluxo, com um número fixo de consultas por lote (não por item):
+
+1. valida cada relato com ``RelatorioAlagamentoForm`` e o ``timestamp`` do
+   aparelho (até ``SYNC_ATRASO_MAXIMO_HORAS`` no passado, nunca no futuro);
+2. uma consulta separa os ``id_relato`` já gravados, como relato ou como
+   ``ChaveSync`` de um relato mesclado (resultado ``duplicado``); relatos
+   próximos de um ativo são mesclados como na submissão normal
+   (``deduplicacao``) e, na mesma transação, a chave é guardada em
+   ``ChaveSync`` apontando para o relato que ficou;
+3. os novos são inseridos com um ``bulk_create`` (``ingestao.gravar_lote``,
+   que atualiza as estruturas derivadas uma vez por lote);
+4. as confirmações são resolvidas contra o banco (relatos e chaves
+   mescladas) e gravadas por ``interacoes.registrar_votos``: as novas entram
+   com ``INSERT ... ON CONFLICT DO NOTHING RETURNING`` e os votos opostos
+   saem com ``DELETE ... RETURNING``, então dois reenvios simultâneos do
+   mesmo lote não falham e contadores, índice de busca e log de alterações
+   são ajustados só pelas linhas que de fato entraram ou saíram.
+
+A resposta traz um resultado por item, na ordem recebida.
+"""
+
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import deduplicacao, ingestao, interacoes
+from .forms import RelatorioAlagamentoForm
+from .models import ChaveSync, RelatorioAlagamento
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def _uuid(valor):
+    try:
+        return uuid.UUID(str(valor))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def _timestamp(valor, agora):
+    """Momento do relato no aparelho; None = agora. Levanta ValueError se inválido"""
+    if valor in (None, ''):
+        return agora
+    momento = parse_datetime(str(valor))
+    if momento is None:
+        raise ValueError(f"timestamp inválido: {valor}")
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    if momento > agora + timedelta(minutes=5):
+        raise ValueError('timestamp no futuro')
+    if momento < agora - timedelta(hours=_config('SYNC_ATRASO_MAXIMO_HORAS', 72)):
+        raise ValueError('timestamp antigo demais para sincronizar')
+    return momento
+
+
+def _validar_relatos(itens, usuario_id, agora):
+    """-> (resultados na ordem recebida, {uuid: (posição, relatorio)} válidos)"""
+    resultados, validos = [], {}
+    for posicao, item in enumerate(itens):
+        item = item if isinstance(item, dict) else {}
+        chave = _uuid(item.get('id_relato'))
+        resultados.append({'id_relato': str(chave) if chave else item.get('id_relato')})
+        if chave is None:
+            resultados[-1].update(status='invalido', erros={'id_relato': ['UUID obrigatório']})
+            continue
+        if chave in validos:
+            resultados[-1].update(status='duplicado_no_lote')
+            continue
+
+        form = RelatorioAlagamentoForm(item)
+        erros = {} if form.is_valid() else {campo: [e['message'] for e in lista]
+                                            for campo, lista in form.errors.get_json_data().items()}
+        try:
+            momento = _timestamp(item.get('timestamp'), agora)
+        except ValueError as e:
+            erros['timestamp'] = [str(e)]
+        if erros:
+            resultados[-1].update(status='invalido', erros=erros)
+            continue
+
+        relatorio = form.save(commit=False)
+        relatorio.id_relato = chave
+        relatorio.usuario_id = usuario_id
+        relatorio.timestamp = momento
+        validos[chave] = (posicao, relatorio)
+    return resultados, validos
+
+
+def _chaves_mescladas(chaves):
+    """{id_relato: relatorio_id} das chaves de relatos mesclados em sincronizações anteriores"""
+    return dict(ChaveSync.objects.filter(id_relato__in=list(chaves)).values_list('id_relato', 'relatorio_id'))
+
+
+def _mesclar(chave, relatorio):
+    """Mescla e guarda a chave na mesma transação; retorna ``(status, relatorio_id)`` ou None"""
+    try:
+        # Trava antes da transação (SQLite): a mesclagem vota sob a mesma trava
+        with interacoes.trava_escrita(), transaction.atomic():
+            mesclado = deduplicacao.mesclar(relatorio, sincronizar=False)
+            if mesclado is None:
+                return None
+            ChaveSync.objects.create(id_relato=chave, relatorio_id=mesclado.id)
+    except IntegrityError:
+        # Reenvio simultâneo do mesmo lote mesclou e guardou a chave primeiro
+        return 'duplicado', _chaves_mescladas([chave]).get(chave)
+    return 'mesclado', mesclado.id
+
+
+def _gravar_relatos(validos, resultados):
+    existentes = dict(
+        RelatorioAlagamento.objects.select_related(None)
+        .filter(id_relato__in=list(validos)).values_list('id_relato', 'id')
+    )
+    existentes.update(_chaves_mescladas(validos))
+    novos = []
+    deduplicacao.indice.sincronizar()
+    for chave, (posicao, relatorio) in validos.items():
+        if chave in existentes:
+            resultados[posicao].update(status='duplicado', id=existentes[chave])
+            continue
+        mesclagem = _mesclar(chave, relatorio)
+        if mesclagem is not None:
+            status, relatorio_id = mesclagem
+            resultados[posicao].update(status=status, id=relatorio_id)
+            existentes[chave] = relatorio_id
+            continue
+        novos.append((posicao, relatorio))
+
+    if novos:
+        try:
+            with transaction.atomic():
+                ingestao.gravar_lote([relatorio for _, relatorio in novos])
+        except IntegrityError:
+            # Outro envio do mesmo lote gravou algum id_relato no meio tempo: um a um
+            for posicao, relatorio in novos:
+                relatorio.pk = None
+                try:
+                    with transaction.atomic():
+                        ingestao.gravar_lote([relatorio])
+                except IntegrityError:
+                    relatorio.pk = RelatorioAlagamento.objects.filter(
+                        id_relato=relatorio.id_relato
+                    ).values_list('id', flat=True).first()
+                    resultados[posicao].update(status='duplicado', id=relatorio.pk)
+        for posicao, relatorio in novos:
+            resultados[posicao].setdefault('status', 'criado')
+            resultados[posicao].setdefault('id', relatorio.pk)
+    # id_relato -> id no banco de cada relato do lote (o relato existente, se mesclado)
+    return {**existentes, **{relatorio.id_relato: relatorio.pk for _, relatorio in novos}}
+
+
+def _gravar_confirmacoes(itens, usuario_id, ids_do_lote):
+    resultados, pedidos = [], []
+    for posicao, item in enumerate(itens):
+        item = item if isinstance(item, dict) else {}
+        chave, tipo = _uuid(item.get('id_relato')), item.get('tipo', 'confirmacao')
+        resultados.append({'id_relato': str(chave) if chave else item.get('id_relato'), 'tipo': tipo})
+        if chave is None:
+            resultados[-1].update(status='invalida', erro='id_relato deve ser um UUID')
+        elif tipo not in interacoes.TIPOS_VOTO:
+            resultados[-1].update(status='invalida', erro="tipo deve ser 'confirmacao' ou 'negacao'")
+        else:
+            pedidos.append((posicao, chave, tipo, (item.get('comentario') or '')[:300]))
+    if not pedidos:
+        return resultados
+
+    # Relatos mesclados a outro (neste lote ou antes): a confirmação vai para o relato que ficou
+    chaves = {chave for _, chave, _, _ in pedidos}
+    mescladas = _chaves_mescladas(chaves)
+    mescladas.update((chave, ids_do_lote[chave]) for chave in chaves if chave in ids_do_lote)
+    alvos, ids = {}, {}
+    for pk, chave, autor, status in (
+        RelatorioAlagamento.objects.select_related(None)
+        .filter(Q(id_relato__in=chaves) | Q(pk__in=list(mescladas.values())))
+        .values_list('id', 'id_relato', 'usuario_id', 'status')
+    ):
+        alvos[pk] = (pk, autor, status)
+        ids[chave] = pk
+    ids.update(mescladas)
+
+    votos = {}  # (relatorio_id, tipo) -> (posição, comentário); o último pedido vale
+    for posicao, chave, tipo, comentario in pedidos:
+        alvo = alvos.get(ids.get(chave))
+        if alvo is None:
+            resultados[posicao].update(status='invalida', erro='Relato não encontrado')
+        elif alvo[1] == usuario_id:
+            resultados[posicao].update(status='invalida', erro='O autor não pode votar no próprio relato')
+        elif alvo[2] != 'ativo':
+            resultados[posicao].update(status='invalida', erro='Relato não está ativo')
+        else:
+            resultados[posicao]['id'] = alvo[0]
+            for anterior in (votos.pop((alvo[0], t), None) for t in interacoes.TIPOS_VOTO):
+                if anterior is not None:
+                    resultados[anterior[0]]['status'] = 'substituida'
+            votos[(alvo[0], tipo)] = (posicao, comentario)
+    if not votos:
+        return resultados
+
+    entraram, _ = interacoes.registrar_votos(usuario_id, [
+        (relatorio_id, tipo, comentario) for (relatorio_id, tipo), (_, comentario) in votos.items()
+    ])
+    for chave, (posicao, _) in votos.items():
+        resultados[posicao]['status'] = 'criada' if chave in entraram else 'duplicada'
+    return resultados
+
+
+def sincronizar(usuario_id, relatos=(), confirmacoes=()):
+    """Grava relatos e confirmações enviados em lote; retorna o resultado de cada item"""
+    agora = timezone.now()
+    resultados_relatos, validos = _validar_relatos(list(relatos), usuario_id, agora)
+    ids_do_lote = _gravar_relatos(validos, resultados_relatos) if validos else {}
+    resultados_confirmacoes = _gravar_confirmacoes(list(confirmacoes), usuario_id, ids_do_lote)
+    return {'relatos': resultados_relatos, 'confirmacoes': resultados_confirmacoes}
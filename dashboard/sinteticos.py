@@ -0,0 +1,135 @@
+"""
+Carga de dados sintéticos no banco
+==================================
+
+Insere relatórios gerados por ``utils.data_processing.create_synthetic_data``
+diretamente no banco com ``bulk_create``, bloco a bloco, para montar bases de
+teste de carga (10k / 1M / 10M relatos) sem passar por CSV.
+"""
+
+from datetime import timedelta, timezone as dt_timezone
+
+import pandas as pd
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from utils.data_processing.create_synthetic_data import (
+    DEFAULT_CHUNK_SIZE, DEFAULT_SEED, bairros_catalogo, iter_synthetic_chunks
+)
+from . import alteracoes, busca, cubo
+from .catalogo import catalogo
+from .models import Bairro, UsuarioApp, RelatorioAlagamento
+
+PREFIXO_USUARIO = 'sintetico_'
+
+
+def garantir_bairros():
+    """Cria (se preciso) os bairros do catálogo sintético; retorna {(nome, cidade, uf): id}"""
+    existentes = {
+        (b.nome, b.cidade, b.uf): b.id
+        for b in Bairro.objects.all()
+    }
+    novos = [
+        Bairro(nome=nome, cidade=cidade, uf=uf, latitude=lat, longitude=lon)
+        for cidade, uf, nome, lat, lon in bairros_catalogo()
+        if (nome, cidade, uf) not in existentes
+    ]
+    if novos:
+        Bairro.objects.bulk_create(novos, ignore_conflicts=True)
+        # bulk_create não dispara sinais
+        catalogo.invalidar()
+        existentes = {
+            (b.nome, b.cidade, b.uf): b.id
+            for b in Bairro.objects.all()
+        }
+    return existentes
+
+
+def _mapa_usuarios(codigos):
+    """{codigo: usuario_app_id} dos usuários sintéticos já existentes"""
+    pares = UsuarioApp.objects.filter(
+        usuario__username__in=[PREFIXO_USUARIO + c for c in codigos]
+    ).values_list('usuario__username', 'id')
+    return {username[len(PREFIXO_USUARIO):]: pk for username, pk in pares}
+
+
+def garantir_usuarios(codigos):
+    """Cria em lote os usuários sintéticos que faltam; retorna {codigo: usuario_app_id}"""
+    codigos = set(codigos)
+    mapa = _mapa_usuarios(codigos)
+
+    faltantes = sorted(codigos - set(mapa))
+    if not faltantes:
+        return mapa
+
+    senha = make_password(None)
+    User.objects.bulk_create(
+        [User(username=PREFIXO_USUARIO + c, password=senha) for c in faltantes],
+        ignore_conflicts=True
+    )
+    users = User.objects.filter(
+        username__in=[PREFIXO_USUARIO + c for c in faltantes],
+        usuarioapp__isnull=True
+    )
+    UsuarioApp.objects.bulk_create(
+        [
+            UsuarioApp(
+                usuario=user,
+                nome_exibicao=user.username[len(PREFIXO_USUARIO):],
+                # Confiabilidade estável por usuário (0.3-0.9)
+                nivel_confiabilidade=0.3 + (user.id % 7) * 0.1,
+            )
+            for user in users
+        ],
+        ignore_conflicts=True
+    )
+    return _mapa_usuarios(codigos)
+
+
+def carregar_relatorios(n_records, seed=DEFAULT_SEED, chunk_size=DEFAULT_CHUNK_SIZE,
+                        batch_size=2000, dias=180, fim=None, progresso=None):
+    """
+    Gera e insere ``n_records`` relatórios sintéticos.
+
+    Os timestamps cobrem os ``dias`` anteriores a ``fim`` (padrão: agora), para
+    que as janelas usadas pelas views (24h, 30 e 90 dias) tenham dados.
+    Cada bloco é gravado em uma transação com ``bulk_create``.
+    """
+    fim = fim or timezone.now()
+    # O gerador trabalha com datetimes ingênuos em UTC
+    inicio = (fim - timedelta(days=dias)).astimezone(dt_timezone.utc).replace(tzinfo=None)
+    bairros = garantir_bairros()
+    total = 0
+
+    for chunk in iter_synthetic_chunks(n_records, seed, chunk_size, start_date=inicio, days=dias):
+        usuarios = garantir_usuarios(chunk['usuario'].unique())
+        timestamps = pd.to_datetime(chunk['data']).dt.tz_localize('UTC')
+
+        relatorios = [
+            RelatorioAlagamento(
+                usuario_id=usuarios[row.usuario],
+                bairro_id=bairros[(row.bairro, row.cidade, row.uf)],
+                latitude=round(row.latitude, 7),
+                longitude=round(row.longitude, 7),
+                nivel_severidade=int(row.severidade),
+                descricao=row.descricao,
+                total_confirmacoes=int(row.confirmacoes),
+                timestamp=ts.to_pydatetime(),
+                endereco_aproximado=f"Região do {row.bairro}",
+            )
+            for row, ts in zip(chunk.itertuples(index=False), timestamps)
+        ]
+
+        with transaction.atomic():
+            RelatorioAlagamento.objects.bulk_create(relatorios, batch_size=batch_size)
+            alteracoes.registrar_lote(relatorios, 'criacao')
+            cubo.acumular_relatorios(relatorios)
+            busca.indexar_relatorios(relatorios)
+
+        total += len(relatorios)
+        if progresso:
+            progresso(total)
+
+    return total
@@ -0,0 +1,250 @@
+"""
+Detecção de Spam por Texto (MinHash/LSH)
+========================================
+
+Campanhas de copia-e-cola aparecem como muitos textos quase iguais em pouco
+tempo. Cada ``descricao`` de relato e ``comentario`` de interação vira uma
+assinatura MinHash (``NUM_PERMUTACOES`` hashes sobre os 5-gramas de
+caracteres do texto normalizado), indexada por LSH em ``BANDAS`` bandas: só
+textos que coincidem inteiros em alguma banda são comparados, então cada
+texto novo custa O(tamanho dos seus baldes), não O(textos indexados). Com
+16 bandas de 8 linhas, pares com Jaccard acima de ~0,7 quase sempre
+colidem; a similaridade estimada pelas assinaturas confirma o par
+(``SPAM_LIMIAR_SIMILARIDADE``).
+
+Um texto com pelo menos ``SPAM_MIN_COPIAS - 1`` quase-duplicatas na janela
+(``SPAM_JANELA_HORAS``) forma uma campanha: os relatos do grupo passam a
+``status='spam'`` e as interações a ``relevante=False``. Textos curtos
+(``SPAM_MIN_CARACTERES``) não entram no índice: frases comuns como "Rua
+alagada" se repetem legitimamente entre usuários.
+
+Roda como job em lote (``detectar_spam``) e após o commit de cada relato ou
+interação com texto (``agendar``). O detector do processo é incremental:
+a cada execução lê só os textos com id acima do último visto e expira os
+que saíram da janela.
+"""
+
+import heapq
+import re
+import threading
+import unicodedata
+import zlib
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import alteracoes, tarefas
+from .models import InteracaoRelatorio, RelatorioAlagamento
+
+NUM_PERMUTACOES = 128
+BANDAS = 16
+TAMANHO_SHINGLE = 5
+PRIMO = (1 << 31) - 1
+
+_geracao = np.random.RandomState(20240611)
+_A = _geracao.randint(1, PRIMO, NUM_PERMUTACOES).astype(np.uint64)[:, None]
+_B = _geracao.randint(0, PRIMO, NUM_PERMUTACOES).astype(np.uint64)[:, None]
+
+RELATO, INTERACAO = 'relato', 'interacao'
+
+_local = threading.local()
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def _parametros():
+    return _config('SPAM_LIMIAR_SIMILARIDADE', 0.7), _config('SPAM_MIN_COPIAS', 5)
+
+
+def normalizar(texto):
+    """Minúsculas, sem acentos e com pontuação/espaços colapsados"""
+    sem_acentos = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', ' ', sem_acentos.lower()).strip()
+
+
+def assinatura(texto, min_caracteres=None):
+    """Assinatura MinHash do texto, ou None se for curto demais para comparar"""
+    normalizado = normalizar(texto)
+    minimo = _config('SPAM_MIN_CARACTERES', 60) if min_caracteres is None else min_caracteres
+    if not normalizado or len(normalizado) < minimo:
+        return None
+    shingles = {
+        normalizado[i:i + TAMANHO_SHINGLE]
+        for i in range(max(1, len(normalizado) - TAMANHO_SHINGLE + 1))
+    }
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles)
+    ) % PRIMO
+    return ((_A * hashes[None, :] + _B) % PRIMO).min(axis=1).astype(np.uint32)
+
+
+def similaridade(a, b):
+    """Jaccard estimado: fração de posições iguais nas assinaturas"""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class IndiceLSH:
+    """Assinaturas MinHash em baldes por banda, com expiração por tempo"""
+
+    def __init__(self, bandas=BANDAS):
+        self.linhas = NUM_PERMUTACOES // bandas
+        self.baldes = [defaultdict(set) for _ in range(bandas)]
+        self.assinaturas = {}
+        self._expiracao = []  # heap (epoch, chave)
+
+    def __len__(self):
+        return len(self.assinaturas)
+
+    def _chaves(self, sig):
+        return [sig[b * self.linhas:(b + 1) * self.linhas].tobytes() for b in range(len(self.baldes))]
+
+    def vizinhos(self, sig, limiar):
+        """Chaves com similaridade estimada >= ``limiar``"""
+        candidatos = set()
+        for balde, chave_banda in zip(self.baldes, self._chaves(sig)):
+            candidatos |= balde.get(chave_banda, set())
+        return [
+            chave for chave in candidatos
+            if similaridade(sig, self.assinaturas[chave]) >= limiar
+        ]
+
+    def adicionar(self, chave, sig, epoch):
+        if chave in self.assinaturas:
+            return
+        self.assinaturas[chave] = sig
+        for balde, chave_banda in zip(self.baldes, self._chaves(sig)):
+            balde[chave_banda].add(chave)
+        heapq.heappush(self._expiracao, (epoch, chave))
+
+    def remover(self, chave):
+        sig = self.assinaturas.pop(chave, None)
+        if sig is None:
+            return
+        for balde, chave_banda in zip(self.baldes, self._chaves(sig)):
+            membros = balde.get(chave_banda)
+            if membros is not None:
+                membros.discard(chave)
+                if not membros:
+                    del balde[chave_banda]
+
+    def expirar(self, corte):
+        while self._expiracao and self._expiracao[0][0] < corte:
+            _, chave = heapq.heappop(self._expiracao)
+            self.remover(chave)
+
+
+class DetectorSpam:
+    """Índice dos textos da janela mais o estado de leitura incremental do banco"""
+
+    def __init__(self, janela=None):
+        self._janela = janela
+        self._lock = threading.Lock()
+        self.indice = IndiceLSH()
+        self.marcados = set()
+        self._ultimo = {RELATO: 0, INTERACAO: 0}
+
+    @property
+    def janela(self):
+        return self._janela or timedelta(hours=_config('SPAM_JANELA_HORAS', 24))
+
+    def _novos_textos(self, limite):
+        """(chave, texto, timestamp) ainda não vistos, em ordem de criação"""
+        relatos = (
+            RelatorioAlagamento.objects
+            .filter(pk__gt=self._ultimo[RELATO], timestamp__gte=limite)
+            .exclude(descricao='')
+            .values_list('id', 'descricao', 'timestamp').order_by('id')
+        )
+        comentarios = (
+            InteracaoRelatorio.objects
+            .filter(pk__gt=self._ultimo[INTERACAO], timestamp__gte=limite)
+            .exclude(comentario='')
+            .values_list('id', 'comentario', 'timestamp').order_by('id')
+        )
+        textos = []
+        for tipo, linhas in ((RELATO, relatos), (INTERACAO, comentarios)):
+            for pk, texto, timestamp in linhas:
+                textos.append(((tipo, pk), texto, timestamp))
+                self._ultimo[tipo] = max(self._ultimo[tipo], pk)
+        textos.sort(key=lambda item: item[2])
+        return textos
+
+    def registrar(self, chave, sig, epoch, limiar, min_copias):
+        """Indexa um texto; retorna as chaves que passam a formar campanha com ele"""
+        grupo = self.indice.vizinhos(sig, limiar)
+        self.indice.adicionar(chave, sig, epoch)
+        if len(grupo) + 1 < min_copias:
+            return []
+        novos = [c for c in grupo + [chave] if c not in self.marcados]
+        self.marcados.update(novos)
+        return novos
+
+    def processar(self, agora=None):
+        """Indexa os textos novos e marca as campanhas encontradas"""
+        agora = agora or timezone.now()
+        limiar, min_copias = _parametros()
+        resultado = {'textos': 0, 'indexados': 0, 'marcados': 0}
+
+        with self._lock:
+            limite = agora - self.janela
+            self.indice.expirar(limite.timestamp())
+            novos = []
+            for chave, texto, timestamp in self._novos_textos(limite):
+                resultado['textos'] += 1
+                sig = assinatura(texto)
+                if sig is None:
+                    continue
+                novos += self.registrar(chave, sig, timestamp.timestamp(), limiar, min_copias)
+                resultado['indexados'] += 1
+            self.marcados.intersection_update(self.indice.assinaturas)
+            resultado['marcados'] = marcar(novos)
+        return resultado
+
+
+def marcar(chaves):
+    """Relatos -> status 'spam' (com sinais, para contadores e alertas); interações -> irrelevantes"""
+    relatos = {pk for tipo, pk in chaves if tipo == RELATO}
+    comentarios = {pk for tipo, pk in chaves if tipo == INTERACAO}
+    total = 0
+    with transaction.atomic():
+        for relatorio in RelatorioAlagamento.objects.filter(pk__in=relatos).exclude(status='spam'):
+            relatorio.status = 'spam'
+            relatorio.save(update_fields=['status'])
+            total += 1
+        irrelevantes = list(InteracaoRelatorio.objects.filter(pk__in=comentarios, relevante=True))
+        total += InteracaoRelatorio.objects.filter(pk__in=[i.pk for i in irrelevantes]).update(relevante=False)
+        for interacao in irrelevantes:
+            interacao.relevante = False
+        alteracoes.registrar_lote(irrelevantes, 'alteracao', ['relevante'])
+    return total
+
+
+detector = DetectorSpam()
+
+
+def agendar():
+    """Verifica os textos novos após o commit da transação atual (ver ``eventos.agendar``)"""
+    if not _config('SPAM_VERIFICAR_AO_SALVAR', True):
+        return
+    if tarefas.ativa():
+        tarefas.enfileirar('detectar_spam', chave='detectar_spam')
+        return
+    _local.pendente = True
+    transaction.on_commit(_processar)
+
+
+def _processar():
+    if getattr(_local, 'pendente', False):
+        _local.pendente = False
+        detector.processar()
+
+
+def processar_novos():
+    """Verifica os textos novos (tarefa ``detectar_spam`` da fila)"""
+    return detector.processar()
@@ -0,0 +1,372 @@
+"""
+Fila de Tarefas em Segundo Plano
+================================
+
+Fila de trabalho guardada no próprio banco (tabela ``tarefas``), sem
+broker: a view enfileira na mesma transação da escrita que originou o
+trabalho (se a escrita sofrer rollback, a tarefa também sofre) e um ou mais
+``manage.py run_worker`` executam.
+
+- Tarefas apontam por nome para funções em ``REGISTRO`` (caminho
+  importável, mais ``TAREFAS_REGISTRO`` do projeto); ``argumentos`` é um
+  JSON passado como argumentos nomeados.
+- ``chave`` coalesce pedidos: com uma tarefa pendente de mesma chave, o novo
+  pedido é descartado (índice único parcial sobre as pendentes).
+- Reivindicação: no PostgreSQL, ``SELECT ... FOR UPDATE SKIP LOCKED`` (cada
+  trabalhador pula as linhas já travadas por outro); nos demais bancos,
+  ``UPDATE ... WHERE id = x AND status = 'pendente'`` por candidata, que só
+  um trabalhador consegue (no SQLite as escritas são serializadas; as
+  threads de um mesmo processo, por uma trava).
+- Falhas voltam para a fila com espera exponencial
+  (``TAREFAS_ESPERA_BASE_S`` * 2^(tentativa - 1), até
+  ``TAREFAS_ESPERA_MAXIMA_S``, com variação de ±20%) até
+  ``max_tentativas``; depois ficam como ``falhou`` com o traceback.
+- ``TAREFAS_TIMEOUT_S`` é a concessão de uma tarefa em execução: passado
+  esse tempo (trabalhador encerrado no meio), ela é recuperada como uma
+  tentativa com falha. Uma execução que termina depois disso não grava nada
+  (a gravação final exige a mesma concessão), então o timeout deve ficar
+  acima da tarefa mais longa.
+- Cada execução grava ``espera_ms`` (do agendamento ao início) e
+  ``duracao_ms``; ``metricas`` resume por nome.
+
+Com ``TAREFAS_FILA_ATIVA = True`` os trabalhos hoje disparados após o
+commit, na thread da requisição (alertas, eventos, spam, fotos), passam a
+ser enfileirados aqui. Tarefas periódicas (``TAREFAS_PERIODICAS``) são
+agendadas pelos próprios trabalhadores.
+"""
+
+import logging
+import os
+import random
+import socket
+import statistics
+import threading
+import time
+import traceback
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Tarefa
+
+logger = logging.getLogger(__name__)
+_trava_sqlite = threading.Lock()
+
+REGISTRO = {
+    'atualizar_urgencia': 'dashboard.prioridade.atualizar_scores',
+    'avaliar_alertas': 'dashboard.alertas.avaliar_bairros',
+    'agrupar_eventos': 'dashboard.eventos.agrupar_pendentes',
+    'encerrar_eventos': 'dashboard.eventos.encerrar_eventos',
+    'detectar_spam': 'dashboard.spam.processar_novos',
+    'processar_foto': 'dashboard.fotos.processar',
+    'reconstruir_cubo': 'dashboard.cubo.reconstruir',
+    'reconciliar_contadores': 'dashboard.contadores.reconciliar',
+    'podar_alteracoes': 'dashboard.alteracoes.podar',
+}
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def ativa():
+    """Trabalhos pós-commit vão para a fila (em vez de rodar na requisição)"""
+    return _config('TAREFAS_FILA_ATIVA', False)
+
+
+def registro():
+    return {**REGISTRO, **_config('TAREFAS_REGISTRO', {})}
+
+
+def identificador():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# ---------------------------------------------------------------- enfileirar
+
+def enfileirar(nome, argumentos=None, chave='', atraso_s=0, max_tentativas=None):
+    """
+    Enfileira ``nome(**argumentos)`` na transação atual, para daqui a
+    ``atraso_s`` segundos. Retorna a tarefa, ou None se já havia uma
+    pendente com a mesma ``chave``.
+    """
+    if nome not in registro():
+        raise ValueError(f"Tarefa não registrada: {nome}")
+    tarefa = Tarefa(
+        nome=nome,
+        argumentos=argumentos or {},
+        chave=chave,
+        executar_em=timezone.now() + timedelta(seconds=atraso_s),
+        max_tentativas=max_tentativas or _config('TAREFAS_MAX_TENTATIVAS', 5),
+    )
+    if not chave:
+        tarefa.save()
+        return tarefa
+    if Tarefa.objects.filter(chave=chave, status='pendente').exists():
+        return None
+    # Corrida com outro pedido igual: o índice único parcial recusa o segundo
+    try:
+        with transaction.atomic():
+            tarefa.save()
+    except IntegrityError:
+        return None
+    return tarefa
+
+
+# ---------------------------------------------------------------- reivindicar
+
+def reivindicar(limite=1, trabalhador=None, agora=None):
+    """Marca até ``limite`` tarefas vencidas como em execução por este trabalhador; retorna os ids"""
+    agora = agora or timezone.now()
+    trabalhador = trabalhador or identificador()
+    vencidas = Tarefa.objects.filter(status='pendente', executar_em__lte=agora).order_by('executar_em', 'id')
+    marcar = {'status': 'executando', 'trabalhador': trabalhador, 'iniciada_em': agora}
+
+    if connection.vendor == 'postgresql':
+        with transaction.atomic():
+            ids = list(vencidas.select_for_update(skip_locked=True).values_list('id', flat=True)[:limite])
+            Tarefa.objects.filter(pk__in=ids).update(**marcar)
+        return ids
+
+    ids = []
+    with _trava_sqlite if connection.vendor == 'sqlite' else nullcontext():
+        # Algumas candidatas a mais: outro trabalhador pode levar parte delas
+        for pk in vencidas.values_list('id', flat=True)[:limite * 2]:
+            if Tarefa.objects.filter(pk=pk, status='pendente').update(**marcar):
+                ids.append(pk)
+                if len(ids) == limite:
+                    break
+    return ids
+
+
+# ---------------------------------------------------------------- executar
+
+def _espera_retentativa(tentativa):
+    base = _config('TAREFAS_ESPERA_BASE_S', 5)
+    espera = min(base * 2 ** (tentativa - 1), _config('TAREFAS_ESPERA_MAXIMA_S', 3600))
+    return espera * random.uniform(0.8, 1.2)
+
+
+def _falhar(tarefa, erro, agora):
+    """Registra a falha de uma tentativa: volta para a fila com espera ou desiste"""
+    tarefa.erro = erro
+    tarefa.concluida_em = agora
+    if tarefa.tentativas < tarefa.max_tentativas:
+        tarefa.status = 'pendente'
+        tarefa.executar_em = agora + timedelta(seconds=_espera_retentativa(tarefa.tentativas))
+    else:
+        tarefa.status = 'falhou'
+    # Uma pendente de mesma chave pode ter sido criada enquanto esta rodava
+    if tarefa.status == 'pendente' and tarefa.chave and Tarefa.objects.filter(
+        chave=tarefa.chave, status='pendente'
+    ).exists():
+        tarefa.status = 'falhou'
+        tarefa.erro += '\n(substituída pela tarefa pendente de mesma chave)'
+
+
+def _gravar_execucao(tarefa, campos):
+    """
+    Grava ``campos`` só se a tarefa ainda está na execução que a
+    reivindicou (mesmo trabalhador e início): passado ``TAREFAS_TIMEOUT_S``
+    ela pode ter sido recuperada e reivindicada de novo. Retorna se gravou.
+    """
+    desta_execucao = Tarefa.objects.filter(
+        pk=tarefa.pk, status='executando', trabalhador=tarefa.trabalhador, iniciada_em=tarefa.iniciada_em,
+    )
+    try:
+        with transaction.atomic():
+            return bool(desta_execucao.update(**campos))
+    except IntegrityError:
+        # Já existe uma pendente de mesma chave, que fará o trabalho
+        return bool(desta_execucao.update(**dict(campos, status='falhou')))
+
+
+def executar(tarefa_id):
+    """Executa uma tarefa já reivindicada e registra resultado, tempos e falhas; retorna o status (None se a concessão expirou)"""
+    close_old_connections()
+    try:
+        tarefa = Tarefa.objects.get(pk=tarefa_id)
+        tarefa.tentativas += 1
+        tarefa.espera_ms = max(0.0, (tarefa.iniciada_em - tarefa.executar_em).total_seconds() * 1000)
+        inicio = time.perf_counter()
+        try:
+            funcao = import_string(registro()[tarefa.nome])
+            tarefa.resultado = funcao(**tarefa.argumentos)
+        except Exception:
+            tarefa.duracao_ms = (time.perf_counter() - inicio) * 1000
+            logger.exception("Tarefa %s #%d falhou (tentativa %d)", tarefa.nome, tarefa.pk, tarefa.tentativas)
+            _falhar(tarefa, traceback.format_exc(), timezone.now())
+        else:
+            tarefa.duracao_ms = (time.perf_counter() - inicio) * 1000
+            tarefa.status = 'concluida'
+            tarefa.concluida_em = timezone.now()
+            tarefa.erro = ''
+            logger.info("Tarefa %s #%d concluída em %.0fms", tarefa.nome, tarefa.pk, tarefa.duracao_ms)
+        if not isinstance(tarefa.resultado, (dict, list, str, int, float, bool, type(None))):
+            tarefa.resultado = repr(tarefa.resultado)
+        campos = {campo: getattr(tarefa, campo) for campo in (
+            'status', 'tentativas', 'espera_ms', 'duracao_ms', 'resultado', 'erro', 'concluida_em', 'executar_em',
+        )}
+        if not _gravar_execucao(tarefa, campos):
+            logger.warning(
+                "Tarefa %s #%d terminou após ser recuperada por timeout; resultado descartado", tarefa.nome, tarefa.pk,
+            )
+            return None
+        return tarefa.status
+    finally:
+        close_old_connections()
+
+
+def recuperar_travadas(agora=None):
+    """Tarefas em execução além de ``TAREFAS_TIMEOUT_S`` contam como tentativa com falha"""
+    agora = agora or timezone.now()
+    limite = agora - timedelta(seconds=_config('TAREFAS_TIMEOUT_S', 300))
+    recuperadas = 0
+    for tarefa in Tarefa.objects.filter(status='executando', iniciada_em__lt=limite):
+        tarefa.tentativas += 1
+        _falhar(tarefa, f"Sem conclusão após {_config('TAREFAS_TIMEOUT_S', 300)}s ({tarefa.trabalhador})", agora)
+        # Só recupera se ninguém concluiu (ou reivindicou de novo) no meio tempo
+        campos = {campo: getattr(tarefa, campo) for campo in
+                  ('status', 'tentativas', 'erro', 'concluida_em', 'executar_em')}
+        recuperadas += _gravar_execucao(tarefa, campos)
+    return recuperadas
+
+
+def agendar_periodicas():
+    """Mantém uma tarefa pendente de cada ``TAREFAS_PERIODICAS`` (nome -> intervalo em segundos)"""
+    criadas = 0
+    for nome, intervalo in _config('TAREFAS_PERIODICAS', {}).items():
+        chave = f"periodica:{nome}"
+        if Tarefa.objects.filter(chave=chave, status__in=('pendente', 'executando')).exists():
+            continue
+        criadas += enfileirar(nome, chave=chave, atraso_s=intervalo) is not None
+    return criadas
+
+
+def podar(dias=None):
+    """Apaga tarefas concluídas há mais de ``TAREFAS_RETENCAO_DIAS``; retorna quantas"""
+    dias = _config('TAREFAS_RETENCAO_DIAS', 7) if dias is None else dias
+    apagadas, _ = Tarefa.objects.filter(
+        status='concluida', concluida_em__lt=timezone.now() - timedelta(days=dias)
+    ).delete()
+    return apagadas
+
+
+# ---------------------------------------------------------------- métricas
+
+def _percentil(valores, p):
+    return round(valores[min(len(valores) - 1, int(len(valores) * p))], 1) if valores else None
+
+
+def metricas(horas=24):
+    """Por nome: tarefas na fila e, nas últimas ``horas``, execuções, falhas e tempos (ms)"""
+    desde = timezone.now() - timedelta(hours=horas)
+    resumo = defaultdict(lambda: {
+        'pendentes': 0, 'executando': 0, 'concluidas': 0, 'falhas': 0, 'retentativas': 0,
+    })
+    for nome, status in Tarefa.objects.filter(status__in=('pendente', 'executando')).values_list('nome', 'status'):
+        resumo[nome]['pendentes' if status == 'pendente' else 'executando'] += 1
+
+    duracoes, esperas = defaultdict(list), defaultdict(list)
+    for nome, status, tentativas, duracao, espera in Tarefa.objects.filter(
+        concluida_em__gte=desde, status__in=('concluida', 'falhou')
+    ).values_list('nome', 'status', 'tentativas', 'duracao_ms', 'espera_ms'):
+        resumo[nome]['concluidas' if status == 'concluida' else 'falhas'] += 1
+        resumo[nome]['retentativas'] += max(0, tentativas - 1)
+        if duracao is not None:
+            duracoes[nome].append(duracao)
+        if espera is not None:
+            esperas[nome].append(espera)
+
+    for nome, item in resumo.items():
+        d, e = sorted(duracoes[nome]), sorted(esperas[nome])
+        item['duracao_ms'] = {
+            'media': round(statistics.fmean(d), 1) if d else None,
+            'p50': _percentil(d, 0.5), 'p95': _percentil(d, 0.95), 'max': _percentil(d, 1.0),
+        }
+        item['espera_ms'] = {'p50': _percentil(e, 0.5), 'p95': _percentil(e, 0.95)}
+    return dict(sorted(resumo.items()))
+
+
+# ---------------------------------------------------------------- trabalhador
+
+class Trabalhador:
+    """
+    Laço de ``run_worker``: reivindica tarefas enquanto houver vaga no pool
+    (threads ou processos) e as executa; ocioso, espera
+    ``TAREFAS_INTERVALO_S``. A cada ``TAREFAS_MANUTENCAO_S`` recupera
+    tarefas travadas, agenda as periódicas e poda as antigas.
+    """
+
+    def __init__(self, threads=None, processos=0, log=None):
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+        self.nome = identificador()
+        self.log = log or (lambda mensagem: None)
+        self._parar = False
+        self._em_execucao = set()
+        if processos:
+            import multiprocessing
+
+            from .processos import bancos_atuais, iniciar
+
+            self.vagas = processos
+            self._pool = ProcessPoolExecutor(
+                max_workers=processos, mp_context=multiprocessing.get_context('spawn'),
+                initializer=iniciar, initargs=(bancos_atuais(),),
+            )
+        else:
+            self.vagas = threads or _config('TAREFAS_THREADS', 4)
+            self._pool = ThreadPoolExecutor(max_workers=self.vagas, thread_name_prefix='tarefa')
+        self.executadas = 0
+
+    def parar(self, *args):
+        self._parar = True
+
+    def _manutencao(self):
+        recuperadas = recuperar_travadas()
+        periodicas = agendar_periodicas()
+        podadas = podar()
+        if recuperadas or podadas:
+            self.log(f"🧹 {recuperadas} tarefas travadas recuperadas, {podadas} concluídas podadas")
+        return periodicas
+
+    def _coletar(self):
+        for futuro in [f for f in self._em_execucao if f.done()]:
+            self._em_execucao.discard(futuro)
+            self.executadas += 1
+            try:
+                futuro.result()
+            except Exception:  # Falha fora de ``executar`` (ex.: processo filho morto)
+                logger.exception("Trabalhador %s: execução interrompida", self.nome)
+
+    def executar(self, ate_esvaziar=False):
+        """Roda até ``parar`` (ou, com ``ate_esvaziar``, até não haver tarefas vencidas)"""
+        intervalo = _config('TAREFAS_INTERVALO_S', 1)
+        proxima_manutencao = 0
+        try:
+            while not self._parar:
+                if time.monotonic() >= proxima_manutencao:
+                    self._manutencao()
+                    proxima_manutencao = time.monotonic() + _config('TAREFAS_MANUTENCAO_S', 30)
+                self._coletar()
+                livres = self.vagas - len(self._em_execucao)
+                ids = reivindicar(livres, self.nome) if livres else []
+                for tarefa_id in ids:
+                    self._em_execucao.add(self._pool.submit(executar, tarefa_id))
+                if ids:
+                    continue
+                if ate_esvaziar and not self._em_execucao:
+                    break
+                time.sleep(intervalo if livres else 0.05)
+        finally:
+            # Tarefas em andamento terminam; as não reivindicadas ficam para outro trabalhador
+            self._pool.shutdown(wait=True)
+            self._coletar()
+            close_old_connections()
+        return self.executadas
@@ -1,3 +1,1335 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import alteracoes, cubo, deduplicacao, fotos, ingestao, recentes, spam, tarefas, visualizacoes
+from .catalogo import catalogo
+from .forms import RelatorioAlagamentoForm
+from .interacoes import registrar_voto, registrar_votos
+from .localizacao import SEM_BAIRRO, resolvedor
+from .models import (
+    Bairro, ChaveSync, CuboContribuicoes, CuboRelatos, EventoAlteracao, InteracaoRelatorio, PosicaoConsumidor,
+    RelatorioAlagamento, Tarefa, UsuarioApp,
+)
+
+
+class InteracaoConcorrenteTest(TransactionTestCase):
+    """Confirmações/negações simultâneas no mesmo relato (escritas reais, sem transação de teste)"""
+
+    N_USUARIOS = 40
+
+    def setUp(self):
+        bairro = Bairro.objects.create(nome='Boa Viagem', latitude=-8.12, longitude=-34.90)
+        autor = UsuarioApp.objects.create(usuario=User.objects.create_user('autor'))
+        self.relatorio = RelatorioAlagamento.objects.create(
+            usuario=autor, bairro=bairro, latitude=-8.12, longitude=-34.90, nivel_severidade=3
+        )
+        self.usuarios = [
+            UsuarioApp.objects.create(usuario=User.objects.create_user(f'votante{i}'))
+            for i in range(self.N_USUARIOS)
+        ]
+
+    def _em_paralelo(self, tarefas):
+        erros = []
+        barreira = threading.Barrier(len(tarefas))
+
+        def executar(tarefa):
+            try:
+                barreira.wait()
+                tarefa()
+            except Exception as e:  # pragma: no cover - falha reportada abaixo
+                erros.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=executar, args=(t,)) for t in tarefas]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(erros, [])
+
+    def _contadores(self):
+        self.relatorio.refresh_from_db()
+        return self.relatorio.total_confirmacoes, self.relatorio.total_negacoes
+
+    def test_votos_simultaneos_no_mesmo_relato(self):
+        tarefas = []
+        for i, usuario in enumerate(self.usuarios):
+            # Cada usuário envia o mesmo voto duas vezes; um quarto troca para negação
+            tarefas += [lambda u=usuario: registrar_voto(self.relatorio.id, u.id, 'confirmacao')] * 2
+            if i % 4 == 0:
+                tarefas.append(lambda u=usuario: registrar_voto(self.relatorio.id, u.id, 'negacao'))
+        self._em_paralelo(tarefas)
+
+        confirmacoes = InteracaoRelatorio.objects.filter(relatorio=self.relatorio, tipo='confirmacao').count()
+        negacoes = InteracaoRelatorio.objects.filter(relatorio=self.relatorio, tipo='negacao').count()
+        # Um voto por usuário e contadores iguais às linhas gravadas
+        self.assertEqual(confirmacoes + negacoes, self.N_USUARIOS)
+        self.assertEqual(self._contadores(), (confirmacoes, negacoes))
+
+    def test_endpoint_insere_uma_vez_e_troca_voto(self):
+        self.client.force_login(self.usuarios[0].usuario)
+        url = reverse('dashboard:api_interacao', args=[self.relatorio.id])
+
+        resposta = self.client.post(url, {'tipo': 'confirmacao'})
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(self.client.post(url, {'tipo': 'confirmacao'}).status_code, 200)
+        self.assertEqual(self._contadores(), (1, 0))
+
+        resposta = self.client.post(url, {'tipo': 'negacao'}, content_type='application/json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertTrue(resposta.json()['voto_oposto_removido'])
+        self.assertEqual(self._contadores(), (0, 1))
+
+    def test_votos_em_lote(self):
+        segundo = RelatorioAlagamento.objects.create(
+            usuario=self.relatorio.usuario, bairro=self.relatorio.bairro, latitude=-8.13, longitude=-34.91,
+            nivel_severidade=2,
+        )
+        usuario_id = self.usuarios[0].id
+        registrar_voto(self.relatorio.id, usuario_id, 'negacao')
+
+        # Troca de voto no primeiro; no segundo vale o último dos dois votos
+        criados, removidos = registrar_votos(usuario_id, [
+            (self.relatorio.id, 'confirmacao', ''), (segundo.id, 'negacao', ''), (segundo.id, 'confirmacao', 'Cheia'),
+        ])
+        self.assertEqual(criados, {(self.relatorio.id, 'confirmacao'), (segundo.id, 'confirmacao')})
+        self.assertEqual(removidos, {(self.relatorio.id, 'negacao')})
+        self.assertEqual(self._contadores(), (1, 0))
+        self.assertEqual(RelatorioAlagamento.objects.values_list('total_confirmacoes', 'total_negacoes').get(
+            pk=segundo.pk), (1, 0))
+
+        self.assertEqual(registrar_votos(usuario_id, [(segundo.id, 'confirmacao', '')]), (set(), set()))
+        with self.assertRaises(ValueError):
+            registrar_votos(usuario_id, [(segundo.id, 'comentario', '')])
+
+    def test_corpo_invalido(self):
+        self.client.force_login(self.usuarios[0].usuario)
+        url = reverse('dashboard:api_interacao', args=[self.relatorio.id])
+        for corpo in ('[1, 2]', '"confirmacao"', '{"tipo": "confirmacao", "comentario": 5}',
+                      '{"tipo": "confirmacao", "comentario": ["a"]}'):
+            with self.subTest(corpo):
+                resposta = self.client.post(url, corpo, content_type='application/json')
+                self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(self._contadores(), (0, 0))
+
+    def test_autor_nao_vota_no_proprio_relato(self):
+        self.client.force_login(self.relatorio.usuario.usuario)
+        url = reverse('dashboard:api_interacao', args=[self.relatorio.id])
+        self.assertEqual(self.client.post(url, {'tipo': 'confirmacao'}).status_code, 403)
+
+
+class PlanoConsultasViewsTest(TestCase):
+    """Toda query das views sobre relatorios_alagamento deve usar índice (EXPLAIN)"""
+
+    TABELA = RelatorioAlagamento._meta.db_table
+
+    @classmethod
+    def setUpTestData(cls):
+        bairro = Bairro.objects.create(nome='Boa Viagem', latitude=-8.12, longitude=-34.90)
+        cls.staff = User.objects.create_user('operador', is_staff=True)
+        autor = UsuarioApp.objects.create(usuario=User.objects.create_user('autor'))
+        cls.relatorios = [
+            RelatorioAlagamento.objects.create(
+                usuario=autor, bairro=bairro, latitude=-8.12, longitude=-34.90,
+                nivel_severidade=severidade, status=status
+            )
+            for severidade, status in [(1, 'ativo'), (3, 'ativo'), (4, 'ativo'), (2, 'resolvido')]
+        ]
+        cls.bairro = bairro
+
+    def urls(self):
+        bairro = str(self.bairro.id)
+        return [
+            reverse('dashboard:home') + '?periodo=7',
+            reverse('dashboard:home') + f'?periodo=90&bairro={bairro}&severidade=4&ordem=urgencia',
+            reverse('dashboard:mapa') + '?periodo=72&sev_min=3',
+            reverse('dashboard:analytics'),
+            reverse('dashboard:api_tempo_real'),
+            reverse('dashboard:relatorio_detalhes', args=[self.relatorios[0].id]),
+            reverse('dashboard:api_relatorios'),
+            reverse('dashboard:api_relatorios') + f'?bairro={bairro}&severidade=3',
+            reverse('dashboard:api_urgentes') + f'?bairro={bairro}',
+        ]
+
+    def varreduras_completas(self, sql):
+        """Linhas do plano que leem a tabela de relatórios inteira"""
+        nomes = {self.TABELA} | set(re.findall(rf'"{self.TABELA}" (\w+)', sql))
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tabelas de teste são minúsculas: pergunta se existe plano com índice
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql)
+                linhas = [linha[0] for linha in cursor.fetchall()]
+                padrao = re.compile(r'Seq Scan on (\w+)(?: (\w+))?')
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                linhas = [linha[-1] for linha in cursor.fetchall()]
+                padrao = re.compile(r'^SCAN (\w+)(?! USING)(?: AS (\w+))?$')
+        return [
+            linha for linha in linhas
+            if (m := padrao.search(linha.strip())) and nomes & {g for g in m.groups() if g}
+        ]
+
+    def test_queries_das_views_usam_indice(self):
+        self.client.force_login(self.staff)
+        for url in self.urls():
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200, url)
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or self.TABELA not in sql:
+                    continue
+                with self.subTest(url=url, sql=sql[:200]):
+                    self.assertEqual(self.varreduras_completas(sql), [])
+
+
+class SincronizacaoTest(TestCase):
+    """Reenvio de lotes offline (api_sync): idempotência por id_relato, mesclagem e confirmações"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bairro = Bairro.objects.create(nome='Boa Viagem', latitude=-8.12, longitude=-34.90)
+        cls.autor = UsuarioApp.objects.create(usuario=User.objects.create_user('autor'))
+        cls.cliente = UsuarioApp.objects.create(usuario=User.objects.create_user('offline'))
+        cls.outro = UsuarioApp.objects.create(usuario=User.objects.create_user('outro'))
+
+    def setUp(self):
+        # Índice de deduplicação limpo: ids de testes anteriores não existem mais
+        patcher = mock.patch.object(deduplicacao, 'indice', deduplicacao.IndiceRecentes())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sync(self, usuario, relatos=(), confirmacoes=()):
+        self.client.force_login(usuario.usuario)
+        resposta = self.client.post(
+            reverse('dashboard:api_sync'),
+            json.dumps({'relatos': list(relatos), 'confirmacoes': list(confirmacoes)}),
+            content_type='application/json',
+        )
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.json()
+
+    def relato(self, latitude='-8.1200000', **extra):
+        return {
+            'id_relato': str(uuid.uuid4()), 'latitude': latitude, 'longitude': '-34.9000000',
+            'bairro': self.bairro.id, 'nivel_severidade': 3, **extra,
+        }
+
+    def contadores(self, pk):
+        return RelatorioAlagamento.objects.filter(pk=pk).values_list(
+            'total_confirmacoes', 'total_negacoes').get()
+
+    def test_reenvio_do_mesmo_lote_nao_duplica(self):
+        lote = [self.relato(), self.relato(latitude='-8.1500000')]
+        primeiro = self.sync(self.cliente, lote)['relatos']
+        self.assertEqual([r['status'] for r in primeiro], ['criado', 'criado'])
+
+        segundo = self.sync(self.cliente, lote)['relatos']
+        self.assertEqual([r['status'] for r in segundo], ['duplicado', 'duplicado'])
+        self.assertEqual([r['id'] for r in segundo], [r['id'] for r in primeiro])
+        self.assertEqual(RelatorioAlagamento.objects.count(), 2)
+
+    def test_relato_mesclado_guarda_a_chave(self):
+        existente = RelatorioAlagamento.objects.create(
+            usuario=self.autor, bairro=self.bairro, latitude='-8.1200000', longitude='-34.9000000',
+            nivel_severidade=3,
+        )
+        item = self.relato(latitude='-8.1201000')
+        resultado = self.sync(self.cliente, [item])['relatos'][0]
+        self.assertEqual((resultado['status'], resultado['id']), ('mesclado', existente.id))
+        self.assertTrue(ChaveSync.objects.filter(id_relato=item['id_relato'], relatorio=existente).exists())
+        self.assertEqual(self.contadores(existente.id), (1, 0))
+
+        # Reenvio: mesma resposta de idempotência, sem relato novo nem voto repetido
+        resultado = self.sync(self.cliente, [item])['relatos'][0]
+        self.assertEqual((resultado['status'], resultado['id']), ('duplicado', existente.id))
+        self.assertEqual(RelatorioAlagamento.objects.count(), 1)
+        self.assertEqual(self.contadores(existente.id), (1, 0))
+
+        # Confirmação posterior pela chave do aparelho chega ao relato que ficou
+        confirmacao = {'id_relato': item['id_relato'], 'tipo': 'confirmacao'}
+        resultado = self.sync(self.outro, confirmacoes=[confirmacao])['confirmacoes'][0]
+        self.assertEqual((resultado['status'], resultado['id']), ('criada', existente.id))
+        self.assertEqual(self.contadores(existente.id), (2, 0))
+
+    def test_confirmacoes_apontando_para_o_proprio_lote(self):
+        existente = RelatorioAlagamento.objects.create(
+            usuario=self.autor, bairro=self.bairro, latitude='-8.1200000', longitude='-34.9000000',
+            nivel_severidade=3,
+        )
+        mesclado, novo = self.relato(latitude='-8.1201000'), self.relato(latitude='-8.1500000')
+        resposta = self.sync(self.cliente, [mesclado, novo], [
+            {'id_relato': mesclado['id_relato'], 'tipo': 'confirmacao'},
+            {'id_relato': novo['id_relato'], 'tipo': 'confirmacao'},
+        ])
+        self.assertEqual([r['status'] for r in resposta['relatos']], ['mesclado', 'criado'])
+        # A mesclagem já confirmou o relato existente; o novo é do próprio autor
+        self.assertEqual(resposta['confirmacoes'][0]['status'], 'duplicada')
+        self.assertEqual(resposta['confirmacoes'][1]['status'], 'invalida')
+        self.assertEqual(self.contadores(existente.id), (1, 0))
+
+        # Outro usuário confirma o relato novo no mesmo lote em que troca o voto no existente
+        resposta = self.sync(self.outro, confirmacoes=[
+            {'id_relato': novo['id_relato'], 'tipo': 'confirmacao'},
+            {'id_relato': str(existente.id_relato), 'tipo': 'confirmacao'},
+            {'id_relato': str(existente.id_relato), 'tipo': 'negacao'},
+        ])['confirmacoes']
+        self.assertEqual([r['status'] for r in resposta], ['criada', 'substituida', 'criada'])
+        reenvio = self.sync(self.outro, confirmacoes=[
+            {'id_relato': novo['id_relato'], 'tipo': 'confirmacao'},
+            {'id_relato': str(existente.id_relato), 'tipo': 'negacao'},
+        ])['confirmacoes']
+        self.assertEqual([r['status'] for r in reenvio], ['duplicada', 'duplicada'])
+        self.assertEqual(self.contadores(existente.id), (1, 1))
+        self.assertEqual(self.contadores(resposta[0]['id']), (1, 0))
+
+
+class ContadoresTest(TestCase):
+    """Contadores desnormalizados só mudam por UPDATE com F(), nunca pelo save do relato"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bairros = [
+            Bairro.objects.create(nome=nome, latitude=-8.12, longitude=-34.90)
+            for nome in ('Boa Viagem', 'Casa Amarela')
+        ]
+        cls.autor = UsuarioApp.objects.create(usuario=User.objects.create_user('autor'))
+        cls.votantes = [UsuarioApp.objects.create(usuario=User.objects.create_user(f'votante{i}')) for i in range(3)]
+
+    def setUp(self):
+        self.relatorio = RelatorioAlagamento.objects.create(
+            usuario=self.autor, bairro=self.bairros[0], latitude=-8.12, longitude=-34.90, nivel_severidade=2
+        )
+
+    def contadores(self):
+        return tuple(RelatorioAlagamento.objects.filter(pk=self.relatorio.pk).values_list(
+            'total_confirmacoes', 'total_negacoes', 'visualizacoes').get())
+
+    def test_save_de_instancia_antiga_preserva_contadores(self):
+        antiga = RelatorioAlagamento.objects.get(pk=self.relatorio.pk)
+        for votante in self.votantes[:2]:
+            registrar_voto(self.relatorio.pk, votante.id, 'confirmacao')
+        registrar_voto(self.relatorio.pk, self.votantes[2].id, 'negacao')
+        RelatorioAlagamento.objects.filter(pk=self.relatorio.pk).update(visualizacoes=F('visualizacoes') + 5)
+
+        # Salvar a instância lida antes dos votos (e movê-la de célula no cubo)
+        antiga.descricao = 'Rua alagada'
+        antiga.bairro = self.bairros[1]
+        antiga.total_confirmacoes = 99
+        with CaptureQueriesContext(connection) as consultas:
+            antiga.save()
+        self.assertEqual(self.contadores(), (2, 1, 5))
+        self.assertFalse(any('FOR UPDATE' in consulta['sql'] for consulta in consultas))
+        self.assertEqual(
+            RelatorioAlagamento.objects.filter(pk=self.relatorio.pk).values_list('descricao', 'bairro_id').get(),
+            ('Rua alagada', self.bairros[1].pk),
+        )
+
+        incremental = sorted(CuboRelatos.objects.filter(total__gt=0).values_list(
+            'bairro_id', 'total', 'soma_confirmacoes', 'soma_confirmacoes_quadrado'))
+        self.assertEqual(incremental, [(self.bairros[1].pk, 1, 2, 4)])
+        cubo.reconstruir()
+        self.assertEqual(incremental, sorted(CuboRelatos.objects.filter(total__gt=0).values_list(
+            'bairro_id', 'total', 'soma_confirmacoes', 'soma_confirmacoes_quadrado')))
+
+    def test_troca_de_tipo_move_o_contador(self):
+        interacao = InteracaoRelatorio.objects.create(
+            relatorio=self.relatorio, usuario=self.votantes[0], tipo='confirmacao'
+        )
+        self.assertEqual(self.contadores()[:2], (1, 0))
+
+        interacao.tipo = 'negacao'
+        interacao.save()
+        self.assertEqual(self.contadores()[:2], (0, 1))
+
+        carregada = InteracaoRelatorio.objects.get(pk=interacao.pk)
+        carregada.tipo = 'comentario'
+        carregada.save()
+        self.assertEqual(self.contadores()[:2], (0, 0))
+
+        # Tipo alterado só na memória: o save parcial não o grava nem mexe nos contadores
+        carregada.tipo = 'confirmacao'
+        carregada.relevante = False
+        carregada.save(update_fields=['relevante'])
+        self.assertEqual(self.contadores()[:2], (0, 0))
+        carregada.save()
+        self.assertEqual(self.contadores()[:2], (1, 0))
+
+    @mock.patch.object(visualizacoes, 'close_old_connections')
+    def test_ciclo_de_visualizacoes_sobrevive_a_erro(self, _):
+        contador = visualizacoes.ContadorVisualizacoes()
+        contador._thread = threading.current_thread()  # sem thread de descarga: os ciclos rodam aqui
+        contador.registrar(self.relatorio.pk, 3)
+        with mock.patch.object(RelatorioAlagamento.objects, 'filter', side_effect=RuntimeError):
+            contador._ciclo()
+        contador.registrar(self.relatorio.pk, 2)
+        contador._ciclo()
+        self.assertEqual(self.contadores()[2], 2)
+
+
+class CuboAnalyticsTest(TestCase):
+    """Manutenção incremental do cubo igual à reconstrução a partir dos relatos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bairros = [
+            Bairro.objects.create(nome=nome, latitude=-8.12, longitude=-34.90)
+            for nome in ('Boa Viagem', 'Casa Amarela')
+        ]
+        cls.autores = [UsuarioApp.objects.create(usuario=User.objects.create_user(f'autor{i}')) for i in range(3)]
+        cls.votantes = [UsuarioApp.objects.create(usuario=User.objects.create_user(f'votante{i}')) for i in range(6)]
+
+    def estado(self):
+        """Células e contribuições com alguma medida não nula"""
+        celulas = {
+            (c.dia, c.hora, c.bairro_id, c.severidade): (c.total, c.soma_confirmacoes, c.soma_confirmacoes_quadrado)
+            for c in CuboRelatos.objects.all() if c.total or c.soma_confirmacoes or c.soma_confirmacoes_quadrado
+        }
+        contribuicoes = {
+            (c.dia, c.usuario_id, c.bairro_id): c.total for c in CuboContribuicoes.objects.all() if c.total
+        }
+        return celulas, contribuicoes
+
+    def test_incremental_igual_a_reconstrucao(self):
+        agora = timezone.now()
+        relatorios = [
+            RelatorioAlagamento.objects.create(
+                usuario=self.autores[i % 3], bairro=self.bairros[i % 2], latitude=-8.12, longitude=-34.90,
+                nivel_severidade=1 + i % 4, timestamp=agora - timedelta(hours=7 * i),
+            )
+            for i in range(10)
+        ]
+        for i, relatorio in enumerate(relatorios):
+            for votante in self.votantes[:i % 6]:
+                registrar_voto(relatorio.id, votante.id, 'confirmacao')
+        # Troca de voto (confirmação -> negação) e voto repetido
+        registrar_voto(relatorios[5].id, self.votantes[0].id, 'negacao')
+        registrar_voto(relatorios[4].id, self.votantes[1].id, 'confirmacao')
+
+        # Mover: outro bairro, dia/hora e severidade; o relato carrega votos
+        movido = RelatorioAlagamento.objects.get(pk=relatorios[4].id)
+        movido.bairro = self.bairros[1 - relatorios[4].bairro_id % 2]
+        movido.timestamp -= timedelta(days=3, hours=5)
+        movido.nivel_severidade = 4
+        movido.save()
+        RelatorioAlagamento.objects.get(pk=relatorios[3].id).delete()
+
+        incremental = self.estado()
+        self.assertTrue(incremental[0])
+        cubo.reconstruir()
+        self.assertEqual(incremental, self.estado())
+
+        pares = list(RelatorioAlagamento.objects.values_list('nivel_severidade', 'total_confirmacoes'))
+        esperado = np.corrcoef(np.array(pares, dtype=float).T)[0, 1]
+        obtida = cubo.correlacao(cubo.por_severidade(cubo.celulas()))
+        self.assertAlmostEqual(obtida, esperado, places=9)
+
+        # Filtro por bairro: a mesma conta só com os relatos dele
+        bairro = self.bairros[0]
+        pares = list(RelatorioAlagamento.objects.filter(bairro=bairro).values_list(
+            'nivel_severidade', 'total_confirmacoes'))
+        esperado = np.corrcoef(np.array(pares, dtype=float).T)[0, 1]
+        obtida = cubo.correlacao(cubo.por_severidade(cubo.celulas(bairro_ids=[bairro.id])))
+        self.assertAlmostEqual(obtida, esperado, places=9)
+
+
+class AlteracoesTest(TestCase):
+    """Log de alterações (outbox): eventos na transação da mudança e consumidores com posição"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bairro = Bairro.objects.create(nome='Boa Viagem', latitude=-8.12, longitude=-34.90)
+        cls.autor = UsuarioApp.objects.create(usuario=User.objects.create_user('autor'))
+
+    def setUp(self):
+        patcher = mock.patch.dict(alteracoes._lacunas, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.inicio = alteracoes.ultima_posicao()
+
+    def criar(self, severidade=3):
+        return RelatorioAlagamento.objects.create(
+            usuario=self.autor, bairro=self.bairro, latitude=-8.12, longitude=-34.90, nivel_severidade=severidade,
+        )
+
+    def consumidor(self, nome, posicao=None):
+        return PosicaoConsumidor.objects.create(nome=nome, posicao=self.inicio if posicao is None else posicao)
+
+    def test_rollback_descarta_o_evento(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.criar()
+            raise RuntimeError
+        relatorio = self.criar()
+        eventos = EventoAlteracao.objects.filter(id__gt=self.inicio)
+        self.assertEqual(
+            list(eventos.values_list('modelo', 'objeto_id', 'operacao')), [('relatorio', relatorio.id, 'criacao')]
+        )
+
+    def test_lacuna_pulada_so_depois_da_espera_e_do_snapshot(self):
+        terceiro = [self.criar().id for _ in range(3)][-1]
+        ids = EventoAlteracao.objects.filter(id__gt=self.inicio).order_by('id')
+        EventoAlteracao.objects.filter(id=ids[1].id).delete()  # Id de uma transação aberta (ou desfeita)
+        posicao, lacuna = ids[0].id, ids[0].id + 1
+        espera = timedelta(seconds=alteracoes._config('ALTERACOES_ESPERA_LACUNA_S', 5) + 1)
+        agora = timezone.now()
+
+        # Sem snapshot (SQLite): conta a espera desde que a lacuna foi vista, não a hora do evento seguinte
+        with mock.patch.object(alteracoes, '_snapshot', return_value=None):
+            self.assertEqual(alteracoes.ler(self.inicio, agora=agora)[1], posicao)
+            self.assertEqual(alteracoes.ler(posicao, agora=agora + espera / 2)[1], posicao)
+            eventos, nova = alteracoes.ler(posicao, agora=agora + espera)
+            self.assertEqual(nova, alteracoes.ultima_posicao())
+            self.assertEqual([e.objeto_id for e in eventos], [terceiro])
+
+        # PostgreSQL: também espera terminarem as transações abertas quando a lacuna foi vista
+        alteracoes._lacunas.clear()
+        snapshot = {'xmax': 100, 'xmin': 90}
+        with mock.patch.object(alteracoes, '_snapshot', side_effect=lambda campo: snapshot[campo]):
+            self.assertEqual(alteracoes.ler(posicao, agora=agora)[1], posicao)
+            self.assertEqual(alteracoes._lacunas[lacuna], (agora, 100))
+            self.assertEqual(alteracoes.ler(posicao, agora=agora + espera)[1], posicao)
+            snapshot.update(xmax=120, xmin=100)
+            self.assertEqual(alteracoes.ler(posicao, agora=agora + espera)[1], alteracoes.ultima_posicao())
+
+    def test_consumir_avanca_uma_vez(self):
+        self.consumidor('teste')
+        criados = [self.criar(severidade) for severidade in (1, 2, 3)]
+        vistos = []
+
+        def falhar(eventos):
+            raise RuntimeError
+
+        # Falha no processamento: a posição não avança e o lote é entregue de novo
+        with self.assertRaises(RuntimeError):
+            alteracoes.consumir('teste', falhar)
+        self.assertEqual(PosicaoConsumidor.objects.get(nome='teste').posicao, self.inicio)
+
+        self.assertEqual(alteracoes.consumir_tudo('teste', vistos.extend), 3)
+        self.assertEqual([(e.objeto_id, e.operacao) for e in vistos], [(r.id, 'criacao') for r in criados])
+        self.assertEqual(alteracoes.consumir('teste', vistos.extend), 0)
+        self.assertEqual(len(vistos), 3)
+
+        removido = criados[0].id
+        criados[0].delete()
+        self.assertEqual(alteracoes.consumir_tudo('teste', vistos.extend), 1)
+        self.assertEqual([(e.objeto_id, e.operacao) for e in vistos[3:]], [(removido, 'remocao')])
+        self.assertEqual(PosicaoConsumidor.objects.get(nome='teste').posicao, alteracoes.ultima_posicao())
+
+    def test_podar_respeita_consumidores(self):
+        for severidade in (1, 2, 3, 4):
+            self.criar(severidade)
+        ids = list(EventoAlteracao.objects.filter(id__gt=self.inicio).order_by('id').values_list('id', flat=True))
+        self.consumidor('adiantado', ids[-1])
+        self.consumidor('atrasado', ids[1])
+
+        # Dentro da retenção nada sai; fora dela, só o que todos já leram
+        self.assertEqual(alteracoes.podar(), 0)
+        alteracoes.podar(dias=0)
+        self.assertEqual(list(EventoAlteracao.objects.values_list('id', flat=True).order_by('id')), ids[2:])
+
+        # O atrasado ainda lê o que falta, a partir da posição que guardou
+        vistos = []
+        alteracoes.consumir_tudo('atrasado', vistos.extend)
+        self.assertEqual([e.id for e in vistos], ids[2:])
+
+
+def _tarefa_soma(a, b):
+    return a + b
+
+
+def _tarefa_com_falha():
+    raise RuntimeError('falha de teste')
+
+
+def _estado_do_processo():
+    # Como ``tarefas.executar``: fecha as conexões do processo ao terminar
+    close_old_connections()
+    return os.getpid(), apps.ready, settings.DATABASES['default']['NAME']
+
+
+@override_settings(
+    TAREFAS_REGISTRO={'falhar': 'dashboard.tests._tarefa_com_falha', 'somar': 'dashboard.tests._tarefa_soma'},
+    TAREFAS_ESPERA_BASE_S=10, TAREFAS_ESPERA_MAXIMA_S=25, TAREFAS_TIMEOUT_S=60,
+)
+class FilaTarefasTest(TransactionTestCase):
+    """Fila de tarefas no banco (execução real: ``executar`` fecha conexões como o trabalhador)"""
+
+    def vencer(self, tarefa_id):
+        Tarefa.objects.filter(pk=tarefa_id).update(executar_em=timezone.now() - timedelta(seconds=1))
+
+    def test_reivindicacao_exclusiva(self):
+        criadas = {tarefas.enfileirar('somar', {'a': i, 'b': 1}).pk for i in range(40)}
+        reivindicadas = []
+        erros = []
+        barreira = threading.Barrier(4)
+
+        def trabalhador(nome):
+            try:
+                barreira.wait()
+                while ids := tarefas.reivindicar(3, nome):
+                    reivindicadas.extend(ids)
+            except Exception as e:  # pragma: no cover - falha reportada abaixo
+                erros.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=trabalhador, args=(f'w{i}',)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(erros, [])
+        self.assertEqual(sorted(reivindicadas), sorted(criadas))
+        self.assertEqual(Tarefa.objects.filter(status='executando').count(), 40)
+        self.assertEqual(tarefas.reivindicar(5, 'w4'), [])
+
+    def test_sucesso_grava_resultado(self):
+        tarefa = tarefas.enfileirar('somar', {'a': 2, 'b': 3})
+        [tarefa_id] = tarefas.reivindicar(1, 'w1')
+        self.assertEqual(tarefas.executar(tarefa_id), 'concluida')
+        tarefa.refresh_from_db()
+        self.assertEqual((tarefa.status, tarefa.resultado, tarefa.tentativas), ('concluida', 5, 1))
+
+    def test_retentativa_com_espera_exponencial(self):
+        tarefa = tarefas.enfileirar('falhar', max_tentativas=4)
+        esperas = []
+        with mock.patch.object(tarefas.random, 'uniform', return_value=1.0):
+            for tentativa in range(1, 5):
+                self.vencer(tarefa.pk)
+                self.assertEqual(tarefas.reivindicar(1, 'w1'), [tarefa.pk])
+                tarefas.executar(tarefa.pk)
+                tarefa.refresh_from_db()
+                self.assertEqual(tarefa.tentativas, tentativa)
+                self.assertIn('falha de teste', tarefa.erro)
+                if tarefa.status == 'pendente':
+                    esperas.append(round((tarefa.executar_em - tarefa.concluida_em).total_seconds()))
+        # base * 2^(n-1), limitada ao máximo; na última tentativa desiste
+        self.assertEqual(esperas, [10, 20, 25])
+        self.assertEqual(tarefa.status, 'falhou')
+
+    def test_tarefa_travada_volta_para_a_fila(self):
+        tarefa = tarefas.enfileirar('somar', {'a': 1, 'b': 1})
+        self.assertEqual(tarefas.reivindicar(1, 'w1'), [tarefa.pk])
+        self.assertEqual(tarefas.recuperar_travadas(), 0)
+
+        # Passada a concessão, a tarefa é recuperada no meio da execução
+        def lenta(**argumentos):
+            self.assertEqual(tarefas.recuperar_travadas(timezone.now() + timedelta(seconds=61)), 1)
+            return 2
+
+        with mock.patch.object(tarefas, 'import_string', return_value=lenta):
+            self.assertIsNone(tarefas.executar(tarefa.pk))
+        tarefa.refresh_from_db()
+        # A execução atrasada não sobrescreve a recuperação
+        self.assertEqual((tarefa.status, tarefa.tentativas, tarefa.resultado), ('pendente', 1, None))
+        self.assertIn('w1', tarefa.erro)
+
+        self.vencer(tarefa.pk)
+        self.assertEqual(tarefas.reivindicar(1, 'w2'), [tarefa.pk])
+        self.assertEqual(tarefas.executar(tarefa.pk), 'concluida')
+        tarefa.refresh_from_db()
+        self.assertEqual((tarefa.status, tarefa.tentativas, tarefa.resultado), ('concluida', 2, 2))
+
+    def test_chave_coalesce_pendentes(self):
+        primeira = tarefas.enfileirar('falhar', chave='bairro:1')
+        self.assertIsNotNone(primeira.pk)
+        self.assertIsNone(tarefas.enfileirar('falhar', chave='bairro:1'))
+        self.assertIsNotNone(tarefas.enfileirar('falhar', chave='bairro:2'))
+        self.assertEqual(Tarefa.objects.filter(chave='bairro:1').count(), 1)
+
+        # Em execução a chave fica livre; se a execução falhar, a nova pendente fica com o trabalho
+        self.assertEqual(tarefas.reivindicar(1, 'w1'), [primeira.pk])
+        segunda = tarefas.enfileirar('falhar', chave='bairro:1')
+        self.assertIsNotNone(segunda)
+        tarefas.executar(primeira.pk)
+        primeira.refresh_from_db()
+        self.assertEqual(primeira.status, 'falhou')
+        self.assertIn('substituída', primeira.erro)
+        self.assertEqual(
+            list(Tarefa.objects.filter(chave='bairro:1', status='pendente').values_list('pk', flat=True)), [segunda.pk]
+        )
+
+    def test_pool_de_processos(self):
+        # ``--processos``: processos novos, com o Django configurado e o mesmo banco
+        trabalhador = tarefas.Trabalhador(processos=1)
+        try:
+            pid, pronto, banco = trabalhador._pool.submit(_estado_do_processo).result(timeout=60)
+        finally:
+            trabalhador._pool.shutdown()
+        self.assertNotEqual(pid, os.getpid())
+        self.assertTrue(pronto)
+        self.assertEqual(banco, connection.settings_dict['NAME'])
+        # O filho não herda (nem fecha) a conexão do pai
+        self.assertEqual(Tarefa.objects.count(), 0)
+
+    def test_trabalhador_com_processos_executa_a_fila(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('processos novos não enxergam o banco de teste em memória')
+        # Registro do projeto: os processos filhos não veem o override_settings deste teste
+        ids = [tarefas.enfileirar('reconciliar_contadores').pk for _ in range(3)]
+        self.assertEqual(tarefas.Trabalhador(processos=2).executar(ate_esvaziar=True), 3)
+        self.assertEqual(set(Tarefa.objects.filter(pk__in=ids).values_list('status', flat=True)), {'concluida'})
+
+
+class DeduplicacaoTest(TestCase):
+    """Relato enviado perto de um relato ativo recente vira confirmação dele"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bairro = Bairro.objects.create(nome='Boa Viagem', latitude=-8.12, longitude=-34.90)
+        cls.autor = UsuarioApp.objects.create(usuario=User.objects.create_user('autor'))
+        cls.vizinho = UsuarioApp.objects.create(usuario=User.objects.create_user('vizinho'))
+
+    def setUp(self):
+        patcher = mock.patch.object(deduplicacao, 'indice', deduplicacao.IndiceRecentes())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.existente = RelatorioAlagamento.objects.create(
+            usuario=self.autor, bairro=self.bairro, latitude='-8.1200000', longitude='-34.9000000',
+            nivel_severidade=3, altura_agua_cm=20,
+        )
+
+    def enviar(self, usuario, **campos):
+        self.client.force_login(usuario.usuario)
+        dados = {'latitude': '-8.1203000', 'longitude': '-34.9002000', 'bairro': self.bairro.id,
+                 'nivel_severidade': 4, **campos}
+        return self.client.post(reverse('dashboard:api_criar_relatorio'), json.dumps(dados),
+                                content_type='application/json')
+
+    def test_envio_proximo_mescla_no_existente(self):
+        resposta = self.enviar(self.vizinho, altura_agua_cm=45, descricao='Rua tomada')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual((resposta.json()['mesclado'], resposta.json()['id']), (True, self.existente.id))
+        self.assertEqual(RelatorioAlagamento.objects.count(), 1)
+
+        # Completa com o que veio a mais e conta como confirmação do vizinho
+        self.existente.refresh_from_db()
+        self.assertEqual((self.existente.nivel_severidade, self.existente.altura_agua_cm), (4, 45))
+        self.assertEqual(self.existente.total_confirmacoes, 1)
+        voto = InteracaoRelatorio.objects.get(relatorio=self.existente)
+        self.assertEqual((voto.usuario_id, voto.tipo, voto.comentario), (self.vizinho.id, 'confirmacao', 'Rua tomada'))
+
+        # Reenvio do próprio autor só completa, sem autoconfirmação
+        self.assertEqual(self.enviar(self.autor).status_code, 200)
+        self.existente.refresh_from_db()
+        self.assertEqual(self.existente.total_confirmacoes, 1)
+
+    def test_longe_antigo_ou_outra_severidade_nao_mescla(self):
+        def novo(**campos):
+            return RelatorioAlagamento(**{
+                'usuario': self.vizinho, 'bairro': self.bairro, 'latitude': '-8.1200000',
+                'longitude': '-34.9000000', 'nivel_severidade': 3, **campos,
+            })
+
+        casos = {
+            'longe': novo(latitude='-8.1220000'),  # ~220 m
+            'antigo': novo(timestamp=timezone.now() - timedelta(hours=2)),
+            'severidade': novo(nivel_severidade=1),
+        }
+        for nome, relatorio in casos.items():
+            with self.subTest(nome):
+                self.assertIsNone(deduplicacao.mesclar(relatorio))
+        RelatorioAlagamento.objects.filter(pk=self.existente.pk).update(status='resolvido')
+        self.assertIsNone(deduplicacao.mesclar(novo()))
+        self.assertEqual(InteracaoRelatorio.objects.count(), 0)
+
+    def test_grade_acha_vizinhos_em_qualquer_latitude(self):
+        indice = deduplicacao.IndiceRecentes()
+        indice._limpar()
+        agora = timezone.now()
+        # Pares a ~90 m em várias direções e latitudes (além de 60° as células estreitam em metros)
+        pares = []
+        for latitude in (-8.12, 45.0, 61.5, 70.25, 80.0, 88.9):
+            cos_lat = math.cos(math.radians(latitude))
+            for angulo in range(0, 360, 30):
+                dy = 90 * math.sin(math.radians(angulo)) / deduplicacao.METROS_POR_GRAU
+                dx = 90 * math.cos(math.radians(angulo)) / (deduplicacao.METROS_POR_GRAU * cos_lat)
+                pares.append(((latitude, 10.0), (latitude + dy, 10.0 + dx)))
+        for i, ((latitude, longitude), _) in enumerate(pares, start=1):
+            indice._inserir(deduplicacao.Entrada(i, latitude, longitude, agora.timestamp(), 3))
+        for i, (_, (latitude, longitude)) in enumerate(pares, start=1):
+            with self.subTest(latitude=latitude):
+                self.assertIn(i, indice.candidatos(latitude, longitude, agora, 3, sincronizar=False))
+
+
+class SpamTest(TestCase):
+    """Campanhas de copia-e-cola (MinHash/LSH) marcadas; textos curtos e distintos intocados"""
+
+    CAMPANHA = ('URGENTE!!! Compartilhe: a barragem de {} vai romper hoje a noite, saiam de casa agora '
+                'e avisem todos os vizinhos, a prefeitura esta escondendo')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bairro = Bairro.objects.create(nome='Boa Viagem', latitude=-8.12, longitude=-34.90)
+        cls.usuarios = [UsuarioApp.objects.create(usuario=User.objects.create_user(f'u{i}')) for i in range(8)]
+
+    def setUp(self):
+        self.detector = spam.DetectorSpam()
+
+    def relato(self, usuario, descricao):
+        return RelatorioAlagamento.objects.create(
+            usuario=usuario, bairro=self.bairro, latitude=-8.12, longitude=-34.90, nivel_severidade=3,
+            descricao=descricao,
+        )
+
+    def status(self, relatorios):
+        return [r.status for r in RelatorioAlagamento.objects.filter(pk__in=[r.pk for r in relatorios]).order_by('pk')]
+
+    def test_campanha_marcada_e_textos_curtos_isentos(self):
+        # Quatro cópias com pequenas variações: ainda abaixo de SPAM_MIN_COPIAS (5)
+        copias = [self.relato(u, self.CAMPANHA.format(bairro)) for u, bairro in
+                  zip(self.usuarios, ('Apipucos', 'Dois Irmãos', 'Monteiro', 'Casa Forte'))]
+        legitimo = self.relato(self.usuarios[4], 'Agua na altura do joelho na esquina da Rua da Aurora com a ponte, '
+                                                 'carros parados e onibus desviando pela Avenida Norte')
+        curtos = [self.relato(u, 'Rua alagada, cuidado!') for u in self.usuarios]
+        self.assertEqual(self.detector.processar()['marcados'], 0)
+        self.assertEqual(set(self.status(copias + curtos)), {'ativo'})
+
+        # A quinta cópia fecha a campanha: todas marcadas, inclusive as já indexadas
+        copias.append(self.relato(self.usuarios[5], self.CAMPANHA.format('Poço da Panela')))
+        comentario = InteracaoRelatorio.objects.create(
+            relatorio=legitimo, usuario=self.usuarios[6], tipo='comentario',
+            comentario=self.CAMPANHA.format('Macaxeira'),
+        )
+        resultado = self.detector.processar()
+        self.assertEqual(resultado['marcados'], 6)
+        self.assertEqual(self.status(copias), ['spam'] * 5)
+        comentario.refresh_from_db()
+        self.assertFalse(comentario.relevante)
+
+        # O relato legítimo e as frases curtas repetidas (não indexadas) ficam como estavam
+        self.assertEqual(self.status([legitimo] + curtos), ['ativo'] * 9)
+        self.assertIsNone(spam.assinatura('Rua alagada, cuidado!'))
+        self.assertEqual(self.detector.processar()['textos'], 0)
+
+        # Sem a isenção as oito frases curtas seriam uma campanha
+        with self.settings(SPAM_MIN_CARACTERES=0):
+            spam.DetectorSpam().processar()
+        self.assertEqual(self.status(curtos), ['spam'] * 8)
+
+
+class BuscaTextualTest(TestCase):
+    """Busca textual (api_busca): radicais, comentários e filtros de bairro, período e severidade"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.centro = Bairro.objects.create(nome='Boa Vista', latitude=-8.06, longitude=-34.89)
+        cls.praia = Bairro.objects.create(nome='Boa Viagem', latitude=-8.12, longitude=-34.90)
+        cls.autor = UsuarioApp.objects.create(usuario=User.objects.create_user('autor'))
+        cls.leitor = User.objects.create_user('leitor')
+        agora = timezone.now()
+
+        def relato(bairro, severidade, descricao, dias=0, **extra):
+            return RelatorioAlagamento.objects.create(
+                usuario=cls.autor, bairro=bairro, latitude=bairro.latitude, longitude=bairro.longitude,
+                nivel_severidade=severidade, descricao=descricao, timestamp=agora - timedelta(days=dias), **extra,
+            )
+
+        cls.rua = relato(cls.centro, 4, 'Rua completamente alagada perto do mercado')
+        cls.avenida = relato(cls.praia, 2, 'Alagamento na avenida principal', dias=3)
+        cls.comentado = relato(cls.praia, 3, 'Semáforo apagado no cruzamento')
+        cls.resolvido = relato(cls.centro, 4, 'Túnel alagado', status='resolvido')
+        relato(cls.centro, 3, 'Buraco grande na calçada')
+        InteracaoRelatorio.objects.create(
+            relatorio=cls.comentado, usuario=cls.autor, tipo='comentario', comentario='Carros alagados na esquina',
+        )
+
+    def buscar(self, **parametros):
+        self.client.force_login(self.leitor)
+        resposta = self.client.get(reverse('dashboard:api_busca'), parametros)
+        self.assertEqual(resposta.status_code, 200, resposta.content)
+        return {item['id'] for item in resposta.json()['resultados']}
+
+    def test_radical_encontra_flexoes_e_comentarios(self):
+        esperados = {self.rua.id, self.avenida.id, self.comentado.id}
+        self.assertEqual(self.buscar(q='alagado'), esperados)
+        self.assertEqual(self.buscar(q='ALAGAMENTOS'), esperados)
+        self.assertEqual(self.buscar(q='alagado', status='todos'), esperados | {self.resolvido.id})
+        self.assertEqual(self.buscar(q='mercado alagada'), {self.rua.id})
+        self.assertEqual(self.buscar(q='semaforo'), {self.comentado.id})
+        self.assertEqual(self.buscar(q='enchente'), set())
+
+    def test_filtros(self):
+        self.assertEqual(self.buscar(q='alagado', bairro=self.praia.id), {self.avenida.id, self.comentado.id})
+        self.assertEqual(self.buscar(q='alagado', bairro='Boa Vista'), {self.rua.id})
+        self.assertEqual(self.buscar(q='alagado', severidade=3), {self.rua.id, self.comentado.id})
+        desde = (timezone.now() - timedelta(days=1)).isoformat()
+        self.assertEqual(self.buscar(q='alagado', desde=desde), {self.rua.id, self.comentado.id})
+        ate = (timezone.now() - timedelta(days=2)).isoformat()
+        self.assertEqual(self.buscar(q='alagado', ate=ate), {self.avenida.id})
+
+    def test_comentario_editado_reindexa(self):
+        interacao = InteracaoRelatorio.objects.get(relatorio=self.comentado)
+        interacao.comentario = 'Sinal de trânsito desligado'
+        interacao.save()
+        self.assertEqual(self.buscar(q='alagado'), {self.rua.id, self.avenida.id})
+        self.assertEqual(self.buscar(q='trânsito'), {self.comentado.id})
+
+        interacao.relatorio = self.rua
+        interacao.save(update_fields=['relatorio'])
+        self.assertEqual(self.buscar(q='trânsito'), {self.rua.id})
+
+
+@override_settings(INGESTAO_ESPERA_MS=200, INGESTAO_TIMEOUT_S=5)
+class IngestaoTest(TransactionTestCase):
+    """Fila de ingestão com gravação em lote (thread escritora real, sem transação de teste)"""
+
+    def setUp(self):
+        self.bairro = Bairro.objects.create(nome='Boa Viagem', latitude=-8.12, longitude=-34.90)
+        self.autor = UsuarioApp.objects.create(usuario=User.objects.create_user('autor'))
+        self.fila = ingestao.FilaIngestao()
+        patcher = mock.patch.object(ingestao, 'fila', self.fila)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.fila.encerrar)
+        # Sem mesclagem com relatos de outros testes
+        patcher = mock.patch.object(deduplicacao, 'indice', deduplicacao.IndiceRecentes())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def relato(self, i=0, **campos):
+        return RelatorioAlagamento(**{
+            'usuario_id': self.autor.id, 'bairro': self.bairro, 'latitude': -8.12 + i * 0.01,
+            'longitude': -34.90, 'nivel_severidade': 2, **campos,
+        })
+
+    def bloquear_escritor(self):
+        """Faz a thread escritora parar no próximo lote até ``liberar.set()``"""
+        gravando, liberar = threading.Event(), threading.Event()
+        gravar_lote = ingestao.gravar_lote
+
+        def bloqueado(relatorios):
+            gravando.set()
+            liberar.wait(5)
+            gravar_lote(relatorios)
+
+        patcher = mock.patch.object(ingestao, 'gravar_lote', side_effect=bloqueado)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(liberar.set)
+        return gravando, liberar
+
+    def enviar_api(self, duravel=None):
+        self.client.force_login(self.autor.usuario)
+        dados = {'latitude': '-8.1200000', 'longitude': '-34.9000000', 'bairro': self.bairro.id, 'nivel_severidade': 2}
+        if duravel is not None:
+            dados['duravel'] = duravel
+        return self.client.post(reverse('dashboard:api_criar_relatorio'), json.dumps(dados),
+                                content_type='application/json')
+
+    def test_envios_proximos_viram_um_lote(self):
+        pedidos = [ingestao.enviar(self.relato(i), duravel=False) for i in range(5)]
+        self.assertTrue(all(pedido.aguardar(5) for pedido in pedidos))
+        self.assertEqual((self.fila.lotes, self.fila.gravados), (1, 5))
+        self.assertEqual(RelatorioAlagamento.objects.count(), 5)
+        self.autor.refresh_from_db()
+        self.assertEqual(self.autor.total_relatos, 5)
+
+    def test_lote_com_falha_regrava_um_a_um(self):
+        # Autor inexistente: o lote inteiro falha e cada relato é regravado sozinho
+        relatorios = [self.relato(0), self.relato(1, usuario_id=self.autor.id + 1000), self.relato(2)]
+        pedidos = [ingestao.enviar(relatorio, duravel=False) for relatorio in relatorios]
+        self.assertTrue(pedidos[0].aguardar(5))
+        self.assertTrue(pedidos[2].aguardar(5))
+        with self.assertRaises(KeyError):
+            pedidos[1].aguardar(5)
+        self.assertEqual((self.fila.lotes, self.fila.gravados), (2, 2))
+        self.assertEqual(
+            set(RelatorioAlagamento.objects.values_list('id_relato', flat=True)),
+            {relatorios[0].id_relato, relatorios[2].id_relato},
+        )
+
+    @override_settings(INGESTAO_FILA_MAXIMA=1, INGESTAO_ESPERA_FILA_S=0.05)
+    def test_fila_cheia_responde_503(self):
+        gravando, liberar = self.bloquear_escritor()
+        primeiro = ingestao.enviar(self.relato(0), duravel=False)
+        self.assertTrue(gravando.wait(5))
+        # O escritor está preso com o primeiro; o segundo ocupa a única vaga
+        segundo = ingestao.enviar(self.relato(1), duravel=False)
+        with self.assertRaises(ingestao.FilaCheia):
+            ingestao.enviar(self.relato(2), duravel=False)
+        resposta = self.enviar_api(duravel=0)
+        self.assertEqual(resposta.status_code, 503)
+        self.assertEqual(resposta['Retry-After'], '5')
+
+        liberar.set()
+        self.assertTrue(primeiro.aguardar(5) and segundo.aguardar(5))
+        self.assertEqual(RelatorioAlagamento.objects.count(), 2)
+
+    @override_settings(INGESTAO_TIMEOUT_S=0.05)
+    def test_modo_duravel_sem_commit_a_tempo_responde_202(self):
+        gravando, liberar = self.bloquear_escritor()
+        with self.assertRaises(ingestao.TempoEsgotado) as contexto:
+            ingestao.enviar(self.relato(0))
+        self.assertTrue(gravando.wait(5))
+
+        resposta = self.enviar_api()
+        self.assertEqual(resposta.status_code, 202)
+        self.assertEqual((resposta.json()['status'], resposta.json()['id']), ('enfileirado', None))
+
+        # O relato seguiu na fila e é gravado quando o escritor volta
+        liberar.set()
+        self.assertTrue(contexto.exception.pedido.aguardar(5))
+        self.fila.encerrar()
+        self.assertEqual(RelatorioAlagamento.objects.count(), 2)
+
+    def test_dentro_de_transacao_grava_na_hora(self):
+        with transaction.atomic():
+            pedido = ingestao.enviar(self.relato(0))
+            self.assertIsNotNone(pedido.relatorio.pk)
+            self.assertTrue(RelatorioAlagamento.objects.filter(pk=pedido.relatorio.pk).exists())
+        self.assertTrue(pedido.aguardar(0))
+        # A thread escritora usa outra conexão e nem chega a ser iniciada
+        self.assertIsNone(self.fila._thread)
+
+    def test_corpo_json_que_nao_e_objeto(self):
+        self.client.force_login(self.autor.usuario)
+        for corpo in ('[1, 2]', '"texto"', '3'):
+            with self.subTest(corpo):
+                resposta = self.client.post(reverse('dashboard:api_criar_relatorio'), corpo,
+                                            content_type='application/json')
+                self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(RelatorioAlagamento.objects.count(), 0)
+
+
+@override_settings(RECENTES_SINCRONIZAR_S=0)
+class RecentesTest(TestCase):
+    """Anel de relatos recentes: sobrescrita, saída de relatos, leitura do log de alterações e conferência"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bairro = Bairro.objects.create(nome='Boa Viagem', latitude=-8.12, longitude=-34.90)
+        cls.autor = UsuarioApp.objects.create(usuario=User.objects.create_user('autor'))
+
+    def setUp(self):
+        patcher = mock.patch.dict(alteracoes._lacunas, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buffer = recentes.BufferRecentes()
+        self.agora = timezone.now()
+
+    def criar(self, minutos=0, **campos):
+        return RelatorioAlagamento.objects.create(**{
+            'usuario': self.autor, 'bairro': self.bairro, 'latitude': -8.12, 'longitude': -34.90,
+            'nivel_severidade': 2, 'timestamp': self.agora - timedelta(minutes=minutos), **campos,
+        })
+
+    def ids(self):
+        return self.buffer.ultimos_ids(100, self.agora - timedelta(hours=1), agora=self.agora)
+
+    @override_settings(RECENTES_CAPACIDADE=3)
+    def test_anel_cheio_sobrescreve_o_mais_antigo(self):
+        antigos = [self.criar(minutos=10 - i) for i in range(3)]
+        self.assertEqual(self.ids(), [r.id for r in reversed(antigos)])
+
+        novo = self.criar()
+        self.buffer.registrar([novo])
+        self.assertEqual(self.ids(), [novo.id, antigos[2].id, antigos[1].id])
+        self.assertEqual(self.buffer.sobrescritos, 1)
+        # Relato já no anel é atualizado na mesma posição
+        novo.nivel_severidade = 4
+        self.buffer.registrar([novo])
+        self.assertEqual(self.buffer.sobrescritos, 1)
+        self.assertEqual(self.buffer.novos(agora=self.agora)[0]['nivel_severidade'], 4)
+
+    def test_relato_que_deixa_de_estar_ativo_sai(self):
+        resolvido, removido, mantido = (self.criar(minutos=i) for i in range(3))
+        self.assertEqual(self.ids(), [resolvido.id, removido.id, mantido.id])
+
+        resolvido.status = 'resolvido'
+        self.buffer.registrar([resolvido])
+        self.buffer.remover([removido.id])
+        self.assertEqual(self.ids(), [mantido.id])
+        # A posição liberada não conta como sobrescrita
+        self.buffer.registrar([self.criar()])
+        self.assertEqual(self.buffer.sobrescritos, 0)
+
+    def test_alcanca_escritas_de_outros_processos_pelo_log(self):
+        resolvido, removido, alterado = (self.criar(minutos=i) for i in range(3))
+        self.ids()  # Carga inicial
+
+        # Escritas salvas sem ``registrar``: só o log de alterações as traz
+        novo = self.criar()
+        resolvido.status = 'resolvido'
+        resolvido.save()
+        removido.delete()
+        alterado.nivel_severidade = 3
+        alterado.save()
+        self.assertEqual(self.ids(), [novo.id, alterado.id])
+        self.assertEqual(self.buffer.novos(agora=self.agora)[1]['nivel_severidade'], 3)
+        self.assertEqual(self.buffer._posicao_log, alteracoes.ultima_posicao())
+
+        with override_settings(RECENTES_SINCRONIZAR_S=3600):
+            outro = self.criar()
+            self.assertNotIn(outro.id, self.ids())
+
+    def test_verificar(self):
+        relatos = [self.criar(minutos=i) for i in range(3)]
+        situacao = self.buffer.verificar(agora=self.agora)
+        self.assertEqual((situacao['memoria'], situacao['banco']), (3, 3))
+        self.assertEqual((situacao['faltando'], situacao['sobrando'], situacao['divergentes']), ([], [], []))
+
+        # Mudanças que o log não traz: evento perdido e UPDATE em massa (sem sinais)
+        faltando = self.criar()
+        EventoAlteracao.objects.filter(objeto_id=faltando.id).delete()
+        RelatorioAlagamento.objects.filter(pk=relatos[0].pk).update(status='resolvido')
+        RelatorioAlagamento.objects.filter(pk=relatos[1].pk).update(nivel_severidade=4)
+        situacao = self.buffer.verificar(agora=self.agora)
+        self.assertEqual(
+            (situacao['faltando'], situacao['sobrando'], situacao['divergentes']),
+            ([faltando.id], [relatos[0].id], [relatos[1].id]),
+        )
+
+        self.buffer.recarregar(agora=self.agora)
+        situacao = self.buffer.verificar(agora=self.agora)
+        self.assertEqual((situacao['faltando'], situacao['sobrando'], situacao['divergentes']), ([], [], []))
+
+
+class LocalizacaoTest(TestCase):
+    """Bairro pelas coordenadas: centroide mais próximo, limites em GeoJSON e validação do formulário"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vista = Bairro.objects.create(nome='Boa Vista', latitude=-8.06, longitude=-34.89)
+        cls.viagem = Bairro.objects.create(nome='Boa Viagem', latitude=-8.12, longitude=-34.90)
+        cls.casa = Bairro.objects.create(nome='Casa Amarela', latitude=-8.03, longitude=-34.95)
+        cls.autor = UsuarioApp.objects.create(usuario=User.objects.create_user('autor'))
+
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.caminho = os.path.join(pasta.name, 'bairros_limites.geojson')
+        limites = override_settings(BAIRROS_LIMITES_GEOJSON=self.caminho)
+        limites.enable()
+        self.addCleanup(limites.disable)
+        catalogo.invalidar()
+        self.addCleanup(catalogo.invalidar)
+
+    def limites(self, *features):
+        """Grava o GeoJSON e recarrega o catálogo (o índice é reconstruído junto)"""
+        with open(self.caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump({'type': 'FeatureCollection', 'features': list(features)}, arquivo)
+        catalogo.invalidar()
+
+    @staticmethod
+    def retangulo(lon_min, lat_min, lon_max, lat_max):
+        return [[lon_min, lat_min], [lon_max, lat_min], [lon_max, lat_max], [lon_min, lat_max], [lon_min, lat_min]]
+
+    def formulario(self, latitude, longitude, bairro=None):
+        return RelatorioAlagamentoForm(data={
+            'latitude': latitude, 'longitude': longitude, 'bairro': bairro.pk if bairro else '',
+            'nivel_severidade': 2,
+        })
+
+    def test_centroide_mais_proximo_e_distancia_maxima(self):
+        self.assertEqual(resolvedor.resolver(-8.07, -34.89).id, self.vista.id)
+        ids, distancias = resolvedor.resolver_lote(
+            [-8.07, -8.11, -9.5, float('nan')], [-34.89, -34.91, -36.0, -34.9]
+        )
+        self.assertEqual(ids.tolist(), [self.vista.id, self.viagem.id, SEM_BAIRRO, SEM_BAIRRO])
+        self.assertAlmostEqual(distancias[0], 1112, delta=5)  # 0,01° de latitude
+        self.assertIsNone(resolvedor.resolver(-9.5, -36.0))
+
+    def test_poligono_tem_precedencia_sobre_o_centroide(self):
+        self.limites(
+            {
+                'type': 'Feature', 'properties': {'bairro_id': self.viagem.id},
+                'geometry': {'type': 'Polygon', 'coordinates': [
+                    self.retangulo(-34.92, -8.14, -34.86, -8.075),
+                    self.retangulo(-34.88, -8.082, -34.865, -8.076),  # Buraco
+                ]},
+            },
+            {
+                'type': 'Feature', 'properties': {'nome': 'Boa Vista'},
+                'geometry': {'type': 'MultiPolygon', 'coordinates': [[self.retangulo(-34.91, -8.075, -34.87, -8.04)]]},
+            },
+            {'type': 'Feature', 'properties': {'nome': 'Inexistente'},
+             'geometry': {'type': 'Polygon', 'coordinates': [self.retangulo(-35, -9, -34, -8)]}},
+        )
+        # Mais perto do centroide de Boa Vista, mas dentro do polígono de Boa Viagem
+        self.assertEqual(resolvedor.resolver(-8.08, -34.89).id, self.viagem.id)
+        # No buraco do polígono vale o centroide mais próximo
+        self.assertEqual(resolvedor.resolver(-8.079, -34.872).id, self.vista.id)
+
+        self.assertIsNone(resolvedor.sugerir(self.viagem.id, -8.08, -34.89))
+        self.assertEqual(resolvedor.sugerir(self.vista.id, -8.08, -34.89).id, self.viagem.id)
+        # Dentro de um polígono só o bairro dele é aceito, mesmo entre os candidatos
+        self.assertEqual(resolvedor.sugerir(self.casa.id, -8.05, -34.905).id, self.vista.id)
+
+    def test_sugerir_aceita_candidatos_sem_limites(self):
+        self.assertIsNone(resolvedor.sugerir(self.casa.id, -8.07, -34.89))
+        with override_settings(BAIRROS_CANDIDATOS=1):
+            self.assertEqual(resolvedor.sugerir(self.casa.id, -8.07, -34.89).id, self.vista.id)
+        # Fora da cobertura não há o que sugerir
+        self.assertIsNone(resolvedor.sugerir(self.casa.id, -9.5, -36.0))
+
+    def test_formulario_detecta_o_bairro(self):
+        formulario = self.formulario(-8.11, -34.91)
+        self.assertTrue(formulario.is_valid(), formulario.errors)
+        self.assertEqual(formulario.cleaned_data['bairro'].id, self.viagem.id)
+
+        formulario.instance.usuario = self.autor
+        relatorio = formulario.save()
+        self.assertEqual(RelatorioAlagamento.objects.get(pk=relatorio.pk).bairro_id, self.viagem.id)
+
+        formulario = self.formulario(-9.5, -36.0)
+        self.assertFalse(formulario.is_valid())
+        self.assertIn('bairro', formulario.errors)
+
+    def test_formulario_recusa_bairro_incompativel(self):
+        self.assertTrue(self.formulario(-8.07, -34.89, self.casa).is_valid())
+        with override_settings(BAIRROS_CANDIDATOS=1):
+            formulario = self.formulario(-8.07, -34.89, self.casa)
+            self.assertFalse(formulario.is_valid())
+        self.assertEqual(
+            formulario.errors['bairro'], ['As coordenadas ficam em Boa Vista (Recife), não em Casa Amarela.']
+        )
+
+
+@override_settings(FOTOS_LADO_MAXIMO=300, FOTOS_LADO_PREVIA=100, FOTOS_LADO_MINIATURA=50)
+class FotosTest(TestCase):
+    """Pipeline de fotos: hash no upload, pendência, variantes sem EXIF e reaproveitamento por conteúdo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bairro = Bairro.objects.create(nome='Boa Viagem', latitude=-8.12, longitude=-34.90)
+        cls.autor = UsuarioApp.objects.create(usuario=User.objects.create_user('autor'))
+
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.pendentes = os.path.join(pasta.name, 'pendentes')
+        pastas = override_settings(MEDIA_ROOT=os.path.join(pasta.name, 'media'), FOTOS_PENDENTES_DIR=self.pendentes)
+        pastas.enable()
+        self.addCleanup(pastas.disable)
+        patcher = mock.patch.object(deduplicacao, 'indice', deduplicacao.IndiceRecentes())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def jpeg(cor='red'):
+        """JPEG 400x200 com orientação EXIF (girar 90°) e metadados do aparelho"""
+        from PIL import Image
+
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Fabricante'
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 200), cor).save(buffer, format='JPEG', exif=exif.tobytes())
+        return buffer.getvalue()
+
+    def dados(self):
+        return {'latitude': '-8.1200000', 'longitude': '-34.9000000', 'bairro': self.bairro.pk, 'nivel_severidade': 2}
+
+    def test_upload_fica_pendente_e_gera_variantes_sem_exif(self):
+        from PIL import Image
+
+        conteudo = self.jpeg()
+        foto_hash = hashlib.sha256(conteudo).hexdigest()
+        self.client.force_login(self.autor.usuario)
+        with mock.patch.object(fotos, '_submeter') as submeter, self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(reverse('dashboard:criar_relatorio'), {
+                **self.dados(), 'foto': SimpleUploadedFile('foto.jpg', conteudo, content_type='image/jpeg'),
+            })
+        self.assertEqual(resposta.status_code, 302)
+        submeter.assert_called_once_with(foto_hash)
+
+        relatorio = RelatorioAlagamento.objects.get()
+        self.assertEqual((relatorio.foto_hash, relatorio.foto.name, relatorio.foto_processada), (foto_hash, '', False))
+        pendente = os.path.join(self.pendentes, foto_hash)
+        with open(pendente, 'rb') as arquivo:
+            self.assertEqual(arquivo.read(), conteudo)
+
+        self.assertEqual(fotos.processar(foto_hash), 1)
+        self.assertFalse(os.path.exists(pendente))
+        relatorio.refresh_from_db()
+        self.assertEqual((relatorio.foto.name, relatorio.foto_processada), (fotos.nome_arquivo(foto_hash), True))
+        self.assertTrue(relatorio.foto_miniatura_url.endswith(f'{foto_hash}_miniatura.jpg'))
+        # Orientação aplicada (400x200 girada), lado maior de cada variante e nenhum EXIF
+        for sufixo, tamanho in (('', (150, 300)), ('_previa', (50, 100)), ('_miniatura', (25, 50))):
+            with default_storage.open(fotos.nome_arquivo(foto_hash, sufixo)) as arquivo, Image.open(arquivo) as imagem:
+                self.assertEqual(imagem.size, tamanho)
+                self.assertEqual(len(imagem.getexif()), 0)
+
+    @override_settings(FOTOS_PROCESSAR_AO_SALVAR=False)
+    def test_mesma_foto_reaproveita_as_variantes(self):
+        conteudo = self.jpeg()
+        relatorios = []
+        for _ in range(2):
+            formulario = RelatorioAlagamentoForm(
+                data=self.dados(), files={'foto': SimpleUploadedFile('foto.jpg', conteudo)}
+            )
+            self.assertTrue(formulario.is_valid(), formulario.errors)
+            formulario.instance.usuario = self.autor
+            relatorios.append(formulario.save())
+            fotos.processar(relatorios[-1].foto_hash)
+
+        primeiro, segundo = (RelatorioAlagamento.objects.get(pk=r.pk) for r in relatorios)
+        self.assertEqual(segundo.foto_hash, primeiro.foto_hash)
+        self.assertEqual((segundo.foto.name, segundo.foto_processada), (primeiro.foto.name, True))
+        self.assertFalse(os.listdir(self.pendentes))
+
+    def test_agendar(self):
+        with mock.patch.object(fotos, '_submeter') as submeter:
+            with override_settings(FOTOS_PROCESSAR_AO_SALVAR=False), self.captureOnCommitCallbacks(execute=True):
+                fotos.agendar('abc')
+            submeter.assert_not_called()
+            with self.captureOnCommitCallbacks() as callbacks:
+                fotos.agendar('abc')
+            submeter.assert_not_called()  # Só depois do commit
+            callbacks[0]()
+            submeter.assert_called_once_with('abc')
+
+        with mock.patch.object(tarefas, 'ativa', return_value=True), \
+                mock.patch.object(tarefas, 'enfileirar') as enfileirar:
+            fotos.agendar('abc')
+        enfileirar.assert_called_once_with('processar_foto', {'foto_hash': 'abc'}, chave='processar_foto:abc')
+
+    def test_comando_processa_fotos_antigas(self):
+        conteudo = self.jpeg('blue')
+        nome = default_storage.save('relatos/antiga.jpg', ContentFile(conteudo))
+        relatorio = RelatorioAlagamento.objects.create(
+            usuario=self.autor, bairro=self.bairro, latitude=-8.12, longitude=-34.90, nivel_severidade=2, foto=nome,
+        )
+        # Pendência sem arquivo de origem (ex.: pasta limpa): falha registrada, o resto segue
+        RelatorioAlagamento.objects.create(
+            usuario=self.autor, bairro=self.bairro, latitude=-8.12, longitude=-34.90, nivel_severidade=2,
+            foto_hash='0' * 64, foto_processada=False,
+        )
+
+        saida = io.StringIO()
+        with override_settings(FOTOS_PROCESSAR_AO_SALVAR=False), self.assertLogs('dashboard.fotos', 'WARNING'):
+            call_command('processar_fotos', '--antigas', stdout=saida)
+        self.assertIn('1 fotos antigas importadas', saida.getvalue())
+        relatorio.refresh_from_db()
+        self.assertEqual(relatorio.foto_hash, hashlib.sha256(conteudo).hexdigest())
+        self.assertEqual(
+            (relatorio.foto.name, relatorio.foto_processada), (fotos.nome_arquivo(relatorio.foto_hash), True)
+        )
+        self.assertTrue(default_storage.exists(fotos.nome_arquivo(relatorio.foto_hash, '_miniatura')))
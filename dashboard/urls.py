@@ -14,5 +14,14 @@ urlpatterns = [
     path('analytics/', views.analytics, name='analytics'),
     path('relatorio/<int:relato_id>/', views.relatorio_detalhado, name='relatorio_detalhes'),
     path('api/tempo-real/', views.api_dados_tempo_real, name='api_tempo_real'),
+    path('api/relatorios/', views.api_relatorios, name='api_relatorios'),
+    path('api/relatorios/novo/', views.api_criar_relatorio, name='api_criar_relatorio'),
+    path('api/sync/', views.api_sync, name='api_sync'),
+    path('api/busca/', views.api_busca, name='api_busca'),
+    path('api/alteracoes/', views.api_alteracoes, name='api_alteracoes'),
+    path('api/relatorios/<int:relato_id>/interacao/', views.api_interacao_relatorio, name='api_interacao'),
+    path('api/urgentes/', views.api_relatos_urgentes, name='api_urgentes'),
+    path('api/metricas/', views.api_metricas_desempenho, name='api_metricas'),
+    path('api/recentes/verificar/', views.api_verificar_recentes, name='api_verificar_recentes'),
     path('relatar/', views.criar_relatorio, name='criar_relatorio'),
 ]
\ No newline at end of file
@@ -5,39 +5,74 @@ Views do Dashboard - Sistema Waze de Alagamentos
 Views para dashboard interativo com visualizações e filtros
 """
 
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.http import JsonResponse
-from django.db.models import Count, Avg, Q, F
-from django.db.models.functions import ExtractMonth, ExtractHour
+from django.urls import reverse
+from django.views.decorators.http import require_POST
+from django.db.models import Count, Avg, Sum
+from django.core.paginator import Paginator
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from datetime import datetime, timedelta
+from urllib.parse import urlencode
 import json
+import logging
 
 from .models import (
-    RelatorioAlagamento, Bairro, UsuarioApp, 
-    InteracaoRelatorio, AlertaArea
+    RelatorioAlagamento, UsuarioApp, 
+    InteracaoRelatorio, AlertaArea, EventoAlagamento
 )
 from .forms import RelatorioAlagamentoForm
+from . import (
+    alteracoes, busca, cubo, deduplicacao, ingestao, instrumentacao, interacoes, paginacao,
+    prioridade, recentes, sincronizacao, tarefas, visualizacoes,
+)
+from .catalogo import catalogo
+
+logger = logging.getLogger(__name__)
 
 @login_required
 def criar_relatorio(request):
     """View para criar um novo relatório de alagamento."""
+    status = 200
     if request.method == 'POST':
         form = RelatorioAlagamentoForm(request.POST, request.FILES)
         if form.is_valid():
             relatorio = form.save(commit=False)
             
-            # Garante que existe um perfil de usuário da aplicação
-            usuario_app, created = UsuarioApp.objects.get_or_create(usuario=request.user)
-            relatorio.usuario = usuario_app
-            
-            relatorio.save()
+            # Perfil do usuário da aplicação (id guardado na sessão)
+            relatorio.usuario_id = ingestao.usuario_app_id(request)
             
-            # Adicionar uma mensagem de sucesso (opcional, mas recomendado)
-            # messages.success(request, 'Relatório de alagamento enviado com sucesso!')
+            # Mesmo ponto, pouco tempo depois: vira confirmação do relato existente
+            existente = deduplicacao.mesclar(relatorio)
+            if existente is not None:
+                return redirect(
+                    reverse('dashboard:relatorio_detalhes', args=[existente.id]) + '?mesclado=1'
+                )
             
-            return redirect('dashboard:home')
+            # Gravação em lote com os demais envios (dashboard.ingestao)
+            try:
+                ingestao.enviar(relatorio)
+            except ingestao.FilaCheia:
+                form.add_error(None, 'Muitos relatos sendo enviados agora. Tente novamente em alguns segundos.')
+                status = 503
+            except ingestao.TempoEsgotado:
+                # Ainda na fila: não confirmar como gravado nem sugerir reenvio imediato
+                form.add_error(None, 'Seu relato foi recebido, mas a gravação ainda não foi confirmada. '
+                                     'Confira a lista de relatos em instantes antes de enviar de novo.')
+                status = 202
+            except Exception:
+                logger.exception("Falha ao gravar relato enviado pelo formulário")
+                form.add_error(None, 'Não foi possível gravar o relato. Tente novamente.')
+                status = 500
+            else:
+                # Adicionar uma mensagem de sucesso (opcional, mas recomendado)
+                # messages.success(request, 'Relatório de alagamento enviado com sucesso!')
+                
+                return redirect('dashboard:home')
     else:
         form = RelatorioAlagamentoForm()
         
@@ -45,7 +80,10 @@ def criar_relatorio(request):
         'form': form,
         'titulo': 'Reportar Novo Alagamento'
     }
-    return render(request, 'dashboard/criar_relatorio.html', context)
+    response = render(request, 'dashboard/criar_relatorio.html', context, status=status)
+    if status == 503:
+        response['Retry-After'] = '5'
+    return response
 
 def dashboard_home(request):
     """Dashboard principal com métricas e visualizações"""
@@ -54,6 +92,7 @@ def dashboard_home(request):
     periodo = request.GET.get('periodo', '90')  # Default 90 dias para mostrar dados INMET
     bairro_filtro = request.GET.get('bairro', 'all')
     severidade_filtro = request.GET.get('severidade', 'all')
+    ordem = request.GET.get('ordem', 'recentes')  # 'recentes' ou 'urgencia'
     
     # Data base para filtros
     data_limite = timezone.now() - timedelta(days=int(periodo))
@@ -64,9 +103,9 @@ def dashboard_home(request):
         status='ativo'
     )
     
-    # Aplicar filtros
+    # Aplicar filtros (bairro por id; nomes ainda aceitos via catálogo)
     if bairro_filtro != 'all':
-        relatos_query = relatos_query.filter(bairro__nome=bairro_filtro)
+        relatos_query = relatos_query.filter(bairro_id__in=catalogo.resolver(bairro_filtro))
     
     if severidade_filtro != 'all':
         relatos_query = relatos_query.filter(nivel_severidade=int(severidade_filtro))
@@ -81,7 +120,9 @@ def dashboard_home(request):
         'usuarios_ativos': UsuarioApp.objects.filter(
             relatos__timestamp__gte=data_limite
         ).distinct().count(),
-        'total_confirmacoes': sum(r.total_confirmacoes for r in relatos_query),
+        'total_confirmacoes': relatos_query.aggregate(
+            total=Sum('total_confirmacoes')
+        )['total'] or 0,
         'severidade_media': relatos_query.aggregate(
             media=Avg('nivel_severidade')
         )['media'] or 0,
@@ -92,37 +133,29 @@ def dashboard_home(request):
     agora = timezone.now()
     ultima_24h = agora - timedelta(hours=24)
     
-    print("\n--- DEBUG: Calculando relatórios por hora ---")
-    print(f"Hora atual: {agora}")
-    
+    # Contagens por hora do buffer em memória de relatos recentes (sem SQL)
     relatos_por_hora = []
-    for i in range(24):
+    for i, count in enumerate(recentes.buffer.por_hora(ultima_24h, 24, agora=agora)):
         hora_inicio = ultima_24h + timedelta(hours=i)
-        hora_fim = hora_inicio + timedelta(hours=1)
         
-        count = RelatorioAlagamento.objects.filter(
-            timestamp__range=(hora_inicio, hora_fim),
-            status='ativo'
-        ).count()
-        
-        # Imprimir apenas se o contador for maior que zero para evitar poluir o console
+        # Registrar apenas intervalos com relatórios para não poluir o log
         if count > 0:
-            print(f"[{i:02d}] Intervalo: {hora_inicio.strftime('%Y-%m-%d %H:%M')} a {hora_fim.strftime('%Y-%m-%d %H:%M')} | Relatórios: {count}")
+            logger.debug("[%02d] %s a %s | Relatórios: %d", i, hora_inicio, hora_inicio + timedelta(hours=1), count)
 
         relatos_por_hora.append({
             'hora': hora_inicio.strftime('%H:00'),
             'total': count
         })
-    print("--- FIM DEBUG ---\n")
-    
     # 2. Ranking de bairros mais afetados
-    bairros_ranking = relatos_query.values(
-        'bairro__nome'
+    bairros_ranking = list(relatos_query.values(
+        'bairro_id'
     ).annotate(
         total_relatos=Count('id'),
         severidade_media=Avg('nivel_severidade'),
-        total_confirmacoes=Count('interacoes')
-    ).order_by('-total_relatos')[:10]
+        total_confirmacoes=Sum('total_confirmacoes')
+    ).order_by('-total_relatos')[:10])
+    for item in bairros_ranking:
+        item['bairro__nome'] = catalogo.nome(item['bairro_id'])
     
     # 3. Distribuição de severidade
     severidade_dist = relatos_query.values(
@@ -131,16 +164,21 @@ def dashboard_home(request):
         total=Count('id')
     ).order_by('nivel_severidade')
     
-    # 4. Relatórios recentes para timeline
-    relatos_recentes = relatos_query.select_related(
-        'bairro', 'usuario'
-    ).order_by('-timestamp')[:10]
+    # 4. Relatórios recentes para timeline (urgência calculada no banco, paginado)
+    relatos_lista = relatos_query.com_urgencia()
+    if ordem == 'urgencia':
+        relatos_lista = relatos_lista.order_by('-urgencia', '-timestamp', '-id')
+    else:
+        relatos_lista = relatos_lista.order_by('-timestamp', '-id')
+    relatos_recentes = Paginator(relatos_lista, 10).get_page(request.GET.get('pagina'))
     
     # 5. Mapa de calor (dados para coordenadas)
     dados_mapa = list(relatos_query.values(
         'latitude', 'longitude', 'nivel_severidade', 
-        'bairro__nome', 'timestamp'
+        'bairro_id', 'timestamp'
     ))
+    for item in dados_mapa:
+        item['bairro__nome'] = catalogo.nome(item.pop('bairro_id'))
     
     # 6. Tendência temporal (últimos 30 dias)
     ultimos_30_dias = agora - timedelta(days=30)
@@ -168,7 +206,7 @@ def dashboard_home(request):
     
     # OPÇÕES PARA FILTROS
     opcoes_filtros = {
-        'bairros': Bairro.objects.all().order_by('nome'),
+        'bairros': catalogo.todos(),
         'severidades': [
             {'value': 1, 'label': '🟢 Baixo'},
             {'value': 2, 'label': '🟡 Moderado'},
@@ -191,7 +229,15 @@ def dashboard_home(request):
             'periodo': periodo,
             'bairro': bairro_filtro,
             'severidade': severidade_filtro,
-        }
+            'ordem': ordem,
+        },
+        # Para links de paginação preservarem os filtros
+        'filtros_querystring': urlencode({
+            'periodo': periodo,
+            'bairro': bairro_filtro,
+            'severidade': severidade_filtro,
+            'ordem': ordem,
+        }),
     }
     
     return render(request, 'dashboard/home.html', context)
@@ -217,18 +263,18 @@ def teste_dados(request):
         'usuarios_ativos': UsuarioApp.objects.filter(
             relatos__timestamp__gte=data_limite
         ).distinct().count(),
-        'total_confirmacoes': sum(r.total_confirmacoes for r in relatos_query),
+        'total_confirmacoes': relatos_query.aggregate(
+            total=Sum('total_confirmacoes')
+        )['total'] or 0,
         'severidade_media': relatos_query.aggregate(
             media=Avg('nivel_severidade')
         )['media'] or 0,
     }
     
-    relatos_recentes = relatos_query.select_related(
-        'bairro', 'usuario'
-    ).order_by('-timestamp')[:10]
+    relatos_recentes = relatos_query.com_relacionados().order_by('-timestamp')[:10]
     
     opcoes_filtros = {
-        'bairros': Bairro.objects.all().order_by('nome'),
+        'bairros': catalogo.todos(),
     }
     
     context = {
@@ -239,26 +285,358 @@ def teste_dados(request):
     
     return render(request, 'dashboard/teste.html', context)
 
-def api_dados_tempo_real(request):
-    """API para dados em tempo real (AJAX)"""
+@staff_member_required
+def api_metricas_desempenho(request):
+    """API com percentis de desempenho por view (janela móvel, somente staff)"""
+    if request.method == 'POST' and request.POST.get('limpar'):
+        instrumentacao.janela.limpar()
     
-    # Últimos 10 minutos
-    tempo_limite = timezone.now() - timedelta(minutes=10)
+    return JsonResponse({
+        'janela_por_view': instrumentacao.janela.tamanho,
+        'views': instrumentacao.janela.resumo(),
+        'tarefas': tarefas.metricas(),
+        'timestamp_atualizacao': timezone.now().strftime('%H:%M:%S'),
+    })
+
+@staff_member_required
+def api_verificar_recentes(request):
+    """Confere o buffer de relatos recentes deste processo contra o banco (somente staff)"""
+    resultado = recentes.buffer.verificar()
+    if request.method == 'POST' and request.POST.get('recarregar'):
+        recentes.buffer.recarregar()
+        resultado['recarregado'] = True
+    
+    return JsonResponse(resultado)
+
+def _parse_momento(valor):
+    """Data/hora ISO da querystring (sem fuso = fuso do projeto)"""
+    momento = parse_datetime(valor)
+    if momento is None:
+        raise ValueError(f"Data/hora inválida: {valor}")
+    return timezone.make_aware(momento) if timezone.is_naive(momento) else momento
+
+def api_relatorios(request):
+    """
+    API de listagem de relatórios com filtros e paginação por cursor.
+    
+    Filtros: bairro (id), severidade (mínima), status (padrão 'ativo'; 'todos'
+    desliga o filtro), desde/ate (ISO 8601), bbox (lat_min,lon_min,lat_max,lon_max).
+    Paginação: limite (até 200) e cursor (valor de 'proximo_cursor').
+    """
+    relatos = RelatorioAlagamento.objects.select_related('bairro')
+    
+    try:
+        status = request.GET.get('status', 'ativo')
+        if status != 'todos':
+            relatos = relatos.filter(status=status)
+        if request.GET.get('bairro'):
+            relatos = relatos.filter(bairro_id=int(request.GET['bairro']))
+        if request.GET.get('severidade'):
+            relatos = relatos.filter(nivel_severidade__gte=int(request.GET['severidade']))
+        if request.GET.get('desde'):
+            relatos = relatos.filter(timestamp__gte=_parse_momento(request.GET['desde']))
+        if request.GET.get('ate'):
+            relatos = relatos.filter(timestamp__lte=_parse_momento(request.GET['ate']))
+        if request.GET.get('bbox'):
+            lat_min, lon_min, lat_max, lon_max = (float(v) for v in request.GET['bbox'].split(','))
+            relatos = relatos.filter(
+                latitude__range=(lat_min, lat_max),
+                longitude__range=(lon_min, lon_max)
+            )
+        limite = min(int(request.GET.get('limite', paginacao.LIMITE_PADRAO)), paginacao.LIMITE_MAXIMO)
+        itens, proximo = paginacao.pagina_keyset(relatos, request.GET.get('cursor'), max(1, limite))
+    except ValueError as e:
+        # CursorInvalido também é ValueError
+        return JsonResponse({'erro': str(e)}, status=400)
+    
+    resultados = [
+        {
+            'id': relato.id,
+            'id_relato': str(relato.id_relato),
+            'bairro': relato.bairro.nome,
+            'bairro_id': relato.bairro_id,
+            'nivel_severidade': relato.nivel_severidade,
+            'status': relato.status,
+            'timestamp': relato.timestamp.isoformat(),
+            'latitude': float(relato.latitude),
+            'longitude': float(relato.longitude),
+            'total_confirmacoes': relato.total_confirmacoes,
+            'total_negacoes': relato.total_negacoes,
+        }
+        for relato in itens
+    ]
     
-    novos_relatos = RelatorioAlagamento.objects.filter(
-        timestamp__gte=tempo_limite,
-        status='ativo'
-    ).values(
-        'id', 'bairro__nome', 'nivel_severidade', 
-        'timestamp', 'latitude', 'longitude'
+    return JsonResponse({
+        'resultados': resultados,
+        'proximo_cursor': proximo,
+        'limite': limite,
+    })
+
+def api_busca(request):
+    """
+    API de busca textual em descrição, endereço e comentários dos relatórios.
+    
+    Parâmetros: q (obrigatório; todos os termos devem aparecer), bairro (id ou
+    nome), severidade (mínima), status (padrão 'ativo'; 'todos' desliga o
+    filtro), desde/ate (ISO 8601), limite (até 200) e offset. Resultados do
+    mais ao menos relevante.
+    """
+    consulta = request.GET.get('q', '').strip()
+    if not busca.termos(consulta):
+        return JsonResponse({'erro': "Parâmetro 'q' é obrigatório"}, status=400)
+    
+    relatos = RelatorioAlagamento.objects.select_related(None).only(
+        'id', 'id_relato', 'bairro_id', 'nivel_severidade', 'status', 'timestamp',
+        'descricao', 'endereco_aproximado', 'total_confirmacoes',
+    )
+    try:
+        status = request.GET.get('status', 'ativo')
+        if status != 'todos':
+            relatos = relatos.filter(status=status)
+        if request.GET.get('bairro'):
+            relatos = relatos.filter(bairro_id__in=catalogo.resolver(request.GET['bairro']))
+        if request.GET.get('severidade'):
+            relatos = relatos.filter(nivel_severidade__gte=int(request.GET['severidade']))
+        if request.GET.get('desde'):
+            relatos = relatos.filter(timestamp__gte=_parse_momento(request.GET['desde']))
+        if request.GET.get('ate'):
+            relatos = relatos.filter(timestamp__lte=_parse_momento(request.GET['ate']))
+        limite = max(1, min(int(request.GET.get('limite', paginacao.LIMITE_PADRAO)), paginacao.LIMITE_MAXIMO))
+        offset = max(0, int(request.GET.get('offset', 0)))
+    except ValueError as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+    
+    # Um a mais para saber se há próxima página sem COUNT
+    itens = list(busca.buscar(consulta, relatos)[offset:offset + limite + 1])
+    resultados = [
+        {
+            'id': relato.id,
+            'id_relato': str(relato.id_relato),
+            'bairro': catalogo.nome(relato.bairro_id),
+            'bairro_id': relato.bairro_id,
+            'nivel_severidade': relato.nivel_severidade,
+            'status': relato.status,
+            'timestamp': relato.timestamp.isoformat(),
+            'descricao': relato.descricao,
+            'endereco_aproximado': relato.endereco_aproximado,
+            'total_confirmacoes': relato.total_confirmacoes,
+            'relevancia': round(relato.relevancia, 6),
+        }
+        for relato in itens[:limite]
+    ]
+    
+    return JsonResponse({
+        'consulta': consulta,
+        'resultados': resultados,
+        'proximo_offset': offset + limite if len(itens) > limite else None,
+        'limite': limite,
+    })
+
+def api_alteracoes(request):
+    """
+    Feed de alterações de relatórios e interações (log de alterações).
+    
+    O cliente guarda a posição: apos (id do último evento recebido, padrão
+    0), limite (até 200) e modelo ('relatorio' ou 'interacao'). Repetir com
+    apos = 'posicao' da resposta até 'eventos' vir vazio.
+    """
+    try:
+        posicao = max(0, int(request.GET.get('apos', 0)))
+        limite = max(1, min(int(request.GET.get('limite', paginacao.LIMITE_PADRAO)), paginacao.LIMITE_MAXIMO))
+    except ValueError as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+    modelo = request.GET.get('modelo')
+    if modelo is not None and modelo not in alteracoes.CAMPOS:
+        return JsonResponse({'erro': "modelo deve ser 'relatorio' ou 'interacao'"}, status=400)
+    
+    eventos, posicao = alteracoes.ler(posicao, limite, modelos=(modelo,) if modelo else None)
+    return JsonResponse({
+        'eventos': [
+            {
+                'id': evento.id,
+                'modelo': evento.modelo,
+                'objeto_id': evento.objeto_id,
+                'operacao': evento.operacao,
+                'campos': evento.campos,
+                # Autoria não sai no feed público
+                'dados': {campo: valor for campo, valor in evento.dados.items() if campo != 'usuario_id'},
+                'timestamp': evento.timestamp.isoformat(),
+            }
+            for evento in eventos
+        ],
+        'posicao': posicao,
+    })
+
+@login_required
+@require_POST
+def api_criar_relatorio(request):
+    """
+    API de envio de relato (JSON ou formulário, mesmos campos do formulário).
+    
+    201 com o relato gravado; 202 se aceito mas ainda na fila (modo
+    assíncrono, ``duravel=0``, ou gravação mais lenta que o limite); 200 se
+    mesclado a um relato próximo; 503 com Retry-After se a fila estiver cheia.
+    """
+    if request.content_type == 'application/json':
+        try:
+            dados = json.loads(request.body or '{}')
+        except ValueError:
+            return JsonResponse({'erro': 'JSON inválido'}, status=400)
+        if not isinstance(dados, dict):
+            return JsonResponse({'erro': 'O corpo deve ser um objeto JSON'}, status=400)
+    else:
+        dados = request.POST
+    
+    form = RelatorioAlagamentoForm(dados, request.FILES)
+    if not form.is_valid():
+        return JsonResponse({'erro': form.errors.get_json_data()}, status=400)
+    
+    relatorio = form.save(commit=False)
+    relatorio.usuario_id = ingestao.usuario_app_id(request)
+    existente = deduplicacao.mesclar(relatorio)
+    if existente is not None:
+        return JsonResponse({'mesclado': True, 'id': existente.id, 'id_relato': str(existente.id_relato)})
+    
+    duravel = dados.get('duravel')
+    duravel = None if duravel in (None, '') else str(duravel).lower() in ('1', 'true', 'sim')
+    try:
+        pedido = ingestao.enviar(relatorio, duravel=duravel)
+        gravado = pedido.aguardar(0)
+    except ingestao.TempoEsgotado:
+        gravado = False
+    except ingestao.FilaCheia as e:
+        response = JsonResponse({'erro': str(e)}, status=503)
+        response['Retry-After'] = '5'
+        return response
+    except Exception:
+        logger.exception("Falha ao gravar relato enviado pela API")
+        return JsonResponse({'erro': 'Falha ao gravar o relato'}, status=500)
+    
+    return JsonResponse({
+        'id': relatorio.pk if gravado else None,
+        'id_relato': str(relatorio.id_relato),
+        'bairro_id': relatorio.bairro_id,
+        'status': 'gravado' if gravado else 'enfileirado',
+    }, status=201 if gravado else 202)
+
+@login_required
+@require_POST
+def api_sync(request):
+    """
+    Sincronização de clientes offline: relatos e confirmações em lote (JSON).
+    
+    Corpo: {"relatos": [{id_relato (UUID do aparelho), timestamp, latitude,
+    longitude, nivel_severidade, ...}], "confirmacoes": [{id_relato, tipo,
+    comentario}]}. Reenviar o mesmo lote é seguro. Resposta: um resultado por
+    item, na ordem recebida.
+    """
+    try:
+        dados = json.loads(request.body or '{}')
+    except ValueError:
+        return JsonResponse({'erro': 'JSON inválido'}, status=400)
+    if not isinstance(dados, dict):
+        return JsonResponse({'erro': 'O corpo deve ser um objeto JSON'}, status=400)
+    
+    relatos = dados.get('relatos') or []
+    confirmacoes = dados.get('confirmacoes') or []
+    if not isinstance(relatos, list) or not isinstance(confirmacoes, list):
+        return JsonResponse({'erro': "'relatos' e 'confirmacoes' devem ser listas"}, status=400)
+    maximo = getattr(settings, 'SYNC_MAX_ITENS', 200)
+    if len(relatos) + len(confirmacoes) > maximo:
+        return JsonResponse({'erro': f'No máximo {maximo} itens por sincronização'}, status=413)
+    
+    resultados = sincronizacao.sincronizar(ingestao.usuario_app_id(request), relatos, confirmacoes)
+    return JsonResponse(resultados)
+
+@login_required
+@require_POST
+def api_interacao_relatorio(request, relato_id):
+    """API para confirmar ou negar um relato (JSON ou formulário: tipo, comentario)"""
+    if request.content_type == 'application/json':
+        try:
+            dados = json.loads(request.body or '{}')
+        except ValueError:
+            return JsonResponse({'erro': 'JSON inválido'}, status=400)
+        if not isinstance(dados, dict):
+            return JsonResponse({'erro': 'O corpo deve ser um objeto JSON'}, status=400)
+    else:
+        dados = request.POST
+    
+    tipo = dados.get('tipo')
+    if tipo not in interacoes.TIPOS_VOTO:
+        return JsonResponse({'erro': "tipo deve ser 'confirmacao' ou 'negacao'"}, status=400)
+    comentario = dados.get('comentario') or ''
+    if not isinstance(comentario, str):
+        return JsonResponse({'erro': 'comentario deve ser texto'}, status=400)
+    
+    relatorio = get_object_or_404(
+        RelatorioAlagamento.objects.values('id', 'usuario__usuario_id', 'status'),
+        id=relato_id
     )
+    if relatorio['status'] != 'ativo':
+        return JsonResponse({'erro': 'Relato não está ativo'}, status=409)
+    if relatorio['usuario__usuario_id'] == request.user.id:
+        return JsonResponse({'erro': 'O autor não pode votar no próprio relato'}, status=403)
+    
+    criada, removida = interacoes.registrar_voto(
+        relato_id, ingestao.usuario_app_id(request), tipo, comentario[:300]
+    )
+    
+    return JsonResponse({
+        'tipo': tipo,
+        'criada': criada,
+        'voto_oposto_removido': removida,
+        **interacoes.totais(relato_id),
+    }, status=201 if criada else 200)
+
+@staff_member_required
+def api_relatos_urgentes(request):
+    """API da fila de prioridade: top-K relatos ativos mais urgentes (somente staff)"""
+    try:
+        k = int(request.GET.get('k', prioridade.K_PADRAO))
+        bairro_id = int(request.GET['bairro']) if request.GET.get('bairro') else None
+    except ValueError:
+        return JsonResponse({'erro': 'Parâmetros k e bairro devem ser inteiros'}, status=400)
+    
+    relatos = prioridade.mais_urgentes(k, bairro=bairro_id)
+    dados = [
+        {
+            'id': relato.id,
+            'id_relato': str(relato.id_relato),
+            'bairro': relato.bairro.nome,
+            'bairro_id': relato.bairro_id,
+            'nivel_severidade': relato.nivel_severidade,
+            'urgencia': round(relato.urgencia_score, 1),
+            'urgencia_atualizada_em': (
+                relato.urgencia_atualizada_em.isoformat() if relato.urgencia_atualizada_em else None
+            ),
+            'total_confirmacoes': relato.total_confirmacoes,
+            'timestamp': relato.timestamp.isoformat(),
+            'latitude': float(relato.latitude),
+            'longitude': float(relato.longitude),
+        }
+        for relato in relatos
+    ]
+    
+    return JsonResponse({
+        'bairro_id': bairro_id,
+        'k': len(dados),
+        'relatos': dados,
+        'timestamp_atualizacao': timezone.now().strftime('%H:%M:%S'),
+    })
+
+def api_dados_tempo_real(request):
+    """API para dados em tempo real (AJAX)"""
+    
+    # Últimos 10 minutos, do buffer em memória de relatos recentes (sem SQL)
+    novos_relatos = recentes.buffer.novos(minutos=10)
     
     # Converter para lista e formatar timestamps
     dados = []
     for relato in novos_relatos:
         dados.append({
             'id': relato['id'],
-            'bairro': relato['bairro__nome'],
+            'bairro': catalogo.nome(relato['bairro_id']),
             'severidade': relato['nivel_severidade'],
             'timestamp': relato['timestamp'].strftime('%H:%M'),
             'latitude': float(relato['latitude']),
@@ -275,15 +653,12 @@ def relatorio_detalhado(request, relato_id):
     """Página de detalhes de um relatório específico"""
     
     relatorio = get_object_or_404(
-        RelatorioAlagamento.objects.select_related(
-            'bairro', 'usuario'
-        ),
+        RelatorioAlagamento.objects.com_relacionados().com_urgencia(),
         id=relato_id
     )
     
-    # Incrementar visualizações
-    relatorio.visualizacoes = F('visualizacoes') + 1
-    relatorio.save(update_fields=['visualizacoes'])
+    # Incrementar visualizações (acumuladas e gravadas em lote a cada poucos segundos)
+    relatorio.visualizacoes += visualizacoes.registrar(relatorio.id)
     
     # Buscar interações
     interacoes = InteracaoRelatorio.objects.filter(
@@ -292,17 +667,21 @@ def relatorio_detalhado(request, relato_id):
     ).select_related('usuario').order_by('-timestamp')[:20]
     
     # Relatórios próximos (mesmo bairro, últimas 24h)
-    relatos_proximos = RelatorioAlagamento.objects.filter(
-        bairro=relatorio.bairro,
-        timestamp__gte=timezone.now() - timedelta(hours=24),
+    # Seleção pelo buffer de relatos recentes; o banco só carrega os 5 por chave primária
+    proximos_ids = recentes.buffer.ultimos_ids(
+        5, timezone.now() - timedelta(hours=24), bairro_id=relatorio.bairro_id, excluir=[relatorio.id]
+    )
+    relatos_proximos = RelatorioAlagamento.objects.com_relacionados().com_urgencia().filter(
+        id__in=proximos_ids,
         status='ativo'
-    ).exclude(id=relatorio.id).order_by('-timestamp')[:5]
+    ).order_by('-timestamp', '-id')
     
     context = {
         'relatorio': relatorio,
         'interacoes': interacoes,
         'relatos_proximos': relatos_proximos,
         'pode_interagir': True,  # Implementar lógica de permissões
+        'mesclado': request.GET.get('mesclado') == '1',
     }
     
     return render(request, 'dashboard/relatorio_detalhes.html', context)
@@ -321,7 +700,7 @@ def mapa_interativo(request):
         timestamp__gte=tempo_limite,
         nivel_severidade__gte=int(severidade_min),
         status='ativo'
-    ).select_related('bairro')
+    ).select_related(None)  # nomes de bairro vêm do catálogo, sem join
     
     # Preparar dados para o mapa
     dados_mapa = []
@@ -331,23 +710,53 @@ def mapa_interativo(request):
             'lat': float(relato.latitude),
             'lng': float(relato.longitude),
             'severidade': relato.nivel_severidade,
-            'bairro': relato.bairro.nome,
+            'bairro': catalogo.nome(relato.bairro_id),
             'timestamp': relato.timestamp.strftime('%d/%m %H:%M'),
             'confirmacoes': relato.total_confirmacoes,
             'descricao': relato.descricao or 'Sem descrição',
+            'foto': relato.foto_miniatura_url,
         })
     
     # Estatísticas por bairro para heatmap
-    stats_bairros = relatos.values(
-        'bairro__nome'
+    stats_bairros = list(relatos.values(
+        'bairro_id'
     ).annotate(
         total=Count('id'),
         severidade_media=Avg('nivel_severidade')
-    ).order_by('-total')
+    ).order_by('-total'))
+    for item in stats_bairros:
+        item['bairro__nome'] = catalogo.nome(item.pop('bairro_id'))
+    
+    # Eventos de alagamento (relatos agrupados) no período
+    eventos = EventoAlagamento.objects.filter(
+        fim__gte=tempo_limite,
+        severidade_maxima__gte=int(severidade_min)
+    ).select_related('bairro').order_by('-ativo', '-severidade_maxima', '-total_relatos')[:200]
+    
+    dados_eventos = []
+    for evento in eventos:
+        lat, lng = evento.centro
+        dados_eventos.append({
+            'id': evento.id,
+            'lat': lat,
+            'lng': lng,
+            'limites': [
+                [float(evento.latitude_min), float(evento.longitude_min)],
+                [float(evento.latitude_max), float(evento.longitude_max)],
+            ],
+            'severidade_maxima': evento.severidade_maxima,
+            'total_relatos': evento.total_relatos,
+            'bairro': evento.bairro.nome if evento.bairro else None,
+            'inicio': evento.inicio.strftime('%d/%m %H:%M'),
+            'fim': evento.fim.strftime('%d/%m %H:%M'),
+            'ativo': evento.ativo,
+        })
     
     context = {
         'dados_mapa': json.dumps(dados_mapa),
-        'stats_bairros': json.dumps(list(stats_bairros)),
+        'eventos': eventos,
+        'dados_eventos': json.dumps(dados_eventos),
+        'stats_bairros': json.dumps(stats_bairros),
         'filtros': {
             'severidade_min': severidade_min,
             'periodo_horas': periodo_horas,
@@ -358,49 +767,54 @@ def mapa_interativo(request):
     return render(request, 'dashboard/mapa.html', context)
 
 def analytics(request):
-    """Página de analytics avançados"""
+    """Página de analytics avançados (agregados do cubo, dashboard.cubo)"""
+    
+    # Período: últimos N dias ou intervalo desde/ate (datas); bairro opcional
+    periodo = request.GET.get('periodo', '90')
+    hoje = timezone.localdate()
+    try:
+        desde = parse_date(request.GET['desde']) if request.GET.get('desde') else None
+        ate = parse_date(request.GET['ate']) if request.GET.get('ate') else None
+        if desde is None:
+            desde = hoje - timedelta(days=int(periodo))
+    except ValueError:
+        desde, ate = hoje - timedelta(days=90), None
+    bairro_filtro = request.GET.get('bairro', 'all')
+    bairro_ids = catalogo.resolver(bairro_filtro) if bairro_filtro != 'all' else None
     
-    # Análise temporal detalhada
-    ultimos_90_dias = timezone.now() - timedelta(days=90)
+    celulas = cubo.celulas(desde, ate, bairro_ids)
     
     # Tendências por mês
-    tendencias_mensais = RelatorioAlagamento.objects.filter(
-        timestamp__gte=ultimos_90_dias
-    ).annotate(
-        mes=ExtractMonth('timestamp')
-    ).values('mes').annotate(
-        total=Count('id'),
-        severidade_media=Avg('nivel_severidade')
-    ).order_by('mes')
+    tendencias_mensais = cubo.por_mes(celulas)
     
     # Padrões por hora do dia
-    padroes_horarios = RelatorioAlagamento.objects.filter(
-        timestamp__gte=ultimos_90_dias
-    ).annotate(
-        hora=ExtractHour('timestamp')
-    ).values('hora').annotate(
-        total=Count('id')
-    ).order_by('hora')
+    padroes_horarios = cubo.por_hora(celulas)
     
     # Top usuários contribuidores
-    top_usuarios = UsuarioApp.objects.annotate(
-        relatos_periodo=Count(
-            'relatos',
-            filter=Q(relatos__timestamp__gte=ultimos_90_dias)
-        )
-    ).filter(relatos_periodo__gt=0).order_by('-relatos_periodo')[:10]
-    
-    # Correlação severidade vs confirmações
-    correlacao_dados = list(RelatorioAlagamento.objects.filter(
-        timestamp__gte=ultimos_90_dias
-    ).values('nivel_severidade', 'total_confirmacoes'))
+    top_usuarios = cubo.top_contribuidores(desde, ate, bairro_ids)
+    
+    # Correlação severidade vs confirmações (estatísticas suficientes, no servidor)
+    por_severidade = cubo.por_severidade(celulas)
     
     context = {
         'tendencias_mensais': tendencias_mensais,
         'padroes_horarios': padroes_horarios,
         'top_usuarios': top_usuarios,
-        'correlacao_dados': json.dumps(correlacao_dados),
-        'periodo_analise': 90,
+        'correlacao_severidade': json.dumps([
+            {'severidade': linha['severidade'], 'n': linha['n'],
+             'media_confirmacoes': round(linha['media_confirmacoes'], 2)}
+            for linha in por_severidade
+        ]),
+        'correlacao': cubo.correlacao(por_severidade),
+        'total_relatos': sum(linha['n'] for linha in por_severidade),
+        'periodo_analise': ((ate or hoje) - desde).days,
+        'opcoes_filtros': {'bairros': catalogo.todos()},
+        'filtros_aplicados': {
+            'periodo': periodo,
+            'desde': desde,
+            'ate': ate or hoje,
+            'bairro': bairro_filtro,
+        },
     }
     
     return render(request, 'dashboard/analytics.html', context)
@@ -410,20 +824,21 @@ from .ml_predictor import predict_flood_severity
 def teste_ml(request):
     """View para testar o modelo de ML"""
     resultado = None
-    bairros = Bairro.objects.all().order_by('nome')
+    bairros = catalogo.todos()
     
     if request.method == 'POST':
         try:
             lat = float(request.POST.get('latitude'))
             lon = float(request.POST.get('longitude'))
-            bairro_nome = request.POST.get('bairro')
+            bairro_ids = catalogo.resolver(request.POST.get('bairro', ''))
+            bairro_nome = catalogo.nome(bairro_ids[0]) if bairro_ids else request.POST.get('bairro')
             
             # Busca confirmações do banco (último relato do bairro)
             confirmacoes = 1
-            if bairro_nome and bairro_nome != 'Outro':
+            if bairro_ids:
                 ultimo_relato = RelatorioAlagamento.objects.filter(
-                    bairro__nome=bairro_nome
-                ).order_by('-timestamp').first()
+                    bairro_id__in=bairro_ids
+                ).select_related(None).order_by('-timestamp').first()
                 
                 if ultimo_relato:
                     confirmacoes = ultimo_relato.total_confirmacoes
@@ -0,0 +1,132 @@
+"""
+Contador de Visualizações (write-behind)
+========================================
+
+``relatorio_detalhado`` não grava mais uma linha por acesso: os incrementos
+são acumulados em memória por relatório e descarregados a cada
+``VISUALIZACOES_INTERVALO_S`` segundos por uma thread em segundo plano, em
+um único ``UPDATE ... SET visualizacoes = visualizacoes + CASE id WHEN ...``
+(em blocos de ``TAMANHO_LOTE`` relatórios). Um relatório viral gera uma
+escrita por intervalo, não uma por acesso.
+
+Na saída do processo (``atexit``) a thread é sinalizada e faz ela mesma a
+última descarga; ``encerrar`` espera por ela (até ``timeout``), então um
+lote já retirado por uma descarga em andamento também chega ao banco. Se a
+escrita falhar, os incrementos voltam para a fila e entram no próximo ciclo;
+qualquer outro erro é registrado no log e a thread segue no próximo ciclo.
+"""
+
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import RelatorioAlagamento
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE = 500
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+class ContadorVisualizacoes:
+    """Acumulador de visualizações por relatório com descarga periódica em lote"""
+
+    def __init__(self, intervalo=5.0):
+        self.intervalo = intervalo
+        self._pendentes = Counter()
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def registrar(self, relatorio_id, n=1):
+        """Acumula ``n`` visualizações; retorna o total ainda não gravado do relatório"""
+        with self._lock:
+            self._pendentes[relatorio_id] += n
+            pendentes = self._pendentes[relatorio_id]
+        if self._thread is None:
+            self._iniciar()
+        return pendentes
+
+    def descarregar(self):
+        """Grava os incrementos acumulados; retorna quantos relatórios foram atualizados"""
+        with self._lock:
+            lote, self._pendentes = self._pendentes, Counter()
+        if not lote:
+            return 0
+
+        itens = list(lote.items())
+        try:
+            with transaction.atomic():
+                for inicio in range(0, len(itens), TAMANHO_LOTE):
+                    bloco = itens[inicio:inicio + TAMANHO_LOTE]
+                    incremento = Case(
+                        *[When(pk=pk, then=Value(n)) for pk, n in bloco],
+                        default=Value(0),
+                        output_field=IntegerField(),
+                    )
+                    RelatorioAlagamento.objects.filter(pk__in=[pk for pk, _ in bloco]).update(
+                        visualizacoes=F('visualizacoes') + incremento
+                    )
+        except DatabaseError:
+            logger.exception("Falha ao gravar visualizações; %d relatórios voltam para a fila", len(lote))
+            with self._lock:
+                self._pendentes.update(lote)
+            return 0
+        return len(lote)
+
+    def _iniciar(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._executar, name='contador-visualizacoes', daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.encerrar)
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            self._ciclo()
+        # Sinal de parada: descarga final, na mesma thread das periódicas
+        self._ciclo()
+        close_old_connections()
+
+    def _ciclo(self):
+        # Um erro inesperado não pode matar a thread: sem ela nada mais é gravado
+        try:
+            close_old_connections()
+            self.descarregar()
+        except Exception:
+            logger.exception("Erro inesperado na descarga de visualizações")
+
+    def encerrar(self, timeout=10):
+        """Sinaliza a thread e espera a descarga final do saldo pendente"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._parar.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("Descarga final de visualizações não terminou em %ss", timeout)
+
+
+contador = ContadorVisualizacoes(_config('VISUALIZACOES_INTERVALO_S', 5.0))
+
+
+def registrar(relatorio_id):
+    """
+    Conta uma visualização (imediata se o write-behind estiver desligado).
+
+    Retorna quanto somar ao valor lido do banco para exibir o total atual.
+    """
+    if _config('VISUALIZACOES_WRITE_BEHIND', True):
+        return contador.registrar(relatorio_id)
+    RelatorioAlagamento.objects.filter(pk=relatorio_id).update(visualizacoes=F('visualizacoes') + 1)
+    return 1